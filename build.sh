@@ -7,6 +7,21 @@ pip install -r requirements-prod.txt
 python manage.py collectstatic --no-input
 python manage.py migrate
 
+# Coordinates for rows saved before geocoding existed (only those still missing)
+python manage.py geocode_locations
+
 # Load initial sample data and photos automatically
 echo "Loading initial data..."
 python load_initial_data.py
+
+# Resize uploaded photos into card/detail/full JPEG and WebP renditions
+python manage.py build_image_variants
+
+# Drop uploaded files nothing references any more
+python manage.py collect_media
+
+# Build the shared columnar search snapshot (skipped unless SEARCH_COLUMNAR_INDEX is set)
+python manage.py build_search_columns
+
+# Precompute breeding partner suggestions (incremental after the first run)
+python manage.py compute_recommendations
@@ -27,26 +27,31 @@ try:
     print(f"Current state: {pet_count} pets, {user_count} sample users")
 
     if pet_count == 0 or user_count == 0:
-        print("\n[2/3] Loading sample data (users, pets, vaccinations)...")
+        print("\n[2/3] Loading sample data (users, pets, vaccinations, photos) from the bundled snapshot...")
 
         # Import management command
         from django.core.management import call_command
 
         try:
-            call_command('populate_sample_data')
+            call_command('bootstrap_sample_data')
             print("✅ Sample data loaded successfully!")
         except Exception as e:
-            print(f"⚠️ Error loading sample data: {e}")
-            print("Continuing anyway...")
+            print(f"⚠️ Error loading the snapshot: {e}")
+            print("Falling back to generating sample data and downloading photos...")
 
-        # Download photos - with error handling
-        print("\n[3/3] Downloading pet photos from internet...")
-        try:
-            call_command('ensure_all_photos')
-            print("✅ Pet photos downloaded successfully!")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not download all photos: {e}")
-            print("Photos will use placeholders or can be uploaded later via admin panel")
+            try:
+                call_command('populate_sample_data')
+            except Exception as e:
+                print(f"⚠️ Error loading sample data: {e}")
+                print("Continuing anyway...")
+
+            print("\n[3/3] Downloading pet photos from internet...")
+            try:
+                call_command('ensure_all_photos')
+                print("✅ Pet photos downloaded successfully!")
+            except Exception as e:
+                print(f"⚠️ Warning: Could not download all photos: {e}")
+                print("Photos will use placeholders or can be uploaded later via admin panel")
 
         # Verify final state
         final_pets = Pet.objects.count()
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pawnder_project.settings')
 
 application = get_asgi_application()
+
+# Fails at startup, not on the first event, if the configured broker can't
+# serve this many workers (see pets.events)
+from pets.events import get_broker  # noqa: E402
+
+get_broker()
@@ -1,17 +1,36 @@
 from django.contrib import admin
-from .models import OwnerProfile, Pet, Vaccination, Match, Favorite
+from .models import OwnerProfile, Breed, BreedAlias, Pet, Vaccination, Match, Favorite
 
 
 @admin.register(OwnerProfile)
 class OwnerProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone', 'city', 'state', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('city', 'state', 'created_at')
     search_fields = ('user__username', 'user__email', 'phone', 'city')
 
 
+class BreedAliasInline(admin.TabularInline):
+    model = BreedAlias
+    extra = 1
+
+
+@admin.register(Breed)
+class BreedAdmin(admin.ModelAdmin):
+    list_display = ('name', 'species', 'slug')
+    list_filter = ('species',)
+    search_fields = ('name', 'aliases__alias')
+    prepopulated_fields = {'slug': ('name',)}
+    inlines = [BreedAliasInline]
+
+
 @admin.register(Pet)
 class PetAdmin(admin.ModelAdmin):
     list_display = ('name', 'breed', 'gender', 'species', 'owner', 'age_in_years', 'is_vaccinated', 'is_available_for_mating', 'created_at')
+    # Only the owner is shown; age_in_years is computed from date_of_birth
+    list_select_related = ('owner',)
+    # Skip the second COUNT(*) over the whole table when filtering
+    show_full_result_count = False
     list_filter = ('species', 'gender', 'breed', 'is_vaccinated', 'is_available_for_mating', 'created_at')
     search_fields = ('name', 'breed', 'owner__username', 'location')
     readonly_fields = ('created_at', 'updated_at')
@@ -40,6 +59,7 @@ class PetAdmin(admin.ModelAdmin):
 @admin.register(Vaccination)
 class VaccinationAdmin(admin.ModelAdmin):
     list_display = ('pet', 'vaccine_type', 'date_administered', 'next_due_date', 'veterinarian_name')
+    list_select_related = ('pet',)
     list_filter = ('vaccine_type', 'date_administered')
     search_fields = ('pet__name', 'veterinarian_name', 'clinic_name')
     readonly_fields = ('created_at',)
@@ -48,6 +68,8 @@ class VaccinationAdmin(admin.ModelAdmin):
 @admin.register(Match)
 class MatchAdmin(admin.ModelAdmin):
     list_display = ('from_pet', 'to_pet', 'status', 'created_at')
+    list_select_related = ('from_pet', 'to_pet')
+    show_full_result_count = False
     list_filter = ('status', 'created_at')
     search_fields = ('from_pet__name', 'to_pet__name')
     readonly_fields = ('created_at', 'updated_at')
@@ -56,6 +78,7 @@ class MatchAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'pet', 'created_at')
+    list_select_related = ('user', 'pet')
     list_filter = ('created_at',)
     search_fields = ('user__username', 'pet__name')
     readonly_fields = ('created_at',)
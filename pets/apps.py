@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pets'
+
+    def ready(self):
+        from . import middleware, signals, timing  # noqa: F401
+        # Before any connection opens, so every thread's connection is covered
+        timing.instrument()
+        middleware.instrument()
@@ -0,0 +1,104 @@
+"""
+Canonical breed lookup with typo tolerance.
+
+All breed names and aliases are loaded once into an in-memory trigram index.
+Exact normalized matches ("Shih-Tzu" -> "shihtzu") are a dict hit; anything
+else is scored by trigram overlap against the few aliases that share at
+least one trigram, which keeps a lookup well under a millisecond.
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+
+
+# Minimum trigram similarity for a fuzzy match
+MIN_SIMILARITY = 0.5
+
+# Seconds before a worker reloads breeds edited in another process
+RELOAD_INTERVAL = 300
+
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9]', '', (text or '').lower())
+
+
+def trigrams(normalized):
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BreedIndex:
+    """Trigram index over normalized breed names and aliases"""
+
+    def __init__(self, entries):
+        # entries: iterable of (alias, breed_id, species)
+        self.exact = {}
+        self.grams = {}
+        self.postings = defaultdict(set)
+        self.species = {}
+        for alias, breed_id, species in entries:
+            self.exact[alias] = breed_id
+            self.species[breed_id] = species
+            grams = trigrams(alias)
+            self.grams[alias] = grams
+            for gram in grams:
+                self.postings[gram].add(alias)
+
+    def lookup(self, text, species=None):
+        """Return the best matching breed id, or None"""
+        key = normalize(text)
+        if not key:
+            return None
+        breed_id = self.exact.get(key)
+        if breed_id is not None and (species is None or self.species[breed_id] == species):
+            return breed_id
+
+        query = trigrams(key)
+        overlap = defaultdict(int)
+        for gram in query:
+            for alias in self.postings.get(gram, ()):
+                overlap[alias] += 1
+
+        best, best_score = None, MIN_SIMILARITY
+        containing = set()
+        for alias, shared in overlap.items():
+            candidate = self.exact[alias]
+            if species is not None and self.species[candidate] != species:
+                continue
+            if key in alias:
+                containing.add(candidate)
+            score = shared / (len(query) + len(self.grams[alias]) - shared)
+            if score >= best_score:
+                best, best_score = candidate, score
+
+        # A fragment shared by several breeds ("retriever") is not a typo
+        if len(containing) > 1:
+            return None
+        return best
+
+
+_index = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def get_breed_index():
+    global _index, _loaded_at
+    if _index is None or time.monotonic() - _loaded_at > RELOAD_INTERVAL:
+        with _lock:
+            if _index is None or time.monotonic() - _loaded_at > RELOAD_INTERVAL:
+                from .models import BreedAlias
+                _index = BreedIndex(BreedAlias.objects.values_list('alias', 'breed_id', 'breed__species'))
+                _loaded_at = time.monotonic()
+    return _index
+
+
+def reset_breed_index():
+    global _index
+    _index = None
+
+
+def resolve_breed(text, species=None):
+    """Map free text onto a canonical Breed id (or None if nothing is close)"""
+    return get_breed_index().lookup(text, species)
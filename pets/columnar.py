@@ -0,0 +1,263 @@
+"""
+Shared-memory columnar snapshot of the filterable Pet attributes.
+
+The few bytes per pet that ``search_pets`` filters on (species, gender, birth
+date, flags, created_at) live in one memory-mapped file. Every gunicorn
+worker maps the same file, so the page cache holds a single copy, and a
+search becomes a handful of vectorized NumPy comparisons. The database is
+only asked to hydrate the page of ids that is actually rendered.
+
+File layout (little endian)::
+
+    header   magic, version, capacity, count, generation
+    ids      int64[capacity]   sorted ascending, append-only
+    created  int64[capacity]   created_at in microseconds since the epoch
+    dob      int32[capacity]   date_of_birth as a proleptic ordinal
+    species  uint8[capacity]   1-based index into Pet.SPECIES_CHOICES
+    gender   uint8[capacity]   1-based index into Pet.GENDER_CHOICES
+    flags    uint8[capacity]   VACCINATED | AVAILABLE | ACTIVE
+
+Writers serialize on an ``flock`` of a sidecar lock file. Deletes only clear
+the flags (tombstones) and full rebuilds are swapped in with ``os.replace``,
+which readers detect by the file's inode changing.
+"""
+import fcntl
+import os
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Pet
+from .pagination import KeysetPage
+
+
+MAGIC = b'PWCI'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQQ')
+HEADER_SIZE = 64
+
+VACCINATED = 1
+AVAILABLE = 2
+ACTIVE = 4
+
+COLUMNS = (
+    ('ids', np.int64),
+    ('created', np.int64),
+    ('dob', np.int32),
+    ('species', np.uint8),
+    ('gender', np.uint8),
+    ('flags', np.uint8),
+)
+
+# Filters the snapshot can answer; anything else goes to the database
+SUPPORTED_FILTERS = {'species', 'gender', 'is_vaccinated', 'min_age', 'max_age', 'is_available_for_mating'}
+
+SPECIES_CODES = {value: i + 1 for i, (value, _) in enumerate(Pet.SPECIES_CHOICES)}
+GENDER_CODES = {value: i + 1 for i, (value, _) in enumerate(Pet.GENDER_CHOICES)}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ROW_FIELDS = ('id', 'created_at', 'date_of_birth', 'species', 'gender',
+              'is_vaccinated', 'is_available_for_mating', 'is_active')
+
+
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_row(pk, created_at, date_of_birth, species, gender, is_vaccinated, is_available, is_active):
+    flags = (VACCINATED if is_vaccinated else 0) | (AVAILABLE if is_available else 0) | (ACTIVE if is_active else 0)
+    return (pk, to_micros(created_at), date_of_birth.toordinal(),
+            SPECIES_CODES.get(species, 0), GENDER_CODES.get(gender, 0), flags)
+
+
+def _layout(capacity):
+    offsets, offset = {}, HEADER_SIZE
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset += np.dtype(dtype).itemsize * capacity
+    return offsets, offset
+
+
+class ColumnarIndex:
+    """Reader/writer for one snapshot file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._map = None
+        self._inode = None
+
+    # -- writing ---------------------------------------------------------
+
+    def _lock(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handle = open(self.lock_path, 'a+b')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def build(self, queryset=None, batch_size=50000):
+        """Write a fresh snapshot from the database and swap it in atomically"""
+        queryset = Pet.objects.all() if queryset is None else queryset
+        with self._lock():
+            # Read under the lock so no concurrent delta is lost by the swap
+            rows = [
+                encode_row(*row)
+                for row in queryset.order_by('id').values_list(*ROW_FIELDS).iterator(chunk_size=batch_size)
+            ]
+            capacity = max(1024, int(len(rows) * 1.25))
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            self._write_file(tmp, rows, capacity)
+            os.replace(tmp, self.path)
+        self._map = None
+        return len(rows)
+
+    def _write_file(self, path, rows, capacity):
+        offsets, size = _layout(capacity)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        data = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size,))
+        data[:HEADER_SIZE] = np.frombuffer(
+            HEADER.pack(MAGIC, VERSION, capacity, len(rows), 0).ljust(HEADER_SIZE, b'\0'), dtype=np.uint8,
+        )
+        if rows:
+            columns = list(zip(*rows))
+            for (name, dtype), values in zip(COLUMNS, columns):
+                column = np.ndarray((capacity,), dtype=dtype, buffer=data, offset=offsets[name])
+                column[:len(rows)] = np.asarray(values, dtype=dtype)
+        data.flush()
+        del data
+
+    def upsert(self, pet):
+        """Apply a single-row delta; falls back to a rebuild if the file is full"""
+        if not self.path.exists():
+            return
+        row = encode_row(pet.pk, pet.created_at, pet.date_of_birth, pet.species, pet.gender,
+                         pet.is_vaccinated, pet.is_available_for_mating, pet.is_active)
+        with self._lock():
+            columns, (capacity, count, generation) = self._open_writable()
+            ids = columns['ids'][:count]
+            position = int(np.searchsorted(ids, pet.pk))
+            if position < count and ids[position] == pet.pk:
+                self._set_row(columns, position, row)
+                self._write_header(capacity, count, generation + 1)
+                return
+            if position == count and count < capacity:
+                self._set_row(columns, position, row)
+                self._write_header(capacity, count + 1, generation + 1)
+                return
+        # Out-of-order id or no spare capacity left
+        self.build()
+
+    def remove(self, pk):
+        """Tombstone a deleted pet by clearing its flags"""
+        if not self.path.exists():
+            return
+        with self._lock():
+            columns, (capacity, count, generation) = self._open_writable()
+            position = int(np.searchsorted(columns['ids'][:count], pk))
+            if position < count and columns['ids'][position] == pk:
+                columns['flags'][position] = 0
+                self._write_header(capacity, count, generation + 1)
+
+    def _open_writable(self):
+        with open(self.path, 'rb') as f:
+            magic, version, capacity, count, generation = HEADER.unpack(f.read(HEADER.size))
+        offsets, size = _layout(capacity)
+        data = np.memmap(self.path, dtype=np.uint8, mode='r+', shape=(size,))
+        columns = {
+            name: np.ndarray((capacity,), dtype=dtype, buffer=data, offset=offsets[name])
+            for name, dtype in COLUMNS
+        }
+        return columns, (capacity, count, generation)
+
+    def _set_row(self, columns, position, row):
+        for (name, _), value in zip(COLUMNS, row):
+            columns[name][position] = value
+
+    def _write_header(self, capacity, count, generation):
+        # Rows are written first; bumping count last publishes them to readers
+        with open(self.path, 'r+b') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, capacity, count, generation))
+
+    # -- reading ---------------------------------------------------------
+
+    def _columns(self):
+        """Map the file (re-mapping after a rebuild) and return live column views"""
+        inode = os.stat(self.path).st_ino
+        if self._map is None or inode != self._inode:
+            data = np.memmap(self.path, dtype=np.uint8, mode='r')
+            magic, version, capacity, _, _ = HEADER.unpack(bytes(data[:HEADER.size]))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{self.path} is not a columnar search index')
+            offsets, _ = _layout(capacity)
+            self._map = (data, {
+                name: np.ndarray((capacity,), dtype=dtype, buffer=data, offset=offsets[name])
+                for name, dtype in COLUMNS
+            })
+            self._inode = inode
+        data, columns = self._map
+        count = HEADER.unpack(bytes(data[:HEADER.size]))[3]
+        return {name: column[:count] for name, column in columns.items()}
+
+    @staticmethod
+    def supports(cleaned_data):
+        return all(not value or name in SUPPORTED_FILTERS for name, value in cleaned_data.items())
+
+    def search(self, cleaned_data, after=None, limit=24):
+        """Return up to ``limit`` matching ids in (-created_at, -id) order"""
+        c = self._columns()
+        wanted = ACTIVE | AVAILABLE
+        mask = (c['flags'] & wanted) == wanted
+
+        if cleaned_data.get('species'):
+            mask &= c['species'] == SPECIES_CODES.get(cleaned_data['species'], 0)
+        if cleaned_data.get('gender'):
+            mask &= c['gender'] == GENDER_CODES.get(cleaned_data['gender'], 0)
+        if cleaned_data.get('is_vaccinated'):
+            mask &= (c['flags'] & VACCINATED) != 0
+
+        today = timezone.now().date()
+        if cleaned_data.get('min_age') is not None:
+            mask &= c['dob'] <= (today - timedelta(days=cleaned_data['min_age'] * 365)).toordinal()
+        if cleaned_data.get('max_age') is not None:
+            mask &= c['dob'] >= (today - timedelta(days=cleaned_data['max_age'] * 365)).toordinal()
+
+        if after is not None:
+            created, pk = to_micros(after[0]), after[1]
+            mask &= (c['created'] < created) | ((c['created'] == created) & (c['ids'] < pk))
+
+        matches = np.flatnonzero(mask)
+        if len(matches) > limit:
+            # Only sort the newest rows instead of every match
+            created = c['created'][matches]
+            threshold = np.partition(created, len(created) - limit)[len(created) - limit]
+            matches = matches[created >= threshold]
+        order = np.lexsort((-c['ids'][matches], -c['created'][matches]))
+        return c['ids'][matches[order][:limit]].tolist()
+
+    def page(self, paginator, cleaned_data, cursor=None):
+        """Serve a KeysetPage compatible with ``paginator``'s cursor tokens"""
+        after = paginator.decode_cursor(cursor) if cursor else None
+        ids = self.search(cleaned_data, after, paginator.page_size + 1)
+        pets = Pet.objects.in_bulk(ids[:paginator.page_size])
+        items = [pets[pk] for pk in ids[:paginator.page_size] if pk in pets]
+        next_cursor = paginator.encode_cursor(items[-1]) if len(ids) > paginator.page_size and items else None
+        return KeysetPage(items, next_cursor)
+
+
+_index = None
+
+
+def get_columnar_index():
+    """Return the process-wide index, or None when disabled or not built yet"""
+    global _index
+    path = getattr(settings, 'SEARCH_COLUMNAR_INDEX', None)
+    if not path:
+        return None
+    if _index is None or _index.path != Path(path):
+        _index = ColumnarIndex(path)
+    return _index
@@ -0,0 +1,45 @@
+"""
+Run independent ORM lookups of an async view at the same time.
+
+Django's async ORM (``aget``, ``aexists``...) hands every query to the one
+thread-sensitive worker, so awaiting several of them with ``gather`` still
+runs them back to back. ``in_thread`` instead sends each call to a small
+dedicated pool. Every pool thread keeps its own database connection, so
+the queries really overlap, and the pool size caps the extra connections
+per process.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+DEFAULT_THREADS = 6
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASYNC_QUERY_THREADS', DEFAULT_THREADS) or 1,
+            thread_name_prefix='pets-query',
+        )
+    return _executor
+
+
+def _fresh(fn, args, kwargs):
+    # Pool threads never see request_started/finished, so recycle expired or
+    # broken connections (CONN_MAX_AGE, CONN_HEALTH_CHECKS) here instead
+    close_old_connections()
+    return fn(*args, **kwargs)
+
+
+async def in_thread(fn, *args, **kwargs):
+    """Await ``fn(*args, **kwargs)`` run on the query pool"""
+    if not getattr(settings, 'ASYNC_QUERY_THREADS', DEFAULT_THREADS):
+        # Disabled: share the request's connection (and its transaction)
+        return await sync_to_async(fn)(*args, **kwargs)
+    return await sync_to_async(_fresh, thread_sensitive=False, executor=_get_executor())(fn, args, kwargs)
@@ -0,0 +1,110 @@
+"""
+Conditional GET for the pet pages and listings.
+
+``@conditional_page(validator)`` answers GET and HEAD with 304 Not Modified
+when the client's copy is still current, before the view looks anything up
+or renders a template. The validator computes, from a cheap query or two,
+what the page shows that can change, and when it last changed. The
+decorator adds the state every page shows: the date (pet ages), the
+signed-in user with their match badge counts, and a hash of the templates,
+so a deploy that changes the markup changes every ETag.
+
+Only the ETag is per-user. Signed-in users get no Last-Modified, because
+their own state (favorites, match requests) can change without a newer
+timestamp. Pages with flash messages waiting are always rendered, since a
+304 would never show them.
+"""
+import hashlib
+from datetime import datetime, time
+from functools import lru_cache, wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.messages import get_messages
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .concurrency import in_thread
+from .counters import get_match_counts
+
+
+@lru_cache(maxsize=1)
+def templates_version():
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted((Path(__file__).resolve().parent / 'templates').rglob('*.html')):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def latest(*times):
+    """The most recent of ``times``, ignoring ``None``s"""
+    return max((value for value in times if value is not None), default=None)
+
+
+def page_validators(validator, request, args, kwargs):
+    """``(etag, last_modified)`` for the page, or ``None`` to render it unconditionally"""
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None
+    result = validator(request, *args, **kwargs)
+    if result is None:
+        return None
+    parts, last_modified = result
+
+    today = timezone.now().date()
+    user = request.user
+    if user.is_authenticated:
+        parts = (parts, user.pk, user.get_username(), get_match_counts(user))
+        last_modified = None
+    elif last_modified is not None:
+        # Ages shown on the page roll over at midnight
+        last_modified = max(last_modified, timezone.make_aware(datetime.combine(today, time.min)))
+
+    digest = hashlib.blake2b(repr((templates_version(), today, parts)).encode(), digest_size=16)
+    return quote_etag(digest.hexdigest()), last_modified and int(last_modified.timestamp())
+
+
+def finish(request, response, validators):
+    if validators is None:
+        return response
+    etag, last_modified = validators
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response.headers.setdefault('ETag', etag)
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        # Revalidate every time instead of heuristically caching on Last-Modified
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(validator):
+    """
+    Serve the decorated view conditionally. ``validator(request, *args,
+    **kwargs)`` returns ``(parts, last_modified)``: a value that changes
+    whenever the page content does, and the newest timestamp behind it
+    (or ``None``). Returning ``None`` renders the page unconditionally.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                # Resolve the user once, for the validator thread and the view's auser() alike
+                request.user = await request.auser()
+                validators = await in_thread(page_validators, validator, request, args, kwargs)
+                response = validators and get_conditional_response(request, *validators)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(request, response, validators)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                validators = page_validators(validator, request, args, kwargs)
+                response = validators and get_conditional_response(request, *validators)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(request, response, validators)
+        return inner
+    return decorator
@@ -0,0 +1,12 @@
+from django.utils.functional import SimpleLazyObject
+
+from .counters import get_match_counts
+
+
+def match_counts(request):
+    """Per-status match counts for the nav badge, only looked up when rendered"""
+    return {
+        'match_counts': SimpleLazyObject(
+            lambda: get_match_counts(request.user) if request.user.is_authenticated else {}
+        ),
+    }
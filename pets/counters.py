@@ -0,0 +1,105 @@
+"""
+Per-user match counts for the inbox tabs and the nav badge.
+
+``MatchCounter`` keeps one row per (user, direction, status) that the Match
+signals adjust with ``F()`` updates, so counting never scans ``pets_match``.
+Reads go through the cache and are invalidated when a counter moves, which
+makes the badge free on most page views.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Match, MatchCounter, Pet
+
+
+CACHE_TIMEOUT = 3600
+
+DIRECTIONS = {'RECEIVED': 'to_pet__owner', 'SENT': 'from_pet__owner'}
+
+
+def _cache_key(user_id):
+    return f'match_counts:{user_id}'
+
+
+def adjust(user_id, direction, status, delta, using=None):
+    """Atomically add ``delta`` to one counter, creating it on first use"""
+    counters = MatchCounter.objects.using(using)
+    lookup = {'user_id': user_id, 'direction': direction, 'status': status}
+    # Decrements never create rows: a missing row means the user is being deleted
+    if not counters.filter(**lookup).update(count=F('count') + delta) and delta > 0:
+        try:
+            with transaction.atomic(using=using):
+                counters.create(count=delta, **lookup)
+        except IntegrityError:
+            # Another request created the row first
+            counters.filter(**lookup).update(count=F('count') + delta)
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)), using=using)
+
+
+def owners(*pet_ids, using=None):
+    return dict(Pet.objects.using(using).filter(pk__in=pet_ids).values_list('pk', 'owner_id'))
+
+
+def track(match, old_status, new_status, using=None):
+    """Move ``match`` between counters; a None status means created or deleted"""
+    if old_status == new_status:
+        return
+    owner = owners(match.from_pet_id, match.to_pet_id, using=using)
+    for direction, pet_id in (('RECEIVED', match.to_pet_id), ('SENT', match.from_pet_id)):
+        if pet_id not in owner:
+            continue
+        if old_status is not None:
+            adjust(owner[pet_id], direction, old_status, -1, using)
+        if new_status is not None:
+            adjust(owner[pet_id], direction, new_status, 1, using)
+
+
+def track_many(owner_pairs, old_status, new_status, using=None):
+    """
+    Counter side of a bulk ``update()`` that moved matches from ``old_status``
+    to ``new_status``; ``owner_pairs`` holds (sender id, receiver id) per match.
+    """
+    moved = Counter()
+    for sender_id, receiver_id in owner_pairs:
+        moved[sender_id, 'SENT'] += 1
+        moved[receiver_id, 'RECEIVED'] += 1
+    for (user_id, direction), n in moved.items():
+        adjust(user_id, direction, old_status, -n, using)
+        adjust(user_id, direction, new_status, n, using)
+
+
+def get_match_counts(user):
+    """``{'RECEIVED': {status: n}, 'SENT': {status: n}}`` with every status present"""
+    key = _cache_key(user.pk)
+    counts = cache.get(key)
+    if counts is None:
+        counts = {direction: {status: 0 for status, _ in Match.STATUS_CHOICES} for direction in DIRECTIONS}
+        for direction, status, count in MatchCounter.objects.filter(user=user).values_list(
+                'direction', 'status', 'count'):
+            counts[direction][status] = count
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
+
+
+def recount(users=None):
+    """Rebuild counters from ``pets_match`` (after raw SQL or bulk updates)"""
+    counters = MatchCounter.objects.all()
+    matches = Match.objects.order_by()
+    if users is not None:
+        counters = counters.filter(user__in=users)
+    with transaction.atomic():
+        stale = set(counters.values_list('user_id', flat=True))
+        counters.delete()
+        rows = []
+        for direction, owner in DIRECTIONS.items():
+            grouped = matches.filter(**{f'{owner}__in': users}) if users is not None else matches
+            rows += [
+                MatchCounter(user_id=user_id, direction=direction, status=status, count=n)
+                for user_id, status, n in grouped.values_list(owner, 'status').annotate(n=Count('id'))
+            ]
+        MatchCounter.objects.bulk_create(rows)
+    cache.delete_many([_cache_key(user_id) for user_id in stale | {row.user_id for row in rows}])
+    return len(rows)
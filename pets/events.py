@@ -0,0 +1,220 @@
+"""
+Per-user notifications pushed to browsers over server-sent events.
+
+Signal handlers call ``publish()`` after the transaction commits; the async
+``event_stream`` view holds one idle coroutine and one small queue per
+open tab, so a worker can keep thousands of connections open without a
+thread each.
+
+The broker is pluggable through ``settings.EVENTS_BROKER``. The default
+``InProcessBroker`` only fans out to connections held by the same process:
+an event published by one worker never reaches a stream held by another.
+It refuses to start when ``WEB_CONCURRENCY`` asks for more than one
+worker, and the ASGI entry point creates the broker at startup so that
+misconfiguration stops the server instead of dropping events.
+``PostgresBroker`` relays every event through PostgreSQL LISTEN/NOTIFY, so
+each worker delivers it to the streams it holds.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.module_loading import import_string
+
+from .counters import owners
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = 'pets.events.InProcessBroker'
+
+# Events a slow client may fall behind by before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+class InProcessBroker:
+    """Fan events out to the asyncio queues of this process' subscribers"""
+
+    # Whether an event published in one process reaches streams in the others
+    cross_process = False
+
+    def __init__(self):
+        workers = int(os.environ.get('WEB_CONCURRENCY') or 1)
+        if workers > 1 and not self.cross_process:
+            raise ImproperlyConfigured(
+                f'{type(self).__name__} only delivers events within one process but WEB_CONCURRENCY '
+                f'is {workers}; run a single worker or set EVENTS_BROKER to pets.events.PostgresBroker'
+            )
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, event):
+        """Queue ``event`` for every open stream of ``user_id``; safe from any thread"""
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        """Hand ``event`` to this process' streams of ``user_id``"""
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """Register a queue for the running event loop while the block runs"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Relay events between worker processes with PostgreSQL LISTEN/NOTIFY.
+
+    ``publish`` sends a NOTIFY on the default connection (from the
+    ``on_commit`` callbacks that is outside any transaction, so it goes out
+    at once). The first ``subscribe`` in a process starts a daemon thread
+    that holds its own connection LISTENing on the channel and hands every
+    notification to this process' streams. Needs psycopg2.
+    """
+
+    cross_process = True
+    channel = 'pawnder_events'
+    # How often the listener wakes up without notifications, and how long it
+    # waits before reconnecting after losing the database
+    POLL_SECONDS = 5
+    RECONNECT_SECONDS = 2
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__()
+        self.using = using
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, user_id, event):
+        payload = json.dumps({'user': user_id, 'event': event}, cls=DjangoJSONEncoder)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    @contextmanager
+    def subscribe(self, user_id):
+        self._start_listener()
+        with super().subscribe(user_id) as queue:
+            yield queue
+
+    def receive(self, payload):
+        """Deliver one NOTIFY payload to this process' streams"""
+        message = json.loads(payload)
+        self.deliver(message['user'], message['event'])
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='pets-events', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        # Django connections are per thread, so this one is the listener's own
+        connection = connections[self.using]
+        while True:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                raw = connection.connection
+                while True:
+                    if select.select([raw], [], [], self.POLL_SECONDS) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.receive(raw.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Event listener lost its database connection, reconnecting')
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                time.sleep(self.RECONNECT_SECONDS)
+
+
+def _offer(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENTS_BROKER', DEFAULT_BROKER))()
+    return _broker
+
+
+def publish(user_id, event_type, **data):
+    get_broker().publish(user_id, {'type': event_type, **data})
+
+
+def format_event(event):
+    """Encode one event in the text/event-stream wire format"""
+    return f'event: {event["type"]}\ndata: {json.dumps(event, default=str)}\n\n'
+
+
+def notify_match(match, previous_status, using=None):
+    """Tell both owners about a new match request or a status change"""
+    if previous_status == match.status:
+        return
+    owner = owners(match.from_pet_id, match.to_pet_id, using=using)
+    event = {
+        'match': match.pk,
+        'from_pet': match.from_pet_id,
+        'to_pet': match.to_pet_id,
+        'status': match.status,
+        'previous': previous_status,
+    }
+    if previous_status is None:
+        recipients = [(owner.get(match.to_pet_id), 'received')]
+        event_type = 'match_created'
+    else:
+        recipients = [(owner.get(match.to_pet_id), 'received'), (owner.get(match.from_pet_id), 'sent')]
+        event_type = 'match_status'
+
+    def send():
+        for user_id, role in recipients:
+            if user_id is not None:
+                publish(user_id, event_type, role=role, **event)
+    transaction.on_commit(send, using=using)
+
+
+def notify_bulk(rows, previous_status, status, using=None):
+    """``match_status`` events for a bulk update; ``rows`` are (match id, sender id, receiver id)"""
+    def send():
+        for pk, sender_id, receiver_id in rows:
+            for user_id, role in ((receiver_id, 'received'), (sender_id, 'sent')):
+                publish(user_id, 'match_status', role=role, match=pk, status=status, previous=previous_status)
+    transaction.on_commit(send, using=using)
@@ -0,0 +1,109 @@
+"""
+Facet counts for the search sidebar.
+
+Each facet counts the pets that match every filter except its own, so
+picking "Dog" still shows how many cats the other filters would find.
+The species, gender and vaccination facets come out of one GROUP BY over
+(species, gender, is_vaccinated, breed filter match) of the results
+without the facet filters applied, rolled up in Python. Breeds get their
+own GROUP BY on the indexed ``breed_ref`` column with the ordering and
+top N limit done in SQL, so the database never returns one row per
+distinct breed. Pets not linked to a canonical breed yet are left out of
+the breed facet. Facets are cached per normalized filter key and the
+all-species result generation (see ``pets.result_cache``), so any saved
+pet refreshes the counts right away.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Count, ExpressionWrapper, Min, Value
+
+from .result_cache import generation
+from .search import breed_condition, filter_key
+
+
+DEFAULT_TOP_BREEDS = 10
+DEFAULT_TIMEOUT = 300
+
+# Filters the facets count over, left out of the queryset passed in
+FACET_FILTERS = ('species', 'gender', 'is_vaccinated', 'breed')
+
+
+def compute_facets(queryset, cleaned_data, top_breeds=DEFAULT_TOP_BREEDS):
+    """Roll up ``queryset`` (filtered by everything but ``FACET_FILTERS``)"""
+    species, gender = Counter(), Counter()
+    vaccinated = total = 0
+    breed = breed_condition(cleaned_data)
+    rows = (
+        queryset.order_by()
+        .annotate(
+            breed_match=Value(True) if breed is None else ExpressionWrapper(breed, output_field=BooleanField()),
+        )
+        .values_list('species', 'gender', 'is_vaccinated', 'breed_match')
+        .annotate(total=Count('id'))
+    )
+    for s, g, v, breed_match, count in rows:
+        match = {
+            'species': not cleaned_data.get('species') or s == cleaned_data['species'],
+            'gender': not cleaned_data.get('gender') or g == cleaned_data['gender'],
+            'is_vaccinated': not cleaned_data.get('is_vaccinated') or v,
+            'breed': bool(breed_match),
+        }
+        missing = [name for name, ok in match.items() if not ok]
+        if not missing:
+            total += count
+        if not missing or missing == ['species']:
+            species[s] += count
+        if not missing or missing == ['gender']:
+            gender[g] += count
+        if v and (not missing or missing == ['is_vaccinated']):
+            vaccinated += count
+
+    return {
+        'species': dict(species),
+        'gender': dict(gender),
+        'vaccinated': vaccinated,
+        'breeds': breed_counts(queryset, cleaned_data, top_breeds),
+        'total': total,
+    }
+
+
+def breed_counts(queryset, cleaned_data, top_breeds=DEFAULT_TOP_BREEDS):
+    """``(name, count)`` for the ``top_breeds`` most common canonical breeds"""
+    filters = {'breed_ref__isnull': False}
+    if cleaned_data.get('species'):
+        filters['species'] = cleaned_data['species']
+    if cleaned_data.get('gender'):
+        filters['gender'] = cleaned_data['gender']
+    if cleaned_data.get('is_vaccinated'):
+        filters['is_vaccinated'] = True
+    rows = (
+        queryset.filter(**filters)
+        .order_by()
+        .values('breed_ref_id')
+        .annotate(n=Count('id'), name=Min('breed_ref__name'))
+        .order_by('-n', 'name')[:top_breeds]
+    )
+    return [(row['name'], row['n']) for row in rows]
+
+
+def get_facets(queryset, cleaned_data):
+    """
+    Facet counts for the search ``cleaned_data``. ``queryset`` has every
+    filter applied except ``FACET_FILTERS``.
+    """
+    # Other species show up in the counts, so any pet change is relevant
+    key = f'facets:{generation({})}:{filter_key(cleaned_data)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(
+            queryset, cleaned_data, getattr(settings, 'SEARCH_FACET_TOP_BREEDS', DEFAULT_TOP_BREEDS),
+        )
+        cache.set(key, facets, getattr(settings, 'SEARCH_FACET_TIMEOUT', DEFAULT_TIMEOUT))
+    return facets
+
+
+def label_choices(choices, counts):
+    """Append counts to select option labels, leaving the blank 'Any' option alone"""
+    return [(value, f'{label} ({counts.get(value, 0)})' if value else label) for value, label in choices]
@@ -0,0 +1,212 @@
+"""
+Concurrent photo downloads for the seeding management commands.
+
+``PhotoFetcher`` runs jobs on a thread pool that shares one pooled
+``requests.Session``, so connections to the photo hosts are reused instead
+of re-established per image. A per-host semaphore keeps the pool from
+hammering any single API, failed requests (connection errors, timeouts,
+429 and 5xx) are retried with exponential backoff, and downloads are
+streamed through a spooled temporary file straight into storage.
+
+Jobs run off the main thread and leave the models alone (storage only
+registers new blobs): they return what to change and the command saves it.
+"""
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_CONCURRENCY = 8
+PER_HOST = 4
+RETRIES = 3
+BACKOFF = 0.5
+TIMEOUT = 15
+CHUNK_SIZE = 64 * 1024
+# Photos bigger than this go to disk while downloading instead of memory
+SPOOL_SIZE = 1024 * 1024
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+class FetchError(Exception):
+    """A URL could not be fetched, even after retrying"""
+
+
+class _Retry(Exception):
+    def __init__(self, reason, delay=None):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class PhotoFetcher:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=PER_HOST, retries=RETRIES,
+                 backoff=BACKOFF, timeout=TIMEOUT, storage=None):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.storage = storage or default_storage
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._hosts_lock = threading.Lock()
+        self._hosts = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='pets-fetch')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    @contextmanager
+    def _host_slot(self, url):
+        with self._hosts_lock:
+            semaphore = self._hosts[urlsplit(url).netloc]
+        with semaphore:
+            yield
+
+    def _with_retries(self, url, attempt):
+        for n in range(self.retries + 1):
+            try:
+                with self._host_slot(url):
+                    return attempt()
+            except (_Retry, requests.ConnectionError, requests.Timeout) as e:
+                if n == self.retries:
+                    raise FetchError(f'{url}: {e}') from e
+                delay = getattr(e, 'delay', None)
+                if delay is None:
+                    delay = self.backoff * 2 ** n * (0.5 + random.random())
+                # Sleep outside the host slot so other requests can use it
+                time.sleep(delay)
+
+    def _check(self, response):
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get('Retry-After', '')
+            raise _Retry(f'HTTP {response.status_code}',
+                         float(retry_after) if retry_after.isdigit() else None)
+        if response.status_code != 200:
+            raise FetchError(f'{response.url}: HTTP {response.status_code}')
+
+    def get_json(self, url):
+        """GET ``url`` and decode its JSON body"""
+        def attempt():
+            response = self.session.get(url, timeout=self.timeout)
+            self._check(response)
+            return response.json()
+        return self._with_retries(url, attempt)
+
+    def save(self, url, name, storage=None):
+        """Stream ``url`` into ``storage`` as ``name``; returns the stored name and size"""
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as buffer:
+            def attempt():
+                buffer.seek(0)
+                buffer.truncate()
+                with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                    self._check(response)
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        buffer.write(chunk)
+            self._with_retries(url, attempt)
+
+            size = buffer.tell()
+            buffer.seek(0)
+            return (storage or self.storage).save(name, File(buffer, name=name)), size
+
+    def map(self, fn, items):
+        """
+        Run ``fn(item)`` on the pool; yields ``(item, result, error)`` in
+        completion order, with ``error`` set instead of raising.
+        """
+        futures = {self._executor.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def photo_filename(pet, number, stem=None):
+    stem = stem or pet.name.lower().replace(' ', '_')
+    return f'{stem}_{number}.jpg'
+
+
+def download_photos(fetcher, pet, photos):
+    """
+    Job body: download ``{field: (url, filename)}`` for ``pet``. Returns
+    ``(saved, failed)``, mapping fields to ``(name, size)`` and to errors.
+    """
+    saved, failed = {}, {}
+    for field, (url, filename) in photos.items():
+        model_field = pet._meta.get_field(field)
+        try:
+            saved[field] = fetcher.save(url, model_field.generate_filename(pet, filename), model_field.storage)
+        except FetchError as e:
+            failed[field] = e
+    return saved, failed
+
+
+def apply_photos(pet, saved):
+    """Point ``pet`` at the downloaded files; replaced files lose a reference on save"""
+    for field, (name, _) in saved.items():
+        setattr(pet, field, name)
+    pet.save()
+
+
+class PhotoCommand(BaseCommand):
+    """
+    Base for management commands that download photos for a set of pets;
+    subclasses implement ``photos_for``.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                            help=f'Downloads in flight at once (at most {PER_HOST} per host)')
+
+    def photos_for(self, fetcher, pet):
+        """``{field: (url, filename)}`` to download for ``pet``; runs on the pool"""
+        raise NotImplementedError
+
+    def fetch(self, pets, concurrency):
+        """Download and attach the photos of ``pets``; returns how many pets were updated"""
+        updated = 0
+        with PhotoFetcher(concurrency=concurrency) as fetcher:
+            def job(pet):
+                return download_photos(fetcher, pet, self.photos_for(fetcher, pet))
+
+            for pet, result, error in fetcher.map(job, pets):
+                if error:
+                    self.stdout.write(self.style.ERROR(f'Error processing {pet.name}: {error}'))
+                    continue
+                saved, failed = result
+                for field, e in failed.items():
+                    self.stdout.write(self.style.WARNING(f'  {pet.name}: failed to download {field}: {e}'))
+                if saved:
+                    apply_photos(pet, saved)
+                    updated += 1
+                    size = sum(size for _, size in saved.values())
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Completed {pet.name} ({len(saved)} photos, {size} bytes)'
+                    ))
+        return updated
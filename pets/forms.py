@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Pet, Vaccination, Match, OwnerProfile
+from .uploads import BoundedFileField, BoundedImageField
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -18,6 +19,7 @@ class OwnerProfileForm(forms.ModelForm):
     class Meta:
         model = OwnerProfile
         fields = ('phone', 'address', 'city', 'state', 'zipcode', 'profile_picture')
+        field_classes = {'profile_picture': BoundedImageField}
         widgets = {
             'address': forms.Textarea(attrs={'rows': 3}),
         }
@@ -33,6 +35,7 @@ class PetRegistrationForm(forms.ModelForm):
             'is_available_for_mating', 'preferred_breed',
             'photo1', 'photo2', 'photo3', 'location'
         )
+        field_classes = {'photo1': BoundedImageField, 'photo2': BoundedImageField, 'photo3': BoundedImageField}
         widgets = {
             'date_of_birth': forms.DateInput(attrs={'type': 'date'}),
             'last_vaccination_date': forms.DateInput(attrs={'type': 'date'}),
@@ -49,6 +52,7 @@ class VaccinationForm(forms.ModelForm):
             'next_due_date', 'veterinarian_name', 'clinic_name',
             'certificate', 'notes'
         )
+        field_classes = {'certificate': BoundedFileField}
         widgets = {
             'date_administered': forms.DateInput(attrs={'type': 'date'}),
             'next_due_date': forms.DateInput(attrs={'type': 'date'}),
@@ -60,6 +64,7 @@ class PetSearchForm(forms.Form):
     GENDER_CHOICES = [('', 'Any')] + Pet.GENDER_CHOICES
     SPECIES_CHOICES = [('', 'Any')] + Pet.SPECIES_CHOICES
 
+    q = forms.CharField(max_length=200, required=False, label='Keywords')
     species = forms.ChoiceField(choices=SPECIES_CHOICES, required=False)
     breed = forms.CharField(max_length=100, required=False)
     gender = forms.ChoiceField(choices=GENDER_CHOICES, required=False)
@@ -67,6 +72,7 @@ class PetSearchForm(forms.Form):
     max_age = forms.IntegerField(min_value=0, required=False, label='Max Age (years)')
     is_vaccinated = forms.BooleanField(required=False, label='Vaccinated Only')
     location = forms.CharField(max_length=200, required=False)
+    radius_km = forms.IntegerField(min_value=1, max_value=500, required=False, label='Within (km)')
     is_available_for_mating = forms.BooleanField(required=False, initial=True, label='Available for Mating')
 
 
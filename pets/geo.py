@@ -0,0 +1,217 @@
+"""
+Offline geocoding and geohash bucketing for location-based search.
+
+Coordinates come from the bundled gazetteer in ``pets/data/gazetteer.csv``
+(exact zip codes, 3-digit zip prefixes and "city, state" pairs), so saving a
+pet never makes a network call. Every geocoded pet also stores a geohash;
+radius and nearest-N queries turn the search circle into a handful of
+geohash prefix ranges, which an ordinary B-tree index can answer without
+touching pets outside the surrounding cells.
+"""
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.db.models import F, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+
+EARTH_RADIUS_KM = 6371.0
+
+# Precision stored on each row; ~1.2km x 0.6km cells
+GEOHASH_PRECISION = 6
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Ordering used for radius results (see KeysetPaginator)
+DISTANCE_ORDERING = ('distance_km', 'id')
+
+US_STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+}
+
+
+@lru_cache(maxsize=1)
+def load_gazetteer():
+    """Read the bundled gazetteer once per process"""
+    zips, zip3, cities, city_names = {}, {}, {}, {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            point = (float(row['latitude']), float(row['longitude']))
+            if row['kind'] == 'zip':
+                zips[row['key']] = point
+            elif row['kind'] == 'zip3':
+                zip3[row['key']] = point
+            else:
+                cities[(row['key'], row['state'])] = point
+                city_names.setdefault(row['key'], point)
+    return {'zip': zips, 'zip3': zip3, 'city': cities, 'city_name': city_names}
+
+
+def _normalize_city(text):
+    text = re.sub(r'[^a-z ]', ' ', text.lower().replace('saint ', 'st '))
+    return ' '.join(text.split())
+
+
+def _normalize_state(text):
+    text = ' '.join(text.lower().split())
+    return US_STATES.get(text, text.upper())
+
+
+def geocode(location='', city='', state='', zipcode=''):
+    """Return ``(latitude, longitude)`` for free text or address parts, or None"""
+    gazetteer = load_gazetteer()
+
+    if not zipcode:
+        found = re.search(r'\b(\d{5})(?:-\d{4})?\b', location or '')
+        zipcode = found.group(1) if found else ''
+    if zipcode:
+        zipcode = zipcode.strip()[:5]
+        point = gazetteer['zip'].get(zipcode) or gazetteer['zip3'].get(zipcode[:3])
+        if point:
+            return point
+
+    if location and not city:
+        parts = [p for p in re.sub(r'\d{5}(-\d{4})?', '', location).split(',') if p.strip()]
+        if parts:
+            city = parts[0]
+            state = parts[1] if len(parts) > 1 else state
+
+    if city:
+        city = _normalize_city(city)
+        if state:
+            point = gazetteer['city'].get((city, _normalize_state(state)))
+            if point:
+                return point
+        return gazetteer['city_name'].get(city)
+    return None
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return ``(lat_degrees, lon_degrees)`` spanned by one geohash cell"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=32):
+    """Geohash prefixes whose cells together cover the search circle"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    lon_delta = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    south, north = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    west, east = longitude - lon_delta, longitude + lon_delta
+
+    # Use the finest precision that still needs only a few cells
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor(north / lat_step) - math.floor(south / lat_step) + 1
+        cols = math.floor(east / lon_step) - math.floor(west / lon_step) + 1
+        if rows * cols <= max_cells:
+            break
+
+    cells = set()
+    lat = south
+    while True:
+        lon = west
+        while True:
+            wrapped = (lon + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(min(lat, 89.999999), wrapped, precision))
+            if lon >= east:
+                break
+            lon = min(lon + lon_step, east)
+        if lat >= north:
+            break
+        lat = min(lat + lat_step, north)
+    return sorted(cells)
+
+
+def distance_expression(latitude, longitude):
+    """Database-side haversine distance in km from the given point"""
+    dlat = Radians(F('latitude') - latitude)
+    dlon = Radians(F('longitude') - longitude)
+    a = (Power(Sin(dlat / 2), 2)
+         + Cos(Radians(F('latitude'))) * math.cos(math.radians(latitude)) * Power(Sin(dlon / 2), 2))
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Restrict to pets inside the circle, annotated with ``distance_km``"""
+    buckets = Q()
+    for prefix in covering_cells(latitude, longitude, radius_km):
+        # A prefix is a contiguous key range, so this is an index range scan
+        buckets |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+    return queryset.filter(buckets).annotate(
+        distance_km=distance_expression(latitude, longitude),
+    ).filter(distance_km__lte=radius_km)
+
+
+def nearest(queryset, latitude, longitude, n=10, start_km=10, max_km=4000):
+    """Return the ``n`` closest pets, widening the search ring until enough are found"""
+    radius = start_km
+    while True:
+        found = list(within_radius(queryset, latitude, longitude, radius).order_by(*DISTANCE_ORDERING)[:n])
+        if radius >= max_km or len(found) >= n:
+            return found
+        radius *= 2
+
+
+def owner_point(pet):
+    """The owner's coordinates, from a profile already loaded or one narrow query"""
+    from .models import OwnerProfile, Pet
+
+    if not pet.owner_id:
+        return None
+    if Pet.owner.is_cached(pet) and type(pet.owner).owner_profile.is_cached(pet.owner):
+        profile = getattr(pet.owner, 'owner_profile', None)
+        point = profile and (profile.latitude, profile.longitude)
+    else:
+        point = OwnerProfile.objects.filter(user_id=pet.owner_id).values_list('latitude', 'longitude').first()
+    return point if point and point[0] is not None else None
+
+
+def locate_pet(pet):
+    """Fill in ``latitude``, ``longitude`` and ``geohash`` for a pet"""
+    point = geocode(pet.location) or owner_point(pet)
+    pet.latitude, pet.longitude = point if point else (None, None)
+    pet.geohash = encode_geohash(*point) if point else ''
+
+
+def locate_owner(profile):
+    """Fill in ``latitude`` and ``longitude`` for an owner profile"""
+    point = geocode(city=profile.city, state=profile.state, zipcode=profile.zipcode)
+    profile.latitude, profile.longitude = point if point else (None, None)
@@ -0,0 +1,171 @@
+"""
+Pre-generated renditions of uploaded photos.
+
+Every pet photo and profile picture gets a ``card``, ``detail`` and ``full``
+rendition in both JPEG and WebP, stored next to the original under a
+predictable name::
+
+    pet_photos/rex.jpg  ->  variants/pet_photos/rex/card.webp
+
+so templates can build ``srcset`` lists without touching the database.
+Renditions are auto-oriented and written without EXIF (no GPS leaks), and
+are never upscaled past the original. Their real pixel widths, which
+``srcset`` needs (a portrait or small photo is narrower than the bound), go
+into a ``widths.json`` manifest written after the renditions, so its
+presence also marks the set as complete.
+"""
+import json
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import OwnerProfile, Pet
+
+
+logger = logging.getLogger(__name__)
+
+# Bounding box (long edge, pixels) per rendition, smallest first
+VARIANTS = {
+    'card': 400,
+    'detail': 800,
+    'full': 1600,
+}
+
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+IMAGE_FIELDS = {
+    Pet: ('photo1', 'photo2', 'photo3'),
+    OwnerProfile: ('profile_picture',),
+}
+
+# How long "this image has (no) renditions yet" is remembered
+EXISTS_TIMEOUT = 300
+
+
+def variant_name(name, variant, ext):
+    root, _ = posixpath.splitext(name)
+    return f'variants/{root}/{variant}.{ext}'
+
+
+def manifest_name(name):
+    return variant_name(name, 'widths', 'json')
+
+
+def _widths_key(name):
+    return f'variants:{name}'
+
+
+def _encode(image, fmt, options):
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten transparent images onto white
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(storage, name):
+    """Write every rendition of ``name`` (read from ``storage``); returns the names written"""
+    written, widths = write_variants(storage, name)
+    remember_widths(name, widths)
+    return written
+
+
+def write_variants(storage, name):
+    """
+    Write the renditions and manifest of ``name`` without touching the
+    cache; returns the names written and the widths. Safe to call from
+    worker processes.
+    """
+    with storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    written, widths = [], {}
+    for variant, edge in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        widths[variant] = image.width
+        for ext, (fmt, options) in FORMATS.items():
+            written.append(_replace(variant_name(name, variant, ext), _encode(image, fmt, options)))
+    written.append(_replace(manifest_name(name), json.dumps(widths).encode()))
+    return written, widths
+
+
+def remember_widths(name, widths):
+    cache.set(_widths_key(name), widths, EXISTS_TIMEOUT)
+
+
+def _replace(target, content):
+    if default_storage.exists(target):
+        default_storage.delete(target)
+    return default_storage.save(target, ContentFile(content))
+
+
+def variant_widths(fieldfile):
+    """Pixel width per rendition of ``fieldfile``; empty until they are generated"""
+    key = _widths_key(fieldfile.name)
+    widths = cache.get(key)
+    if widths is None:
+        try:
+            with default_storage.open(manifest_name(fieldfile.name)) as f:
+                widths = json.load(f)
+        except (OSError, ValueError):
+            widths = {}
+        remember_widths(fieldfile.name, widths)
+    return widths
+
+
+def has_variants(fieldfile):
+    """Whether the renditions of ``fieldfile`` have been generated"""
+    return bool(variant_widths(fieldfile))
+
+
+def srcset(fieldfile, ext):
+    """
+    ``srcset`` value listing the renditions of one format by their real
+    width. Renditions of a small original can share a width, only the
+    first of them is listed (a repeated descriptor is invalid).
+    """
+    candidates = {}
+    for variant, width in variant_widths(fieldfile).items():
+        candidates.setdefault(width, variant_name(fieldfile.name, variant, ext))
+    return ', '.join(f'{default_storage.url(target)} {width}w' for width, target in candidates.items())
+
+
+def variant_url(fieldfile, variant='card', ext='jpg'):
+    return default_storage.url(variant_name(fieldfile.name, variant, ext))
+
+
+def build_variants(storage, names):
+    """Generate renditions for ``names``, logging files Pillow can't read"""
+    for name in names:
+        # Content-addressed files never change, so their renditions can't be stale
+        if getattr(storage, 'immutable', False) and default_storage.exists(manifest_name(name)):
+            continue
+        try:
+            generate_variants(storage, name)
+        except OSError:
+            logger.warning('Could not build image variants for %s', name, exc_info=True)
+
+
+def delete_variants(name):
+    for variant in VARIANTS:
+        for ext in FORMATS:
+            default_storage.delete(variant_name(name, variant, ext))
+    default_storage.delete(manifest_name(name))
+    cache.delete(_widths_key(name))
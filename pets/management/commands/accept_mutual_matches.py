@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from pets.counters import track_many
+from pets.models import Match
+
+
+class Command(BaseCommand):
+    help = 'Accepts every pair of pets that have pending match requests to each other'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the pairs')
+
+    def handle(self, *args, **options):
+        # One self-join: a pending match whose mirror image is also pending
+        mutual = Match.objects.order_by().filter(status='PENDING').filter(Exists(
+            Match.objects.filter(from_pet=OuterRef('to_pet'), to_pet=OuterRef('from_pet'), status='PENDING')
+        ))
+
+        with transaction.atomic():
+            rows = list(
+                mutual.select_for_update(of=('self',)).values_list('pk', 'from_pet__owner_id', 'to_pet__owner_id')
+            )
+            if rows and not options['dry_run']:
+                Match.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+                    status='ACCEPTED', updated_at=timezone.now(),
+                )
+                # update() skips the Match signals
+                track_many([(sender, receiver) for _, sender, receiver in rows], 'PENDING', 'ACCEPTED')
+
+        verb = 'Found' if options['dry_run'] else 'Accepted'
+        self.stdout.write(self.style.SUCCESS(f'✅ {verb} {len(rows) // 2} mutual pairs ({len(rows)} requests)'))
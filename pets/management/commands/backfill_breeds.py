@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pets import result_cache
+from pets.breeds import resolve_breed
+from pets.models import Pet
+
+
+class Command(BaseCommand):
+    help = 'Maps free-text breed and preferred_breed values onto canonical Breed rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = Pet.objects.order_by('pk').values_list('pk', 'species', 'breed', 'preferred_breed')
+
+        # A new breed_ref changes breed match scores, so the next recommendations
+        # run must rescore these pets
+        fields = ['breed_ref', 'preferred_breed_ref', 'updated_at']
+        now, batch, mapped, unmapped = timezone.now(), [], 0, set()
+        for pk, species, breed, preferred_breed in rows.iterator(chunk_size=batch_size):
+            breed_id = resolve_breed(breed, species)
+            if breed_id is None:
+                unmapped.add(breed)
+            else:
+                mapped += 1
+            batch.append(Pet(
+                pk=pk,
+                breed_ref_id=breed_id,
+                preferred_breed_ref_id=resolve_breed(preferred_breed, species),
+                updated_at=now,
+            ))
+            if len(batch) >= batch_size:
+                Pet.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            Pet.objects.bulk_update(batch, fields)
+        # No signals from bulk_update: drop the cached breed searches by hand
+        result_cache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Mapped {mapped} pets to canonical breeds'))
+        if unmapped:
+            self.stdout.write(self.style.WARNING(
+                f'No match for {len(unmapped)} breed value(s): {", ".join(sorted(unmapped)[:20])}'
+            ))
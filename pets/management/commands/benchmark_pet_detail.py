@@ -0,0 +1,102 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.shortcuts import get_object_or_404, render
+from django.test import RequestFactory
+from pets.models import Favorite, Match, Pet
+from pets.views import pet_detail
+import statistics
+import time
+
+
+def sequential_pet_detail(request, pk):
+    """The previous sync pet_detail, one query after another"""
+    pet = get_object_or_404(Pet, pk=pk)
+    vaccinations = pet.vaccinations.all()
+    is_owner = request.user.is_authenticated and pet.owner == request.user
+    is_favorited = False
+    has_pending_match = False
+
+    if request.user.is_authenticated:
+        is_favorited = Favorite.objects.filter(user=request.user, pet=pet).exists()
+        if not is_owner and request.user.pets.exists():
+            has_pending_match = Match.objects.filter(from_pet__owner=request.user, to_pet=pet).exists()
+
+    context = {
+        'pet': pet,
+        'vaccinations': vaccinations,
+        'is_owner': is_owner,
+        'is_favorited': is_favorited,
+        'has_pending_match': has_pending_match,
+    }
+    return render(request, 'pets/pet_detail.html', context)
+
+
+class Command(BaseCommand):
+    help = 'Compares the sequential and concurrent pet_detail at simulated database round-trip times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rtt', default='0,1,5,20',
+                            help='Comma separated round-trip times in milliseconds added to every query')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--pet', type=int, help='Pet id to render (default: the newest pet)')
+        parser.add_argument('--conn-max-age', type=int, default=600,
+                            help='CONN_MAX_AGE for the run; production keeps connections open')
+
+    def handle(self, *args, **options):
+        pet = Pet.objects.get(pk=options['pet']) if options['pet'] else Pet.objects.first()
+        if pet is None:
+            raise CommandError('No pets to render; load some data first')
+        visitor = Pet.objects.exclude(owner=pet.owner).select_related('owner').first()
+        user = visitor.owner if visitor else AnonymousUser()
+
+        self.rtt = 0.0
+        connection_created.connect(self._add_latency)
+        connections.close_all()
+        for alias in connections:
+            connections[alias].settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+
+        self.stdout.write(f'Rendering {pet} for {user}')
+        self.stdout.write(f'{"rtt":>6} {"sequential":>12} {"concurrent":>12} {"speedup":>8}')
+        try:
+            for rtt in (float(ms) for ms in options['rtt'].split(',')):
+                self.rtt = rtt / 1000
+                sequential = self._time(lambda: sequential_pet_detail(self._request(user), pet.pk), options['repeat'])
+                concurrent = self._time(lambda: async_to_sync(pet_detail)(self._request(user), pet.pk), options['repeat'])
+                self.stdout.write(f'{rtt:>4.0f}ms {sequential:>10.2f}ms {concurrent:>10.2f}ms {sequential / concurrent:>7.1f}x')
+        finally:
+            connection_created.disconnect(self._add_latency)
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark finished'))
+
+    def _add_latency(self, sender, connection, **kwargs):
+        # Every connection, including those of the query pool threads, waits one RTT per statement
+        if not getattr(connection, '_benchmark_latency', False):
+            connection.execute_wrappers.append(self._delay)
+            connection._benchmark_latency = True
+
+    def _delay(self, execute, sql, params, many, context):
+        time.sleep(self.rtt)
+        return execute(sql, params, many, context)
+
+    def _request(self, user):
+        request = RequestFactory().get('/pet/')
+        request.user = user
+
+        async def auser():
+            return user
+        request.auser = auser
+        return request
+
+    def _time(self, fn, repeat):
+        fn()  # warm up connections and templates
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = fn()
+            samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'pet_detail answered {response.status_code}')
+        return statistics.median(samples)
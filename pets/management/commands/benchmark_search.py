@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from pets.columnar import ColumnarIndex
+from pets.models import Pet
+from pets.pagination import KeysetPaginator
+from pets.search import apply_filters
+from datetime import date, timedelta
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks search pagination latency as the catalog grows (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated catalog sizes, e.g. 1000,10000,100000,1000000')
+        parser.add_argument('--page-size', type=int, default=24)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--columnar', action='store_true',
+                            help='Also compare a filtered search through the ORM and the columnar snapshot')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+        page_size = options['page_size']
+        repeat = options['repeat']
+
+        header = f'{"pets":>10} {"page 1":>12} {"deep keyset":>12} {"deep offset":>12}'
+        if options['columnar']:
+            header += f' {"filtered orm":>13} {"columnar":>12}'
+        self.stdout.write(header)
+
+        filters = {'species': 'DOG', 'gender': 'F', 'is_vaccinated': True, 'min_age': 2}
+
+        with transaction.atomic():
+            owner = User.objects.create(username='__benchmark_owner__')
+            seeded = 0
+            for size in sizes:
+                self._seed(owner, seeded, size)
+                seeded = size
+
+                pets = Pet.objects.filter(is_active=True, is_available_for_mating=True)
+                paginator = KeysetPaginator(pets, page_size=page_size)
+
+                # Cursor pointing at the last full page; building it is not timed
+                depth = max(size - 2 * page_size, 0)
+                anchor = pets.order_by(*paginator.ordering)[depth]
+                cursor = paginator.encode_cursor(anchor)
+
+                first = self._time(lambda: paginator.page().items, repeat)
+                deep = self._time(lambda: paginator.page(cursor).items, repeat)
+                offset = self._time(
+                    lambda: list(pets.order_by(*paginator.ordering)[depth:depth + page_size]),
+                    repeat,
+                )
+                line = f'{size:>10} {first:>10.2f}ms {deep:>10.2f}ms {offset:>10.2f}ms'
+
+                if options['columnar']:
+                    filtered = KeysetPaginator(apply_filters(pets, filters), page_size=page_size)
+                    orm = self._time(lambda: filtered.page().items, repeat)
+                    with tempfile.TemporaryDirectory() as tmp:
+                        index = ColumnarIndex(Path(tmp) / 'pet_columns.bin')
+                        index.build()
+                        columnar = self._time(lambda: index.page(filtered, filters).items, repeat)
+                    line += f' {orm:>11.2f}ms {columnar:>10.2f}ms'
+
+                self.stdout.write(line)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark finished (seeded pets rolled back)'))
+
+    def _seed(self, owner, start, stop, batch_size=10000):
+        """Bulk insert pets with distinct, increasing created_at values"""
+        created_at = Pet._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            base = timezone.now() - timedelta(days=365)
+            species = [choice for choice, _ in Pet.SPECIES_CHOICES]
+            for offset in range(start, stop, batch_size):
+                Pet.objects.bulk_create([
+                    Pet(
+                        owner=owner,
+                        name=f'Pet {i}',
+                        species=species[i % len(species)],
+                        breed='Mixed',
+                        gender='M' if i % 2 else 'F',
+                        date_of_birth=date(2015, 1, 1) + timedelta(days=i % 3000),
+                        weight=10,
+                        is_vaccinated=bool(i % 3),
+                        created_at=base + timedelta(seconds=i),
+                    )
+                    for i in range(offset, min(offset + batch_size, stop))
+                ])
+        finally:
+            created_at.auto_now_add = True
+
+    def _time(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(fn())
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
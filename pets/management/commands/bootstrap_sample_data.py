@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from pets import result_cache
+from pets.breeds import resolve_breed
+from pets.columnar import get_columnar_index
+from pets.geo import locate_owner, locate_pet
+from pets.models import Pet, OwnerProfile, Vaccination
+from pets.search import get_search_backend
+from pets.storage import retain
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+import json
+import time
+
+
+SNAPSHOT_PATH = Path(__file__).resolve().parents[2] / 'data' / 'sample_data.json'
+
+
+class Command(BaseCommand):
+    help = 'Loads the sample users, pets, vaccinations and bundled photos offline from pets/data/sample_data.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', default=str(SNAPSHOT_PATH), help='Snapshot file to load')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with open(options['snapshot']) as f:
+            snapshot = json.load(f)
+
+        usernames = [user['username'] for user in snapshot['users']]
+        if User.objects.filter(username__in=usernames).exists():
+            self.stdout.write(self.style.SUCCESS('✅ Sample data already loaded'))
+            return
+
+        today = date.today()
+        with transaction.atomic():
+            # The snapshot carries one precomputed hash instead of a set_password() per user
+            users = User.objects.bulk_create([
+                User(password=snapshot['password'], **{k: v for k, v in user.items() if k != 'profile'})
+                for user in snapshot['users']
+            ])
+            by_username = {user.username: user for user in users}
+
+            # bulk_create skips the pre_save signals, so geocode and link breeds here
+            profiles = []
+            for user, data in zip(users, snapshot['users']):
+                profile = OwnerProfile(user=user, **data['profile'])
+                locate_owner(profile)
+                profiles.append(profile)
+            OwnerProfile.objects.bulk_create(profiles)
+
+            pets, vaccinations = [], []
+            for data in snapshot['pets']:
+                data = dict(data)
+                photos = data.pop('photos')
+                doses = data.pop('vaccinations')
+                pet = Pet(
+                    owner=by_username[data.pop('owner')],
+                    date_of_birth=today - timedelta(days=data.pop('age_years') * 365),
+                    last_vaccination_date=today - timedelta(days=data.pop('last_vaccination_days_ago')),
+                    weight=Decimal(data.pop('weight')),
+                    height=Decimal(data.pop('height')),
+                    is_vaccinated=True,
+                    is_available_for_mating=True,
+                    **data,
+                )
+                for field, name in zip(('photo1', 'photo2', 'photo3'), photos):
+                    setattr(pet, field, name)
+                pet.breed_ref_id = resolve_breed(pet.breed, pet.species)
+                locate_pet(pet)
+                pets.append(pet)
+                vaccinations += [
+                    Vaccination(
+                        pet=pet,
+                        vaccine_type=vaccine_type,
+                        date_administered=today - timedelta(days=days_ago),
+                        next_due_date=today - timedelta(days=days_ago - 365),
+                        veterinarian_name='Dr. Smith',
+                        clinic_name='Happy Paws Veterinary Clinic',
+                    )
+                    for vaccine_type, days_ago in doses
+                ]
+            Pet.objects.bulk_create(pets)
+            Vaccination.objects.bulk_create(vaccinations)
+
+            # ...and the post_save side effects: photo references and search indexes
+            retain((), [name for data in snapshot['pets'] for name in data['photos']])
+            backend = get_search_backend()
+            for pet in pets:
+                backend.index_pet(pet)
+            index = get_columnar_index()
+            if index is not None:
+                transaction.on_commit(lambda: [index.upsert(pet) for pet in pets])
+            transaction.on_commit(result_cache.invalidate_all)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Loaded {len(users)} users, {len(pets)} pets and {len(vaccinations)} vaccinations '
+            f'in {elapsed * 1000:.0f}ms'
+        ))
+        self.stdout.write('  Username: ' + ', '.join(usernames))
+        self.stdout.write('  Password: password123')
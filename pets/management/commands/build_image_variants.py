@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pets.images import IMAGE_FIELDS, manifest_name, remember_widths, write_variants
+
+
+def _build(name):
+    # Runs in a worker process and only writes files. The cache can be the
+    # database cache, whose writes from every worker at once could fail
+    # with "database is locked", so the parent stores the widths instead.
+    try:
+        _, widths = write_variants(default_storage, name)
+    except OSError as e:
+        return name, None, str(e)
+    return name, widths, None
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized JPEG/WebP renditions of existing pet photos and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (default: one per CPU)')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild renditions that already exist')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, fields in IMAGE_FIELDS.items():
+            for field in fields:
+                names.update(model.objects.exclude(**{f'{field}__in': ['', None]})
+                             .values_list(field, flat=True))
+        if not options['force']:
+            # Renditions built before the widths manifest existed are rebuilt too
+            names = {name for name in names if not default_storage.exists(manifest_name(name))}
+
+        if not names:
+            self.stdout.write(self.style.SUCCESS('✅ All image variants are up to date'))
+            return
+
+        self.stdout.write(f'Building variants for {len(names)} images with {options["workers"]} workers...')
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        started = time.perf_counter()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name, widths, error in pool.map(_build, sorted(names), chunksize=8):
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'  ⚠️  {name}: {error}'))
+                else:
+                    remember_widths(name, widths)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Built variants for {len(names) - failed} images in {elapsed:.1f}s ({failed} failed)'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from pets.columnar import get_columnar_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the memory-mapped columnar snapshot used by search_pets'
+
+    def handle(self, *args, **kwargs):
+        index = get_columnar_index()
+        if index is None:
+            # Disabled by default, so build.sh can always run this
+            self.stdout.write('SEARCH_COLUMNAR_INDEX is not configured, nothing to build')
+            return
+
+        self.stdout.write(f'Building {index.path}...')
+        count = index.build()
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {count} pets ({index.path.stat().st_size} bytes)'))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from pets.storage import collect, recount
+
+
+class Command(BaseCommand):
+    help = 'Deletes uploaded files (and their image variants) that no pet, profile or vaccination uses any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Keep files unreferenced for less than this long')
+        parser.add_argument('--recount', action='store_true',
+                            help='Rebuild the reference counts from the database first')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            recount()
+        files, size = collect(timedelta(minutes=options['grace_minutes']), dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'✅ {verb} {files} unused files ({size / 1024:.0f} KB)'))
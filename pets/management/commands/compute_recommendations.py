@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from pets.recommendations import update
+import time
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the top breeding partner candidates for pets changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rescore every eligible pet')
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Candidates stored per pet (default: RECOMMENDATIONS_TOP_K)')
+        parser.add_argument('--batch-size', type=int, default=512,
+                            help='Pets scored per NumPy block')
+        parser.add_argument('--chunk-size', type=int, default=4096,
+                            help='Candidates scored against a block at a time')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        run = update(full=options['full'], k=options['top_k'], batch_size=options['batch_size'],
+                     chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✅ Scored {run.pets_scored} pets in {elapsed:.1f}s'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pets import result_cache
+from pets.geo import locate_owner, locate_pet
+from pets.models import OwnerProfile, Pet
+
+
+class Command(BaseCommand):
+    help = 'Fills in coordinates for owners and pets from the bundled gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help='Re-geocode every row, not just those without coordinates')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        owners = OwnerProfile.objects.order_by('pk')
+        pets = Pet.objects.select_related('owner__owner_profile').order_by('pk')
+        if not options['all']:
+            owners = owners.filter(latitude__isnull=True)
+            pets = pets.filter(latitude__isnull=True)
+
+        # Owners first, so pets without their own location can inherit from them
+        located = self._backfill(owners, locate_owner, ['latitude', 'longitude'], batch_size)
+        self.stdout.write(f'Owners geocoded: {located}')
+
+        # New coordinates change proximity scores, so the next recommendations
+        # run must count these pets as edited
+        located = self._backfill(pets, locate_pet, ['latitude', 'longitude', 'geohash', 'updated_at'], batch_size)
+        self.stdout.write(f'Pets geocoded: {located}')
+        # bulk_update sends no signals: cached radius searches (and their
+        # ETags) would keep the old results until some other pet was saved
+        result_cache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Locations updated!'))
+
+    def _backfill(self, queryset, locate, fields, batch_size):
+        model = queryset.model
+        now = timezone.now()
+        located = 0
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            locate(obj)
+            if 'updated_at' in fields:
+                obj.updated_at = now
+            located += obj.latitude is not None
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, fields)
+        return located
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from pets.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recounts the per-user match counters from the match table'
+
+    def handle(self, *args, **kwargs):
+        rows = recount()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {rows} match counters'))
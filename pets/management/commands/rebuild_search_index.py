@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from pets.models import Pet
+from pets.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index (needed after bulk imports that skip signals)'
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        self.stdout.write(f'Rebuilding search index with {type(backend).__name__}...')
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {Pet.objects.count()} pets'))
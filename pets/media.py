@@ -0,0 +1,184 @@
+"""
+Serving uploaded media in production.
+
+``serve_media`` answers every request under ``MEDIA_URL``. Conditional
+requests are checked against the file's ETag and Last-Modified before any
+bytes are touched, so revalidations cost a ``stat()`` and return 304.
+Content-addressed names (``blobs/`` and the ``variants/blobs/`` renditions
+built from them) never change content and are cached for a year as
+``immutable``. Other names are cached briefly and then revalidated.
+
+How the bytes go out depends on ``MEDIA_SERVE_MODE``:
+
+``'django'``
+    The worker sends the file itself. Under ASGI the bytes come from an
+    async iterator that reads one chunk at a time off the event loop (a
+    sync iterator would be read into memory in full before sending). Under
+    WSGI whole files go through the server's ``sendfile()`` wrapper and
+    single byte ranges are streamed in chunks.
+``'x-accel-redirect'``
+    nginx sends the file from the internal location at
+    ``MEDIA_ACCEL_PREFIX``, ranges included.
+``'x-sendfile'``
+    Apache's mod_xsendfile or lighttpd sends the file at its absolute path.
+
+In the last two modes the worker returns headers only. With a pull CDN in
+front (production's ``MEDIA_CDN_URL``) pages link to the CDN and these
+views only answer its fetches at ``MEDIA_ORIGIN_URL``.
+"""
+import mimetypes
+import re
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import PREFIX
+
+
+IMMUTABLE_PREFIXES = (f'{PREFIX}/', f'variants/{PREFIX}/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def serve_mode():
+    return getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+
+
+def cache_control(path):
+    if path.startswith(IMMUTABLE_PREFIXES):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={MUTABLE_MAX_AGE}'
+
+
+def byte_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single-range ``Range`` header, ``None``
+    to serve the whole file, or ``False`` when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Multiple or malformed ranges: the whole file is a valid answer
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def aread_range(path, start, length):
+    """``read_range`` for ASGI: file reads run in threads, never on the event loop"""
+    run = lambda fn, *args: sync_to_async(fn, thread_sensitive=False)(*args)
+    f = await run(open, path, 'rb')
+    try:
+        await run(f.seek, start)
+        while length > 0:
+            chunk = await run(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await run(f.close)
+
+
+def offload(path, full_path):
+    """Headers-only response for the front-end server to fill in"""
+    response = HttpResponse()
+    if serve_mode() == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + path
+    else:
+        response['X-Sendfile'] = str(full_path)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = Path(safe_join(settings.MEDIA_ROOT, path))
+        stat = full_path.stat()
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File not found')
+    if not full_path.is_file():
+        raise Http404('File not found')
+
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    last_modified = int(stat.st_mtime)
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if serve_mode() != 'django':
+            response = offload(path, full_path)
+        else:
+            requested = request.META.get('HTTP_RANGE')
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if requested and if_range and if_range not in (etag, http_date(last_modified)):
+                requested = None  # Changed since the client's partial copy: send it all again
+            span = byte_range(requested, stat.st_size) if requested else None
+            if span is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+            elif 'wsgi.version' not in request.META:
+                # ASGI: Django buffers sync iterators there, so stream an async one
+                start, end = span or (0, stat.st_size - 1)
+                response = StreamingHttpResponse(aread_range(full_path, start, end - start + 1),
+                                                 status=206 if span else 200)
+                response['Content-Length'] = str(end - start + 1)
+                if span:
+                    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            elif span:
+                start, end = span
+                response = StreamingHttpResponse(read_range(full_path, start, end - start + 1), status=206)
+                response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+                response['Content-Length'] = str(end - start + 1)
+            else:
+                response = FileResponse(full_path.open('rb'))
+                response['Content-Length'] = str(stat.st_size)
+            response['Accept-Ranges'] = 'bytes'
+        response['Content-Type'] = content_type
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control(path)
+    return response
+
+
+def media_patterns():
+    """
+    URL patterns serving ``MEDIA_ORIGIN_URL`` (``MEDIA_URL`` when unset);
+    none when media lives on another host
+    """
+    prefix = getattr(settings, 'MEDIA_ORIGIN_URL', settings.MEDIA_URL)
+    if not prefix or '//' in prefix:
+        return []
+    return [re_path(r'^%s(?P<path>.+)$' % re.escape(prefix.lstrip('/')), serve_media, name='media')]
@@ -0,0 +1,226 @@
+"""
+Middleware that reports where a request's queries and time go.
+
+``DuplicateQueryMiddleware`` records every SQL statement a request runs,
+with its parameters left out, so the same lookup for different rows
+groups together. A statement run ``QUERY_DUPLICATE_THRESHOLD`` times or
+more is logged as a warning with the code that ran it: the innermost
+project frame, and the template line when the query came from rendering.
+
+It is only active with ``DEBUG`` on. The recorder lives in a context
+variable and ``record_query``, installed on every connection by
+``instrument()`` from ``PetsConfig.ready`` like the ``pets.timing`` hooks,
+adds to it. Async views are covered too: ``sync_to_async`` copies the
+context into the thread that runs the ORM and into the query pool
+(``pets.concurrency``). Outside a recorded request the hook is a single
+context variable lookup.
+
+``ServerTimingMiddleware`` measures a sample of requests, a
+``SERVER_TIMING_SAMPLE_RATE`` fraction of them, with ``pets.timing``: the
+number and time of SQL statements, template rendering time, cache hits
+and misses, and the total. It logs them as one JSON line on the
+``pets.timing`` logger, tagged with the URL name so slow pages can be
+grouped. Staff users and requests from ``INTERNAL_IPS`` also get them as
+a ``Server-Timing`` header, which browsers show in the network panel;
+anyone else would learn how the page hits the database.
+"""
+import contextvars
+import json
+import logging
+import random
+import sys
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+from . import timing
+
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('pets.timing')
+
+DEFAULT_THRESHOLD = 3
+DEFAULT_SAMPLE_RATE = 1.0
+PROJECT_ROOT = str(Path(__file__).resolve().parents[1])
+# Wrappers around every query and render, never the code responsible for one
+INSTRUMENTATION = {__file__, timing.__file__}
+
+
+def call_site():
+    """``file:line`` of the project code, and template line, running the current query"""
+    code = template = None
+    frame = sys._getframe(2)
+    while frame and not (code and template):
+        filename = frame.f_code.co_filename
+        if template is None and isinstance(frame.f_locals.get('self'), Node):
+            node = frame.f_locals['self']
+            if node.origin and node.token:
+                template = f'{node.origin.template_name or node.origin.name}:{node.token.lineno}'
+        if (code is None and filename.startswith(PROJECT_ROOT) and filename not in INSTRUMENTATION
+                and 'site-packages' not in filename):
+            code = f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return code, template
+
+
+recording = contextvars.ContextVar('pets_query_recorder', default=None)
+
+
+class QueryRecorder:
+    """Each statement a request runs, with its call sites"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.sites = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def add(self, sql):
+        site = call_site()
+        with self._lock:
+            self.counts[sql] += 1
+            self.sites[sql][site] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, n, self.sites[sql]) for sql, n in self.counts.most_common() if n >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = recording.get()
+    if recorder is not None:
+        recorder.add(sql)
+    return execute(sql, params, many, context)
+
+
+def _wrap_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument():
+    """Install ``record_query`` on every connection; safe to call more than once"""
+    connection_created.connect(_wrap_connection, dispatch_uid='pets.middleware')
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(connection)
+
+
+class DuplicateQueryMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', DEFAULT_THRESHOLD)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = recording.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            recording.reset(token)
+        self.report(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = recording.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            recording.reset(token)
+        self.report(request, recorder)
+        return response
+
+    def report(self, request, recorder):
+        for sql, n, sites in recorder.duplicates(self.threshold):
+            lines = '\n'.join(
+                f'    {n}x {code or "?"}' + (f' (template {template})' if template else '')
+                for (code, template), n in sites.most_common(3)
+            )
+            logger.warning('%s %s ran the same query %d times:\n  %s\n%s',
+                           request.method, request.path, n, sql, lines)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with timing.measure() as measured:
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        internal = self.internal_address(request) or bool(user and user.is_staff)
+        return self.report(request, response, measured, internal)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with timing.measure() as measured:
+            response = await self.get_response(request)
+        internal = self.internal_address(request)
+        if not internal and hasattr(request, 'auser'):
+            internal = (await request.auser()).is_staff
+        return self.report(request, response, measured, internal)
+
+    def internal_address(self, request):
+        return request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+
+    def report(self, request, response, measured, internal):
+        if internal:
+            queries = f'{measured.queries} {"query" if measured.queries == 1 else "queries"}'
+            metrics = [
+                f'db;dur={_ms(measured.db)};desc="{queries}"',
+                f'tpl;dur={_ms(measured.template)};desc="Templates"',
+                f'cache;desc="{measured.cache_hits} hits, {measured.cache_misses} misses"',
+                f'total;dur={_ms(measured.total)}',
+            ]
+            if response.has_header('Server-Timing'):
+                metrics.insert(0, response['Server-Timing'])
+            response['Server-Timing'] = ', '.join(metrics)
+
+        match = request.resolver_match
+        timing_logger.info(json.dumps({
+            'url_name': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': _ms(measured.total),
+            'db_ms': _ms(measured.db),
+            'queries': measured.queries,
+            'template_ms': _ms(measured.template),
+            'cache_hits': measured.cache_hits,
+            'cache_misses': measured.cache_misses,
+        }))
+        return response
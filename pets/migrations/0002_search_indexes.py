@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at'], name='favorite_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['to_pet', '-created_at'], name='match_to_pet_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['from_pet', '-created_at'], name='match_from_pet_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_available_for_mating', True)), fields=['-created_at', '-id'], name='pet_available_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_available_for_mating', True)), fields=['species', 'gender', '-created_at', '-id'], name='pet_available_species_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_available_for_mating', True)), fields=['date_of_birth'], name='pet_available_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'is_active', 'is_available_for_mating'], name='pet_owner_available_idx'),
+        ),
+    ]
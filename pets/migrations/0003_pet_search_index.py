@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE pets_pet_fts USING fts5('
+            "name, breed, description, color, location, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(
+            'INSERT INTO pets_pet_fts (rowid, name, breed, description, color, location) '
+            'SELECT id, name, breed, description, color, location FROM pets_pet'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE pets_pet_search ('
+            'pet_id bigint PRIMARY KEY REFERENCES pets_pet (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX pets_pet_search_document_gin ON pets_pet_search USING gin (document)')
+        schema_editor.execute(
+            'INSERT INTO pets_pet_search (pet_id, document) SELECT id, '
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(breed, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(color, '')), 'C') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'D') "
+            'FROM pets_pet'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS pets_pet_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS pets_pet_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
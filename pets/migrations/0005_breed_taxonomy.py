@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0004_pet_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Breed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('species', models.CharField(default='DOG', max_length=10)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pet',
+            name='breed_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pets', to='pets.breed'),
+        ),
+        migrations.AddField(
+            model_name='pet',
+            name='preferred_breed_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='preferred_by', to='pets.breed'),
+        ),
+        migrations.CreateModel(
+            name='BreedAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+                ('breed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='pets.breed')),
+            ],
+            options={
+                'verbose_name_plural': 'breed aliases',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+import json
+import re
+from pathlib import Path
+
+from django.db import migrations
+from django.utils.text import slugify
+
+
+BREEDS_PATH = Path(__file__).resolve().parent.parent / 'data' / 'breeds.json'
+
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def seed_breeds(apps, schema_editor):
+    Breed = apps.get_model('pets', 'Breed')
+    BreedAlias = apps.get_model('pets', 'BreedAlias')
+
+    entries = json.loads(BREEDS_PATH.read_text())
+    breeds = Breed.objects.bulk_create([
+        Breed(species=entry['species'], name=entry['name'], slug=slugify(entry['name']))
+        for entry in entries
+    ])
+
+    aliases, seen = [], set()
+    for breed, entry in zip(breeds, entries):
+        for alias in [entry['name']] + entry['aliases']:
+            key = normalize(alias)
+            if key and key not in seen:
+                seen.add(key)
+                aliases.append(BreedAlias(breed=breed, alias=key))
+    BreedAlias.objects.bulk_create(aliases)
+
+
+def remove_breeds(apps, schema_editor):
+    apps.get_model('pets', 'Breed').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0005_breed_taxonomy'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_breeds, remove_breeds),
+    ]
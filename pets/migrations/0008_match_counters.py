@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_matches(apps, schema_editor):
+    Match = apps.get_model('pets', 'Match')
+    MatchCounter = apps.get_model('pets', 'MatchCounter')
+
+    counters = []
+    for direction, owner in (('RECEIVED', 'to_pet__owner'), ('SENT', 'from_pet__owner')):
+        rows = Match.objects.order_by().values_list(owner, 'status').annotate(n=Count('id'))
+        counters += [
+            MatchCounter(user_id=user_id, direction=direction, status=status, count=n)
+            for user_id, status, n in rows
+        ]
+    MatchCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0007_recommendations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direction', models.CharField(choices=[('RECEIVED', 'Received'), ('SENT', 'Sent')], max_length=8)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('REJECTED', 'Rejected'), ('CANCELLED', 'Cancelled')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_to_pet_recent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_from_pet_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['to_pet', 'status', '-created_at', '-id'], name='match_to_pet_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['from_pet', 'status', '-created_at', '-id'], name='match_from_pet_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='matchcounter',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_counters', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='matchcounter',
+            unique_together={('user', 'direction', 'status')},
+        ),
+        migrations.RunPython(count_matches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+import django.utils.timezone
+import pets.storage
+from collections import Counter
+
+from django.db import migrations, models
+
+
+FILE_FIELDS = {
+    'OwnerProfile': ('profile_picture',),
+    'Pet': ('photo1', 'photo2', 'photo3'),
+    'Vaccination': ('certificate',),
+}
+
+
+def register_files(apps, schema_editor):
+    """Reference-count the content-addressed files already in use"""
+    # Legacy names (e.g. the sample photos under pet_photos/) stay untracked,
+    # or collect_media would delete files the repo ships once unreferenced
+    Blob = apps.get_model('pets', 'Blob')
+    counts = Counter()
+    for model, fields in FILE_FIELDS.items():
+        rows = apps.get_model('pets', model).objects
+        for field in fields:
+            counts.update(rows.filter(**{f'{field}__startswith': f'{pets.storage.PREFIX}/'})
+                          .values_list(field, flat=True))
+
+    storage = pets.storage.get_blob_storage()
+    blobs = []
+    for name, refs in counts.items():
+        try:
+            size = storage.size(name)
+        except OSError:
+            size = 0
+        blobs.append(Blob(name=name, size=size, refs=refs))
+    Blob.objects.bulk_create(blobs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0008_match_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refs', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='ownerprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.get_blob_storage, upload_to='owner_profiles/'),
+        ),
+        migrations.AlterField(
+            model_name='pet',
+            name='photo1',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.get_blob_storage, upload_to='pet_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='pet',
+            name='photo2',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.get_blob_storage, upload_to='pet_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='pet',
+            name='photo3',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.get_blob_storage, upload_to='pet_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='vaccination',
+            name='certificate',
+            field=models.FileField(blank=True, null=True, storage=pets.storage.get_blob_storage, upload_to='vaccination_certificates/'),
+        ),
+        migrations.RunPython(register_files, migrations.RunPython.noop),
+    ]
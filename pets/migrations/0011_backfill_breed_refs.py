@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.utils import timezone
+
+from pets import result_cache
+from pets.breeds import BreedIndex
+
+
+BATCH_SIZE = 2000
+
+
+def link_breeds(apps, schema_editor):
+    # Pets saved before 0005 were never linked, so breed filters (which match
+    # on breed_ref) would skip them
+    Pet = apps.get_model('pets', 'Pet')
+    BreedAlias = apps.get_model('pets', 'BreedAlias')
+    db = schema_editor.connection.alias
+
+    index = BreedIndex(BreedAlias.objects.using(db).values_list('alias', 'breed_id', 'breed__species'))
+    rows = (
+        Pet.objects.using(db).filter(breed_ref__isnull=True).order_by('pk')
+        .values_list('pk', 'species', 'breed', 'preferred_breed')
+    )
+    now, batch = timezone.now(), []
+    for pk, species, breed, preferred_breed in rows.iterator(chunk_size=BATCH_SIZE):
+        breed_id = index.lookup(breed, species)
+        if breed_id is None:
+            continue
+        batch.append(Pet(pk=pk, breed_ref_id=breed_id,
+                         preferred_breed_ref_id=index.lookup(preferred_breed, species), updated_at=now))
+        if len(batch) >= BATCH_SIZE:
+            Pet.objects.using(db).bulk_update(batch, ['breed_ref', 'preferred_breed_ref', 'updated_at'])
+            batch = []
+    if batch:
+        Pet.objects.using(db).bulk_update(batch, ['breed_ref', 'preferred_breed_ref', 'updated_at'])
+    # bulk_update sends no signals, so cached breed searches (and the ETags
+    # built from their generation) would keep serving the unlinked results
+    result_cache.invalidate_all()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0010_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_breeds, migrations.RunPython.noop),
+    ]
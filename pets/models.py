@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+from .storage import get_blob_storage
+
 
 class OwnerProfile(models.Model):
     """Extended profile for pet owners"""
@@ -12,7 +15,9 @@ class OwnerProfile(models.Model):
     city = models.CharField(max_length=100, blank=True)
     state = models.CharField(max_length=100, blank=True)
     zipcode = models.CharField(max_length=10, blank=True)
-    profile_picture = models.ImageField(upload_to='owner_profiles/', blank=True, null=True)
+    profile_picture = models.ImageField(upload_to='owner_profiles/', storage=get_blob_storage, blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True, editable=False)
+    longitude = models.FloatField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -20,6 +25,36 @@ class OwnerProfile(models.Model):
         return f"{self.user.get_full_name() or self.user.username}'s Profile"
 
 
+class Breed(models.Model):
+    """Canonical breed name; free-text breeds are mapped onto it (see pets.breeds)"""
+    species = models.CharField(max_length=10, default='DOG')
+    name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class BreedAlias(models.Model):
+    """Alternative spelling of a breed, stored in normalized form"""
+    breed = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='aliases')
+    alias = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name_plural = 'breed aliases'
+
+    def __str__(self):
+        return f"{self.alias} → {self.breed.name}"
+
+    def save(self, *args, **kwargs):
+        from .breeds import normalize
+        self.alias = normalize(self.alias)
+        super().save(*args, **kwargs)
+
+
 class Pet(models.Model):
     """Model for pet profiles"""
     GENDER_CHOICES = [
@@ -39,6 +74,9 @@ class Pet(models.Model):
     name = models.CharField(max_length=100)
     species = models.CharField(max_length=10, choices=SPECIES_CHOICES, default='DOG')
     breed = models.CharField(max_length=100)
+    breed_ref = models.ForeignKey(
+        Breed, on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='pets'
+    )
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     date_of_birth = models.DateField()
     weight = models.DecimalField(max_digits=5, decimal_places=2, help_text="Weight in kg")
@@ -55,14 +93,20 @@ class Pet(models.Model):
     # Breeding preferences
     is_available_for_mating = models.BooleanField(default=True)
     preferred_breed = models.CharField(max_length=100, blank=True, help_text="Preferred breed for mating")
+    preferred_breed_ref = models.ForeignKey(
+        Breed, on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='preferred_by'
+    )
 
     # Media
-    photo1 = models.ImageField(upload_to='pet_photos/', blank=True, null=True)
-    photo2 = models.ImageField(upload_to='pet_photos/', blank=True, null=True)
-    photo3 = models.ImageField(upload_to='pet_photos/', blank=True, null=True)
+    photo1 = models.ImageField(upload_to='pet_photos/', storage=get_blob_storage, blank=True, null=True)
+    photo2 = models.ImageField(upload_to='pet_photos/', storage=get_blob_storage, blank=True, null=True)
+    photo3 = models.ImageField(upload_to='pet_photos/', storage=get_blob_storage, blank=True, null=True)
 
-    # Location
+    # Location (coordinates are filled in from the offline gazetteer, see pets.geo)
     location = models.CharField(max_length=200, blank=True)
+    latitude = models.FloatField(blank=True, null=True, editable=False)
+    longitude = models.FloatField(blank=True, null=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -71,6 +115,38 @@ class Pet(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listings only ever show active pets that are open to matches,
+            # so the partial indexes skip everything else entirely.
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=Q(is_active=True, is_available_for_mating=True),
+                name='pet_available_recent_idx',
+            ),
+            models.Index(
+                fields=['species', 'gender', '-created_at', '-id'],
+                condition=Q(is_active=True, is_available_for_mating=True),
+                name='pet_available_species_idx',
+            ),
+            models.Index(
+                fields=['date_of_birth'],
+                condition=Q(is_active=True, is_available_for_mating=True),
+                name='pet_available_dob_idx',
+            ),
+            models.Index(
+                fields=['geohash'],
+                condition=Q(is_active=True, is_available_for_mating=True),
+                name='pet_available_geohash_idx',
+            ),
+            models.Index(
+                fields=['owner', 'is_active', 'is_available_for_mating'],
+                name='pet_owner_available_idx',
+            ),
+            # Last change per species (and overall) for the search page's
+            # conditional GET, read from the end of the index
+            models.Index(fields=['species', 'updated_at'], name='pet_species_updated_idx'),
+            models.Index(fields=['updated_at'], name='pet_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.breed})"
@@ -113,7 +189,9 @@ class Vaccination(models.Model):
     next_due_date = models.DateField(blank=True, null=True)
     veterinarian_name = models.CharField(max_length=100, blank=True)
     clinic_name = models.CharField(max_length=200, blank=True)
-    certificate = models.FileField(upload_to='vaccination_certificates/', blank=True, null=True)
+    certificate = models.FileField(
+        upload_to='vaccination_certificates/', storage=get_blob_storage, blank=True, null=True
+    )
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -143,11 +221,35 @@ class Match(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['from_pet', 'to_pet']
+        indexes = [
+            # One index per inbox tab: a pet's matches in one status, newest first
+            models.Index(fields=['to_pet', 'status', '-created_at', '-id'], name='match_to_pet_status_idx'),
+            models.Index(fields=['from_pet', 'status', '-created_at', '-id'], name='match_from_pet_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_pet.name} → {self.to_pet.name} ({self.status})"
 
 
+class MatchCounter(models.Model):
+    """Denormalized per-user match counts by direction and status (see pets.counters)"""
+    DIRECTION_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('SENT', 'Sent'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='match_counters')
+    direction = models.CharField(max_length=8, choices=DIRECTION_CHOICES)
+    status = models.CharField(max_length=10, choices=Match.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'direction', 'status']
+
+    def __str__(self):
+        return f"{self.user.username} {self.direction.lower()} {self.status.lower()}: {self.count}"
+
+
 class Favorite(models.Model):
     """Model for favoriting pets"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
@@ -157,6 +259,55 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ['user', 'pet']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='favorite_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ♥ {self.pet.name}"
+
+
+class Recommendation(models.Model):
+    """Precomputed breeding partner suggestion (see pets.recommendations)"""
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='recommendations')
+    candidate = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='recommended_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['pet', 'rank']
+        unique_together = ['pet', 'candidate']
+        indexes = [
+            models.Index(fields=['pet', 'rank'], name='recommendation_pet_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pet.name} ~ {self.candidate.name} ({self.score:.2f})"
+
+
+class RecommendationRun(models.Model):
+    """Watermark for incremental compute_recommendations runs"""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+    pets_scored = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+        get_latest_by = 'started_at'
+
+    def __str__(self):
+        return f"Recommendations run at {self.started_at:%Y-%m-%d %H:%M} ({self.pets_scored} pets)"
+
+
+class Blob(models.Model):
+    """A content-addressed media file and how many rows reference it (see pets.storage)"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refs = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time refs changed; unreferenced blobs get a grace period from here
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
@@ -0,0 +1,133 @@
+"""
+Keyset (cursor) pagination for large, append-mostly listings.
+
+Instead of OFFSET, each page remembers the sort key of its last row and the
+next page asks for rows strictly "after" it, so page 1000 costs the same as
+page 1 as long as the ordering is backed by an index.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 24
+DEFAULT_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a page token cannot be decoded"""
+
+
+def get_page_size(requested=None):
+    """Return the requested page size clamped to the configured hard cap"""
+    default = getattr(settings, 'SEARCH_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    cap = getattr(settings, 'SEARCH_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    try:
+        size = int(requested) if requested else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, cap))
+
+
+class KeysetPage:
+    """A single page of results plus the token for the page after it"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset on a unique, indexed ordering.
+
+    ``ordering`` must end with a unique column (normally ``-id``) so that
+    rows sharing the leading key are still split deterministically.
+    """
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), page_size=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = get_page_size(page_size)
+
+    def _fields(self):
+        return [(f.lstrip('-'), f.startswith('-')) for f in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self._fields():
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor(str(e))
+
+        fields = self._fields()
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor('Cursor does not match the ordering')
+
+        decoded = []
+        for (name, _), value in zip(fields, values):
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations (e.g. a search rank) are plain JSON numbers
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise InvalidCursor(f'Bad value for {name}')
+                decoded.append(value)
+                continue
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError) as e:
+                raise InvalidCursor(str(e))
+            if value is None:
+                raise InvalidCursor(f'Missing value for {name}')
+            decoded.append(value)
+        return decoded
+
+    def _after(self, values):
+        """Build ``(a, b, c) > (x, y, z)`` for the mixed-direction ordering"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+
+        # Repeat the bound on the leading column on its own so the planner can
+        # turn it into an index range seek instead of filtering an index scan
+        name, descending = self._fields()[0]
+        return Q(**{f'{name}__lte' if descending else f'{name}__gte': values[0]}) & condition
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor)
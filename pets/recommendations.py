@@ -0,0 +1,240 @@
+"""
+Breeding partner recommendations.
+
+Every eligible pet (active, available for mating, not neutered) is loaded
+into a handful of NumPy columns once per run. A block of source pets is
+scored against one chunk of candidates at a time, so the (sources x
+candidates) matrix stays the same size however large the catalog grows,
+and a running top K per source is merged across chunks. Only the top K
+candidates per pet are stored in ``Recommendation`` so the views just read
+a few indexed rows.
+
+Runs are incremental: a pet is rescored when it changed since the last
+run, when one of its stored candidates changed, or when a changed pet now
+beats the weakest candidate on its list. Candidates that are deleted drop
+out of lists through the foreign key cascade until their owners' pets are
+rescored.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Pet, Recommendation, RecommendationRun
+
+
+DEFAULT_TOP_K = 10
+
+WEIGHTS = {
+    'preferred_breed': 3.0,   # candidate is the breed the pet's owner asked for
+    'same_breed': 1.5,        # no preference given, candidate shares the pet's breed
+    'vaccinated': 1.0,
+    'age_gap': 0.3,           # per year of difference, capped at AGE_GAP_CAP
+    'outside_prime': 1.0,     # candidate younger or older than PRIME_AGE
+    'proximity': 2.0,         # scaled by exp(-distance / DISTANCE_SCALE_KM)
+}
+AGE_GAP_CAP = 5
+PRIME_AGE = (1, 8)
+DISTANCE_SCALE_KM = 100.0
+EARTH_RADIUS_KM = 6371.0
+
+FEATURE_FIELDS = ('id', 'owner_id', 'species', 'gender', 'breed_ref_id', 'preferred_breed_ref_id',
+                  'is_vaccinated', 'date_of_birth', 'latitude', 'longitude')
+
+
+def get_top_k():
+    return getattr(settings, 'RECOMMENDATIONS_TOP_K', DEFAULT_TOP_K)
+
+
+def eligible_pets():
+    return Pet.objects.filter(is_active=True, is_available_for_mating=True, is_neutered=False)
+
+
+class Features:
+    """Column arrays for every eligible pet, in id order"""
+
+    def __init__(self, rows):
+        today = timezone.now().date()
+        species = {value: i for i, (value, _) in enumerate(Pet.SPECIES_CHOICES)}
+        columns = list(zip(*rows)) or [()] * len(FEATURE_FIELDS)
+        ids, owners, kinds, genders, breeds, preferred, vaccinated, born, lat, lon = columns
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.species = np.asarray([species.get(s, -1) for s in kinds], dtype=np.int8)
+        self.male = np.asarray([g == 'M' for g in genders], dtype=bool)
+        self.breeds = np.asarray([b or 0 for b in breeds], dtype=np.int64)
+        self.preferred = np.asarray([b or 0 for b in preferred], dtype=np.int64)
+        self.vaccinated = np.asarray(vaccinated, dtype=bool)
+        self.age = np.asarray([(today - d).days / 365.25 for d in born], dtype=np.float32)
+        # Unit vectors on the sphere turn pairwise distances into one matrix product
+        lat = np.radians(np.asarray([np.nan if v is None else v for v in lat], dtype=np.float64))
+        lon = np.radians(np.asarray([np.nan if v is None else v for v in lon], dtype=np.float64))
+        self.xyz = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+    @classmethod
+    def load(cls, queryset=None):
+        queryset = eligible_pets() if queryset is None else queryset
+        return cls(queryset.order_by('id').values_list(*FEATURE_FIELDS).iterator(chunk_size=10000))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, pet_ids):
+        """Array positions of the given ids, skipping ids that are not loaded"""
+        pet_ids = np.asarray(sorted(pet_ids), dtype=np.int64)
+        found = np.searchsorted(self.ids, pet_ids)
+        found = found[found < len(self.ids)]
+        return found[np.isin(self.ids[found], pet_ids)]
+
+
+def score(f, sources, candidates=slice(None)):
+    """Compatibility of each source (rows) with each candidate (columns)"""
+    s = lambda column: column[sources][:, None]
+    c = lambda column: column[candidates][None, :]
+
+    eligible = (s(f.species) == c(f.species)) & (s(f.male) != c(f.male)) & (s(f.owners) != c(f.owners))
+
+    wanted, breed = s(f.preferred), c(f.breeds)
+    scores = WEIGHTS['preferred_breed'] * ((wanted != 0) & (wanted == breed))
+    scores = scores + WEIGHTS['same_breed'] * ((wanted == 0) & (breed != 0) & (s(f.breeds) == breed))
+    scores = scores + WEIGHTS['vaccinated'] * c(f.vaccinated)
+
+    age = c(f.age)
+    scores = scores - WEIGHTS['age_gap'] * np.minimum(np.abs(s(f.age) - age), AGE_GAP_CAP)
+    scores = scores - WEIGHTS['outside_prime'] * ((age < PRIME_AGE[0]) | (age > PRIME_AGE[1]))
+
+    # Great-circle distance; pets without coordinates (NaN) get no proximity bonus
+    cosine = np.clip(f.xyz[sources] @ f.xyz[candidates].T, -1, 1)
+    distance = EARTH_RADIUS_KM * np.arccos(cosine)
+    scores = scores + WEIGHTS['proximity'] * np.nan_to_num(np.exp(-distance / DISTANCE_SCALE_KM))
+
+    return np.where(eligible, scores, -np.inf)
+
+
+def groups(f):
+    """(sources, candidates) positions that can match at all: same species, opposite gender"""
+    for kind in np.unique(f.species):
+        for male in (True, False):
+            sources = np.flatnonzero((f.species == kind) & (f.male == male))
+            candidates = np.flatnonzero((f.species == kind) & (f.male != male))
+            if len(sources) and len(candidates):
+                yield sources, candidates
+
+
+def top_candidates(f, sources, candidates, k, chunk_size=4096):
+    """Yield (source position, [(candidate position, score), ...]) best first"""
+    k = min(k, len(candidates))
+    chunk_size = max(chunk_size, k)
+    best_scores = np.empty((len(sources), 0))
+    best = np.empty((len(sources), 0), dtype=np.int64)
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        # The running top K competes with the new chunk; nothing else is kept
+        scores = np.concatenate([best_scores, score(f, sources, chunk)], axis=1)
+        positions = np.concatenate([best, np.broadcast_to(chunk, (len(sources), len(chunk)))], axis=1)
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best = np.take_along_axis(positions, keep, axis=1)
+    for row, source in enumerate(sources):
+        # Best score first, ties broken by the older pet
+        order = np.lexsort((best[row], -best_scores[row]))
+        yield source, [(int(best[row, i]), float(best_scores[row, i]))
+                       for i in order if np.isfinite(best_scores[row, i])]
+
+
+def stale_sources(f, since, k, batch_size=512, chunk_size=4096):
+    """Ids of pets whose top K may have changed since ``since``"""
+    changed = set(Pet.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+    stale = set(changed)
+    stale.update(Recommendation.objects.filter(candidate__updated_at__gte=since).values_list('pet_id', flat=True))
+
+    # A changed pet may now outscore the weakest entry of someone else's list
+    changed_positions = f.positions(changed)
+    if len(changed_positions):
+        # Pets with a full list must beat its weakest score, others just need a match
+        threshold = np.full(len(f), -np.inf)
+        full = (Recommendation.objects.order_by().values('pet_id')
+                .annotate(n=Count('id'), low=Min('score')).filter(n__gte=k))
+        lows = dict(full.values_list('pet_id', 'low'))
+        positions = f.positions(lows)
+        threshold[positions] = [lows[pk] for pk in f.ids[positions].tolist()]
+        for sources, candidates in groups(f):
+            changed_candidates = np.intersect1d(candidates, changed_positions)
+            if not len(changed_candidates):
+                continue
+            for start in range(0, len(sources), batch_size):
+                block = sources[start:start + batch_size]
+                best = np.full(len(block), -np.inf)
+                for offset in range(0, len(changed_candidates), chunk_size):
+                    chunk = changed_candidates[offset:offset + chunk_size]
+                    best = np.maximum(best, score(f, block, chunk).max(axis=1))
+                stale.update(f.ids[block[best > threshold[block]]].tolist())
+
+    return stale
+
+
+def recompute(f, pet_ids=None, k=None, batch_size=512, chunk_size=4096):
+    """
+    Rescore ``pet_ids`` (every eligible pet when None) and replace their
+    stored recommendations. Returns the number of pets scored.
+    """
+    k = k or get_top_k()
+    wanted = np.arange(len(f)) if pet_ids is None else f.positions(pet_ids)
+    scored = set()
+
+    for group, candidates in groups(f):
+        sources = np.intersect1d(group, wanted)
+        for start in range(0, len(sources), batch_size):
+            block = sources[start:start + batch_size]
+            rows = [
+                Recommendation(pet_id=int(f.ids[source]), candidate_id=int(f.ids[c]), score=value, rank=rank)
+                for source, picks in top_candidates(f, block, candidates, k, chunk_size)
+                for rank, (c, value) in enumerate(picks)
+            ]
+            with transaction.atomic():
+                Recommendation.objects.filter(pet_id__in=f.ids[block].tolist()).delete()
+                Recommendation.objects.bulk_create(rows)
+            scored.update(f.ids[block].tolist())
+
+    # Pets that stopped being eligible, or have nobody to match, keep no stale suggestions
+    if pet_ids is None:
+        Recommendation.objects.exclude(pet_id__in=eligible_pets()).delete()
+    leftover = (set(pet_ids or ()) | set(f.ids[wanted].tolist())) - scored
+    if leftover:
+        Recommendation.objects.filter(pet_id__in=leftover).delete()
+    return len(scored)
+
+
+def update(full=False, k=None, batch_size=512, chunk_size=4096):
+    """Rescore what changed since the last finished run (everything if ``full``)"""
+    k = k or get_top_k()
+    last = RecommendationRun.objects.filter(finished_at__isnull=False).first()
+    # Taken before reading any pet so edits made during the run are seen next time
+    run = RecommendationRun.objects.create(started_at=timezone.now())
+
+    f = Features.load()
+    pet_ids = None if full or last is None else stale_sources(f, last.started_at, k, batch_size, chunk_size)
+    run.pets_scored = recompute(f, pet_ids, k, batch_size, chunk_size)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['pets_scored', 'finished_at'])
+    return run
+
+
+def get_recommendations(pets, limit=None):
+    """Stored suggestions per pet id for ``pets``, skipping candidates no longer available"""
+    limit = limit or get_top_k()
+    rows = (
+        Recommendation.objects
+        .filter(pet__in=pets, rank__lt=limit,
+                candidate__is_active=True, candidate__is_available_for_mating=True)
+        .select_related('candidate')
+        .order_by('pet', 'rank')
+    )
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.pet_id].append(row)
+    return grouped
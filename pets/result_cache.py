@@ -0,0 +1,140 @@
+"""
+Cache of search result pages, stored as id lists rather than HTML.
+
+Entries are keyed by the normalized PetSearchForm data plus a generation
+token. A search restricted to one species reads that species' generation;
+an unrestricted search reads the ``*`` generation. Saving or deleting a pet
+replaces the generations of its species (old and new) and ``*``, so a new
+cat never evicts cached dog searches. Stale entries are never deleted, they
+just stop being read and age out with the timeout.
+
+Generations live in the default cache, whose shared level all workers read
+(see ``pets.tiered_cache``), so an invalidation in one worker reaches the
+others within ``L1_TIMEOUT``. A new generation is a random token written
+with a plain ``set()`` rather than an ``incr()``, which the database cache
+implements as a read followed by a write: two workers bumping at once could
+both write the same number and one change would go unseen.
+
+Hit and miss counts are kept per process, like ``TieredCache.stats``: in
+the shared cache every count would be another write to the cache table on
+each search.
+"""
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Pet
+from .pagination import KeysetPage
+from .search import filter_key
+
+
+DEFAULT_TIMEOUT = 600
+ALL_SPECIES = '*'
+
+CHANGED_KEY = 'search:changed'
+
+_unknown = object()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _generation_key(species):
+    return f'search:gen:{species}'
+
+
+def _new_generation():
+    return uuid.uuid4().hex[:12]
+
+
+def generation(cleaned_data):
+    """Current generation for the slice of pets a filter set can return"""
+    key = _generation_key(cleaned_data.get('species') or ALL_SPECIES)
+    value = cache.get(key)
+    if value is None:
+        # First reader wins, so concurrent workers agree on the value
+        cache.add(key, _new_generation(), None)
+        value = cache.get(key)
+    return value
+
+
+def invalidate(*species):
+    """Start new generations for the pets of the given species"""
+    values = {_generation_key(value): _new_generation() for value in set(species) | {ALL_SPECIES}}
+    values[CHANGED_KEY] = timezone.now()
+    cache.set_many(values, None)
+
+
+def changed_at():
+    """When a pet was last saved or deleted, if the cache still knows (see pets.conditional)"""
+    value = cache.get(CHANGED_KEY, _unknown)
+    if value is _unknown:
+        # Store the None too, so every request doesn't miss in the shared cache
+        cache.add(CHANGED_KEY, None, None)
+        value = None
+    return value
+
+
+def invalidate_all():
+    invalidate(*[value for value, _ in Pet.SPECIES_CHOICES])
+
+
+def _page_key(cleaned_data, cursor, page_size):
+    return f'search:ids:{generation(cleaned_data)}:{filter_key(cleaned_data)}:{page_size}:{cursor or ""}'
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def lookup(cleaned_data, cursor, page_size):
+    """Return the cached KeysetPage for this search, or None on a miss"""
+    entry = cache.get(_page_key(cleaned_data, cursor, page_size))
+    if entry is None:
+        _count('misses')
+        return None
+    _count('hits')
+
+    pets = Pet.objects.in_bulk(entry['ids'])
+    items = []
+    for position, pk in enumerate(entry['ids']):
+        if pk in pets:
+            pet = pets[pk]
+            # Restore per-row annotations such as distance_km or search_rank
+            for name, values in entry['annotations'].items():
+                setattr(pet, name, values[position])
+            items.append(pet)
+    return KeysetPage(items, entry['next'])
+
+
+def store(cleaned_data, cursor, paginator, page):
+    """Cache ``page`` together with the annotations its ordering depends on"""
+    model_fields = {field.name for field in Pet._meta.get_fields()}
+    annotations = [name for name, _ in paginator._fields() if name not in model_fields]
+    entry = {
+        'ids': [pet.pk for pet in page.items],
+        'annotations': {name: [getattr(pet, name) for pet in page.items] for name in annotations},
+        'next': page.next_cursor,
+    }
+    cache.set(
+        _page_key(cleaned_data, cursor, paginator.page_size), entry,
+        getattr(settings, 'SEARCH_RESULT_CACHE_TIMEOUT', DEFAULT_TIMEOUT),
+    )
+
+
+def stats():
+    """Page hits and misses of this process"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,221 @@
+"""
+Pet search: structured filters plus a full-text index per database vendor.
+
+The full-text index lives in a side table keyed by pet id (an FTS5 virtual
+table on SQLite, a tsvector column with a GIN index on PostgreSQL) and is
+kept current by the Pet save/delete signals in ``pets.signals``.
+"""
+import hashlib
+import json
+import re
+from datetime import timedelta
+
+from django.db import connections, router
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .breeds import resolve_breed
+from .models import Pet
+
+
+SEARCH_FIELDS = ('name', 'breed', 'description', 'color', 'location')
+
+# Ordering used for ranked full-text results (see KeysetPaginator)
+RANKED_ORDERING = ('-search_rank', '-id')
+
+
+def normalize_filters(cleaned_data):
+    """Stable, hashable form of the filters that actually narrow results"""
+    normalized = {}
+    for name, value in cleaned_data.items():
+        if name == 'is_available_for_mating' or value in (None, '', False):
+            continue
+        if isinstance(value, str):
+            value = ' '.join(value.lower().split())
+        normalized[name] = value
+    return normalized
+
+
+def filter_key(cleaned_data):
+    """Short cache key fragment identifying a filter set"""
+    raw = json.dumps(normalize_filters(cleaned_data), sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def breed_condition(cleaned_data):
+    """``Q`` for the breed filter, or None when there is none"""
+    if not cleaned_data.get('breed'):
+        return None
+    # Known breeds (and typos of them) become an integer match on breed_ref
+    breed_id = resolve_breed(cleaned_data['breed'], cleaned_data.get('species') or None)
+    if breed_id is not None:
+        # Rows nothing has linked to a canonical breed yet still match on text
+        return Q(breed_ref_id=breed_id) | Q(breed_ref__isnull=True, breed__icontains=cleaned_data['breed'])
+    return Q(breed__icontains=cleaned_data['breed'])
+
+
+def apply_filters(queryset, cleaned_data, skip=()):
+    """Apply the structured PetSearchForm filters, except those named in ``skip``"""
+    if 'species' not in skip and cleaned_data.get('species'):
+        queryset = queryset.filter(species=cleaned_data['species'])
+
+    breed = None if 'breed' in skip else breed_condition(cleaned_data)
+    if breed is not None:
+        queryset = queryset.filter(breed)
+
+    if 'gender' not in skip and cleaned_data.get('gender'):
+        queryset = queryset.filter(gender=cleaned_data['gender'])
+
+    if cleaned_data.get('location'):
+        queryset = queryset.filter(location__icontains=cleaned_data['location'])
+
+    if 'is_vaccinated' not in skip and cleaned_data.get('is_vaccinated'):
+        queryset = queryset.filter(is_vaccinated=True)
+
+    # Age filtering
+    if cleaned_data.get('min_age') is not None or cleaned_data.get('max_age') is not None:
+        today = timezone.now().date()
+        if cleaned_data.get('min_age') is not None:
+            min_date = today - timedelta(days=cleaned_data['min_age'] * 365)
+            queryset = queryset.filter(date_of_birth__lte=min_date)
+
+        if cleaned_data.get('max_age') is not None:
+            max_date = today - timedelta(days=cleaned_data['max_age'] * 365)
+            queryset = queryset.filter(date_of_birth__gte=max_date)
+
+    return queryset
+
+
+class SearchBackend:
+    """Fallback for databases without a native full-text engine"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index_pet(self, pet):
+        pass
+
+    def remove_pet(self, pet_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, queryset, text):
+        """Filter ``queryset`` to matches of ``text`` annotated with ``search_rank``"""
+        condition = Q()
+        for term in re.findall(r'\w+', text):
+            term_q = Q()
+            for field in SEARCH_FIELDS:
+                term_q |= Q(**{f'{field}__icontains': term})
+            condition &= term_q
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 virtual table ``pets_pet_fts`` whose rowid is the pet id"""
+
+    # bm25 column weights, in SEARCH_FIELDS order
+    WEIGHTS = (10.0, 8.0, 1.0, 2.0, 4.0)
+
+    def index_pet(self, pet):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM pets_pet_fts WHERE rowid = %s', [pet.pk])
+            cursor.execute(
+                'INSERT INTO pets_pet_fts (rowid, name, breed, description, color, location) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [pet.pk] + [getattr(pet, field) or '' for field in SEARCH_FIELDS],
+            )
+
+    def remove_pet(self, pet_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM pets_pet_fts WHERE rowid = %s', [pet_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM pets_pet_fts')
+            cursor.execute(
+                'INSERT INTO pets_pet_fts (rowid, name, breed, description, color, location) '
+                'SELECT id, name, breed, description, color, location FROM pets_pet'
+            )
+
+    def to_query(self, text):
+        # Quote every token so user input can never reach FTS5 query syntax
+        return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+    def search(self, queryset, text):
+        query = self.to_query(text)
+        if not query:
+            return queryset.none()
+        weights = ', '.join(str(w) for w in self.WEIGHTS)
+        return queryset.filter(
+            id__in=RawSQL('SELECT rowid FROM pets_pet_fts WHERE pets_pet_fts MATCH %s', [query]),
+        ).annotate(search_rank=RawSQL(
+            # bm25() is "lower is better"; negate it so every backend sorts descending
+            f'SELECT -bm25(pets_pet_fts, {weights}) FROM pets_pet_fts '
+            f'WHERE pets_pet_fts MATCH %s AND rowid = "pets_pet"."id"',
+            [query],
+            output_field=FloatField(),
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Weighted tsvector in ``pets_pet_search`` with a GIN index"""
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(breed, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(color, '')), 'C') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'D')"
+    )
+
+    def index_pet(self, pet):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO pets_pet_search (pet_id, document) '
+                f'SELECT id, {self.DOCUMENT_SQL} FROM pets_pet WHERE id = %s '
+                f'ON CONFLICT (pet_id) DO UPDATE SET document = EXCLUDED.document',
+                [pet.pk],
+            )
+
+    def remove_pet(self, pet_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM pets_pet_search WHERE pet_id = %s', [pet_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('TRUNCATE pets_pet_search')
+            cursor.execute(
+                f'INSERT INTO pets_pet_search (pet_id, document) '
+                f'SELECT id, {self.DOCUMENT_SQL} FROM pets_pet'
+            )
+
+    def search(self, queryset, text):
+        if not re.search(r'\w', text):
+            return queryset.none()
+        return queryset.filter(
+            id__in=RawSQL(
+                "SELECT pet_id FROM pets_pet_search "
+                "WHERE document @@ websearch_to_tsquery('english', %s)",
+                [text],
+            ),
+        ).annotate(search_rank=RawSQL(
+            "SELECT ts_rank(document, websearch_to_tsquery('english', %s)) "
+            "FROM pets_pet_search WHERE pet_id = \"pets_pet\".\"id\"",
+            [text],
+            output_field=FloatField(),
+        ))
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using=None):
+    """Return the full-text backend for the database Pet rows live in"""
+    connection = connections[using or router.db_for_write(Pet)]
+    return BACKENDS.get(connection.vendor, SearchBackend)(connection)
@@ -0,0 +1,144 @@
+"""
+Signal handlers that keep derived data in sync with Pet rows
+"""
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .breeds import reset_breed_index, resolve_breed
+from .columnar import get_columnar_index
+from .geo import locate_owner, locate_pet
+from .counters import track
+from .events import notify_match, publish
+from .images import IMAGE_FIELDS, build_variants
+from .models import Breed, BreedAlias, Favorite, Match, OwnerProfile, Pet, Vaccination
+from .result_cache import invalidate, invalidate_all
+from .search import get_search_backend
+from .storage import file_names, retain
+
+
+@receiver(pre_save, sender=Pet)
+def geocode_pet(sender, instance, raw, **kwargs):
+    if not raw:
+        locate_pet(instance)
+
+
+@receiver(pre_save, sender=Pet)
+def link_canonical_breeds(sender, instance, raw, **kwargs):
+    if not raw:
+        instance.breed_ref_id = resolve_breed(instance.breed, instance.species)
+        instance.preferred_breed_ref_id = resolve_breed(instance.preferred_breed, instance.species)
+
+
+@receiver([post_save, post_delete], sender=Breed)
+@receiver([post_save, post_delete], sender=BreedAlias)
+def reload_breed_index(sender, **kwargs):
+    reset_breed_index()
+    # Breed text filters may now resolve to a different canonical breed
+    invalidate_all()
+
+
+@receiver(pre_save, sender=OwnerProfile)
+def geocode_owner(sender, instance, raw, **kwargs):
+    if not raw:
+        locate_owner(instance)
+
+
+@receiver(post_save, sender=Pet)
+def index_pet_for_search(sender, instance, using, **kwargs):
+    get_search_backend(using).index_pet(instance)
+
+
+@receiver(post_delete, sender=Pet)
+def remove_pet_from_search(sender, instance, using, **kwargs):
+    get_search_backend(using).remove_pet(instance.pk)
+
+
+@receiver(post_save, sender=Pet)
+def update_search_columns(sender, instance, using, **kwargs):
+    index = get_columnar_index()
+    if index is not None:
+        transaction.on_commit(lambda: index.upsert(instance), using=using)
+
+
+@receiver(post_delete, sender=Pet)
+def remove_from_search_columns(sender, instance, using, **kwargs):
+    index = get_columnar_index()
+    if index is not None:
+        pk = instance.pk
+        transaction.on_commit(lambda: index.remove(pk), using=using)
+
+
+@receiver(post_init, sender=Pet)
+def remember_species(sender, instance, **kwargs):
+    # Read from __dict__ so deferred loads (.only()) don't fetch the column
+    instance._loaded_species = instance.__dict__.get('species')
+
+
+@receiver([post_save, post_delete], sender=Pet)
+def invalidate_search_results(sender, instance, using, **kwargs):
+    # A pet moved between species drops out of its old species' results too
+    species = {instance.species, instance._loaded_species} - {None}
+    instance._loaded_species = instance.species
+    transaction.on_commit(lambda: invalidate(*species), using=using)
+
+
+@receiver(post_init, sender=Match)
+def remember_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, created, using, raw, **kwargs):
+    if raw:
+        return
+    previous = None if created else instance._loaded_status
+    instance._loaded_status = instance.status
+    track(instance, previous, instance.status, using)
+    notify_match(instance, previous, using)
+
+
+@receiver(post_delete, sender=Match)
+def uncount_match(sender, instance, using, **kwargs):
+    track(instance, instance._loaded_status or instance.status, None, using)
+
+
+@receiver(post_save, sender=Favorite)
+def notify_favorite(sender, instance, created, using, raw, **kwargs):
+    if created and not raw:
+        owner_id, pet_id, name = instance.pet.owner_id, instance.pet_id, instance.pet.name
+        transaction.on_commit(lambda: publish(owner_id, 'favorite', pet=pet_id, pet_name=name), using=using)
+
+
+@receiver(post_init, sender=Pet)
+@receiver(post_init, sender=OwnerProfile)
+@receiver(post_init, sender=Vaccination)
+def remember_files(sender, instance, **kwargs):
+    instance._loaded_files = file_names(instance)
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=OwnerProfile)
+@receiver(post_save, sender=Vaccination)
+def files_saved(sender, instance, using, raw, **kwargs):
+    loaded, current = instance._loaded_files, file_names(instance)
+    instance._loaded_files = current
+    # Only fields known before and after the save: deferred ones can't have changed
+    fields = loaded.keys() & current.keys()
+    retain([loaded[field] for field in fields], [current[field] for field in fields], using)
+    if raw:
+        return
+    changed = {
+        current[field] for field in fields & set(IMAGE_FIELDS.get(sender, ()))
+        if current[field] and current[field] != loaded[field]
+    }
+    if changed:
+        storage = sender._meta.get_field(IMAGE_FIELDS[sender][0]).storage
+        transaction.on_commit(lambda: build_variants(storage, changed), using=using)
+
+
+@receiver(post_delete, sender=Pet)
+@receiver(post_delete, sender=OwnerProfile)
+@receiver(post_delete, sender=Vaccination)
+def release_files(sender, instance, using, **kwargs):
+    retain(file_names(instance).values(), (), using)
@@ -0,0 +1,154 @@
+"""
+Content-addressed media storage.
+
+Uploaded photos and certificates are stored once per distinct content under
+``blobs/<sha256[:2]>/<sha256><ext>``, whatever name they were uploaded as,
+so seeding every pet of a breed with the same photo, re-running the photo
+commands or re-uploading a file writes nothing new.
+
+A ``Blob`` row per file counts the model fields pointing at it; the signal
+handlers move the counts as rows change. Unreferenced blobs are not
+deleted straight away, because a concurrent upload of the same content may
+be about to claim them: ``collect_media`` removes the ones that stayed
+unreferenced for a grace period. Only names under ``blobs/`` are tracked:
+files stored before content addressing, such as the sample photos the repo
+ships under ``pet_photos/``, are never counted or deleted.
+"""
+import hashlib
+import posixpath
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+PREFIX = 'blobs'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """``FileSystemStorage`` that names files after the SHA-256 of their content"""
+
+    # A stored name always maps to the same bytes
+    immutable = True
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        ext = posixpath.splitext(name)[1].lower()
+        return f'{PREFIX}/{digest[:2]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        name = self.blob_name(name, content)
+        if not self.exists(name):
+            name = super()._save(name, content)
+        Blob = apps.get_model('pets', 'Blob')
+        # Touching a reused blob restarts its grace period, so collect_media
+        # can't remove it before the row that uploaded it is saved
+        if not Blob.objects.filter(name=name).update(updated_at=timezone.now()):
+            Blob.objects.get_or_create(name=name, defaults={'size': content.size})
+        return name
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{PREFIX}/')
+
+
+def file_fields(model):
+    return [field.attname for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+
+
+def file_names(instance):
+    """Stored names of ``instance``'s loaded file fields; deferred ones are left out"""
+    names = {}
+    for field in file_fields(type(instance)):
+        if field in instance.__dict__:
+            value = instance.__dict__[field]
+            names[field] = getattr(value, 'name', value)
+    return names
+
+
+def _size(name):
+    try:
+        return blob_storage.size(name)
+    except OSError:
+        return 0
+
+
+def retain(old_names, new_names, using=None):
+    """Move references from the names in ``old_names`` to those in ``new_names``"""
+    delta = Counter(name for name in new_names if is_blob(name))
+    delta.subtract(name for name in old_names if is_blob(name))
+    by_delta = defaultdict(list)
+    for name, n in delta.items():
+        if n:
+            by_delta[n].append(name)
+
+    Blob = apps.get_model('pets', 'Blob')
+    blobs = Blob.objects.using(using)
+    now = timezone.now()
+    for n, names in by_delta.items():
+        if blobs.filter(name__in=names).update(refs=F('refs') + n, updated_at=now) == len(names) or n < 0:
+            continue
+        # Blobs written before their row existed get it on first use
+        missing = set(names).difference(blobs.filter(name__in=names).values_list('name', flat=True))
+        blobs.bulk_create([Blob(name=name, size=_size(name), refs=n) for name in missing], ignore_conflicts=True)
+
+
+def referenced_names():
+    """How many rows of every model with file fields point at each stored name"""
+    counts = Counter()
+    for model in apps.get_app_config('pets').get_models():
+        for field in file_fields(model):
+            counts.update(model._default_manager.filter(**{f'{field}__startswith': f'{PREFIX}/'})
+                          .values_list(field, flat=True).iterator())
+    return counts
+
+
+def recount():
+    """Rebuild the reference counts from the model rows (after bulk updates)"""
+    Blob = apps.get_model('pets', 'Blob')
+    counts = referenced_names()
+    now = timezone.now()
+    with transaction.atomic():
+        for blob in Blob.objects.select_for_update().filter(name__startswith=f'{PREFIX}/'):
+            refs = counts.pop(blob.name, 0)
+            if blob.refs != refs:
+                Blob.objects.filter(pk=blob.pk).update(refs=refs, updated_at=now)
+        Blob.objects.bulk_create([Blob(name=name, refs=n) for name, n in counts.items()])
+
+
+def collect(grace=timedelta(hours=1), dry_run=False):
+    """Delete files unreferenced for longer than ``grace``; returns (files, bytes)"""
+    from .images import delete_variants
+
+    Blob = apps.get_model('pets', 'Blob')
+    cutoff = timezone.now() - grace
+    files = size = 0
+    unreferenced = Blob.objects.filter(name__startswith=f'{PREFIX}/', refs__lte=0, updated_at__lt=cutoff)
+    for pk in list(unreferenced.values_list('pk', flat=True)):
+        with transaction.atomic():
+            # Re-check under the lock: an upload may have just claimed it
+            blob = Blob.objects.select_for_update().filter(pk=pk, refs__lte=0, updated_at__lt=cutoff).first()
+            if blob is None:
+                continue
+            files += 1
+            size += blob.size
+            if dry_run:
+                continue
+            blob.delete()
+            name = blob.name
+            transaction.on_commit(lambda name=name: (blob_storage.delete(name), delete_variants(name)))
+    return files, size
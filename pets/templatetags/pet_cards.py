@@ -0,0 +1,30 @@
+from django import template
+from django.template.defaultfilters import floatformat
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
+from pets.cards import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def pet_cards(pets, distance=False):
+    """
+    The cards of ``pets`` for a ``.pet-grid``, from the card cache. With
+    ``distance`` each card also shows the pet's ``distance_km``.
+    """
+    pets = list(pets)
+    rows = []
+    for pet, card in zip(pets, render_cards(pets)):
+        extra = ''
+        if distance:
+            extra = format_html(
+                '<div class="pet-info" style="padding: 0 15px 15px;"><span>{} km away</span></div>',
+                floatformat(pet.distance_km, 0),
+            )
+        rows.append((reverse('pet_detail', args=[pet.pk]), card, extra))
+    return format_html_join(
+        '\n', '<div class="pet-card" onclick="window.location.href=\'{}\'">{}{}</div>', rows,
+    )
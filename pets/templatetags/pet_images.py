@@ -0,0 +1,43 @@
+from django import template
+from django.utils.html import format_html
+
+from pets import images
+
+
+register = template.Library()
+
+# Swap in the fallback without letting the browser re-pick from srcset
+FALLBACK_JS = (
+    "this.onerror=null;"
+    "this.parentNode.querySelectorAll('source').forEach(s=>s.remove());"
+    "this.removeAttribute('srcset');"
+    "this.src=this.dataset.fallback"
+)
+
+
+@register.filter
+def placedog(seed, size='600/400'):
+    """Placeholder photo URL, e.g. ``{{ pet.id|placedog:"400/300" }}``"""
+    return f'https://placedog.net/{size}?id={seed}'
+
+
+@register.simple_tag
+def picture(image, alt='', sizes='100vw', variant='card', style='', fallback='', loading='lazy'):
+    """
+    Responsive ``<picture>`` for an uploaded image: WebP and JPEG renditions
+    in ``srcset`` and ``variant`` as the plain ``src``. Images whose
+    renditions have not been built yet render as a plain ``<img>``.
+    """
+    extra = format_html(' style="{}"', style) if style else ''
+    if fallback:
+        extra += format_html(' data-fallback="{}" onerror="{}"', fallback, FALLBACK_JS)
+    if not images.has_variants(image):
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, extra)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="{}" decoding="async"{}>'
+        '</picture>',
+        images.srcset(image, 'webp'), sizes,
+        images.variant_url(image, variant), images.srcset(image, 'jpg'), sizes, alt, loading, extra,
+    )
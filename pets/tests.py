@@ -1,3 +1,1628 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gc
+import importlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import struct
+import tempfile
+import unittest
+import unittest.mock
+import warnings
+import zlib
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.http.multipartparser import MultiPartParser
+from django.db import close_old_connections, connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import result_cache
+from .breeds import BreedIndex, resolve_breed
+from .cards import card_key, render_cards
+from .columnar import get_columnar_index
+from .counters import get_match_counts, recount
+from .events import InProcessBroker, PostgresBroker, get_broker, publish
+from .fetcher import FetchError, PhotoFetcher, apply_photos, download_photos
+from .geo import DISTANCE_ORDERING, covering_cells, encode_geohash, geocode, locate_pet, nearest, within_radius
+from .images import VARIANTS, generate_variants, srcset, variant_name, variant_widths
+from .media import CHUNK_SIZE
+from .middleware import DuplicateQueryMiddleware
+from .models import Blob, Breed, Pet, Match, MatchCounter, Favorite, OwnerProfile, Recommendation, Vaccination
+from .pagination import InvalidCursor, KeysetPaginator, get_page_size
+from .recommendations import Features, eligible_pets, groups, top_candidates, update
+from .search import RANKED_ORDERING, SearchBackend, apply_filters, get_search_backend
+from .storage import blob_storage, collect
+from .tiered_cache import Entry, TieredCache
+from .uploads import BoundedImageField, BoundedUploadHandler
+from .views import event_stream, pet_detail
+
+
+def seed_catalog(owners=20, pets_per_owner=50):
+    """Bulk-create a catalog big enough for the planner to prefer indexes"""
+    users = User.objects.bulk_create([
+        User(username=f'owner{i}', email=f'owner{i}@example.com') for i in range(owners)
+    ])
+    OwnerProfile.objects.bulk_create([OwnerProfile(user=user, phone='555-0100') for user in users])
+
+    species = [choice for choice, _ in Pet.SPECIES_CHOICES]
+    Pet.objects.bulk_create([
+        Pet(
+            owner=user,
+            name=f'Pet {u}-{i}',
+            species=species[i % len(species)],
+            breed='Shih Tzu' if i % 2 else 'Golden Retriever',
+            gender='M' if i % 2 else 'F',
+            date_of_birth=date(2015, 1, 1) + timedelta(days=(u * pets_per_owner + i) % 3000),
+            weight=10,
+            is_vaccinated=bool(i % 3),
+            is_active=i % 10 != 0,
+            is_available_for_mating=i % 7 != 0,
+            location='San Francisco, CA',
+        )
+        for u, user in enumerate(users)
+        for i in range(pets_per_owner)
+    ])
+
+    pets = list(Pet.objects.order_by('id'))
+    Match.objects.bulk_create([
+        Match(from_pet=pets[i], to_pet=pets[-1 - i]) for i in range(0, len(pets) // 2, 5)
+    ])
+    Favorite.objects.bulk_create([
+        Favorite(user=users[i % owners], pet=pets[i]) for i in range(0, len(pets), 7)
+    ])
+    return users
+
+
+def encode_values(values):
+    """A hand-made page token, as a client could tamper with one"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@override_settings(SEARCH_PAGE_SIZE=24, SEARCH_MAX_PAGE_SIZE=100)
+class KeysetPaginationTests(TestCase):
+    """Pages tile the ordering exactly and bad tokens never reach the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(owners=2, pets_per_owner=25)
+        # Ties on the leading key must still be split by id
+        Pet.objects.filter(pk__in=Pet.objects.order_by('id').values('pk')[:30]).update(
+            created_at=timezone.now() - timedelta(days=1),
+        )
+
+    def test_page_size_clamped(self):
+        self.assertEqual(get_page_size(), 24)
+        self.assertEqual(get_page_size('10'), 10)
+        self.assertEqual(get_page_size('5000'), 100)
+        self.assertEqual(get_page_size('0'), 1)
+        self.assertEqual(get_page_size('-3'), 1)
+        self.assertEqual(get_page_size('lots'), 24)
+
+    def test_pages_are_contiguous(self):
+        pets = Pet.objects.all()
+        expected = list(pets.order_by('-created_at', '-id').values_list('pk', flat=True))
+        paginator = KeysetPaginator(pets, page_size=7)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            self.assertLessEqual(len(page), 7)
+            seen += [pet.pk for pet in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_tampered_cursors(self):
+        paginator = KeysetPaginator(Pet.objects.all())
+        for cursor in ('!!!', 'abc', 'é', encode_values({'a': 1}), encode_values([1]),
+                       encode_values([123, 5]), encode_values(['yesterday', 5]),
+                       encode_values(['2020-01-01T00:00:00', None]), encode_values([[1], {}])):
+            with self.assertRaises(InvalidCursor, msg=cursor):
+                paginator.decode_cursor(cursor)
+
+        ranked = KeysetPaginator(Pet.objects.all(), ('-search_rank', '-id'))
+        self.assertEqual(ranked.decode_cursor(encode_values([1.5, 3])), [1.5, 3])
+        with self.assertRaises(InvalidCursor):
+            ranked.decode_cursor(encode_values(['1.5', 3]))
+
+        # The view falls back to the first page
+        response = self.client.get(reverse('search_pets') + '?after=' + encode_values([123, 5]))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SEARCH_COLUMNAR_INDEX=None)
+class SearchIndexPlanTests(TestCase):
+    """The listing views must be served from indexes, never a full table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN ' + sql)
+                plan = [row[0] for row in cursor.fetchall()]
+                return [line for line in plan if re.search(r'Seq Scan on "?pets_', line)]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+            return [line for line in plan if re.fullmatch(r'SCAN "?pets_\w+"?( AS \w+)?', line)]
+
+    def assertIndexedView(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        # Captured SQL has its parameters already interpolated by the backend
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and 'pets_' in sql:
+                self.assertEqual(self.full_scans(sql), [], f'{url} falls back to a sequential scan:\n{sql}')
+
+    def test_home(self):
+        self.assertIndexedView(reverse('home'))
+
+    def test_search(self):
+        self.assertIndexedView(reverse('search_pets'))
+        self.assertIndexedView(reverse('search_pets') + '?species=DOG&gender=F')
+        self.assertIndexedView(reverse('search_pets') + '?min_age=2&max_age=6')
+
+    def test_send_match_request(self):
+        self.client.force_login(self.users[0])
+        target = Pet.objects.exclude(owner=self.users[0]).filter(is_active=True).first()
+        self.assertIndexedView(reverse('send_match_request', args=[target.pk]))
+
+    def test_my_matches_and_favorites(self):
+        self.client.force_login(self.users[0])
+        self.assertIndexedView(reverse('my_matches'))
+        self.assertIndexedView(reverse('favorites'))
+
+
+class ColumnarIndexTests(TestCase):
+    """The columnar snapshot pages exactly like the ORM for every filter it supports"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(owners=4, pets_per_owner=30)
+        # Ties on created_at must be split by id the same way
+        Pet.objects.filter(pk__in=Pet.objects.order_by('id').values('pk')[:40]).update(
+            created_at=timezone.now() - timedelta(days=1),
+        )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(SEARCH_COLUMNAR_INDEX=Path(tmp.name) / 'pet_columns.bin'))
+        self.index = get_columnar_index()
+        self.index.build()
+
+    def assertSamePages(self, filters):
+        pets = apply_filters(Pet.objects.filter(is_active=True, is_available_for_mating=True), filters)
+        paginator = KeysetPaginator(pets, page_size=9)
+        self.assertTrue(self.index.supports(filters))
+        orm_cursor = columnar_cursor = None
+        while True:
+            orm = paginator.page(orm_cursor)
+            columnar = self.index.page(paginator, filters, columnar_cursor)
+            self.assertEqual([pet.pk for pet in columnar], [pet.pk for pet in orm], filters)
+            self.assertEqual(columnar.next_cursor, orm.next_cursor)
+            if not orm.has_next:
+                break
+            orm_cursor, columnar_cursor = orm.next_cursor, columnar.next_cursor
+
+    def filter_sets(self):
+        return [
+            {}, {'species': 'DOG'}, {'gender': 'F'}, {'is_vaccinated': True},
+            {'min_age': 3}, {'max_age': 5}, {'min_age': 2, 'max_age': 6},
+            {'species': 'CAT', 'gender': 'M', 'is_vaccinated': True, 'min_age': 1},
+        ]
+
+    def test_matches_orm(self):
+        for filters in self.filter_sets():
+            self.assertSamePages(filters)
+        self.assertFalse(self.index.supports({'breed': 'Beagle'}))
+
+    def test_deltas_match_orm(self):
+        pets = list(Pet.objects.order_by('id')[:3])
+        with self.captureOnCommitCallbacks(execute=True):
+            pets[0].species, pets[0].is_vaccinated = 'CAT', False
+            pets[0].save()
+            pets[1].delete()
+            Pet.objects.create(owner=pets[2].owner, name='Newcomer', species='DOG', breed='Beagle', gender='F',
+                               weight=10, date_of_birth=date(2021, 1, 1))
+        for filters in self.filter_sets():
+            self.assertSamePages(filters)
+
+
+class BreedMatchingTests(TestCase):
+    """Free-text breeds map onto canonical ones, typos included, and old rows still match"""
+
+    def test_trigram_index(self):
+        index = BreedIndex([
+            ('goldenretriever', 1, 'DOG'), ('golden', 1, 'DOG'), ('labradorretriever', 2, 'DOG'),
+            ('shihtzu', 3, 'DOG'), ('persian', 4, 'CAT'),
+        ])
+        self.assertEqual(index.lookup('Shih-Tzu'), 3)
+        self.assertEqual(index.lookup('Golden'), 1)
+        self.assertEqual(index.lookup('Golden Retreiver'), 1)
+        self.assertEqual(index.lookup('shitzu'), 3)
+        self.assertEqual(index.lookup('Persian', species='DOG'), None)
+        self.assertEqual(index.lookup('Persians', species='CAT'), 4)
+        # A fragment shared by several breeds is not a typo of either
+        self.assertIsNone(index.lookup('retriever'))
+        self.assertIsNone(index.lookup('zebra'))
+        self.assertIsNone(index.lookup(''))
+
+    def test_seeded_taxonomy(self):
+        golden = Breed.objects.get(name='Golden Retriever')
+        self.assertEqual(resolve_breed('golden retreiver', 'DOG'), golden.pk)
+        self.assertEqual(resolve_breed('Shih Tzu'), Breed.objects.get(name='Shih Tzu').pk)
+        owner = User.objects.create(username='breeder')
+        pet = Pet.objects.create(owner=owner, name='Goldie', breed='Goldn Retriever', gender='F',
+                                 weight=30, date_of_birth=date(2020, 1, 1))
+        self.assertEqual(pet.breed_ref, golden)
+
+    @override_settings(SEARCH_COLUMNAR_INDEX=None)
+    def test_unlinked_rows_and_backfill(self):
+        # bulk_create skips the pre_save link, like rows saved before the taxonomy
+        seed_catalog(owners=1, pets_per_owner=10)
+        self.assertFalse(Pet.objects.filter(breed_ref__isnull=False).exists())
+        shih_tzus = set(Pet.objects.filter(breed='Shih Tzu', is_active=True, is_available_for_mating=True)
+                        .values_list('pk', flat=True))
+
+        def found():
+            cache.clear()
+            response = self.client.get(reverse('search_pets') + '?breed=Shih+Tzu&page_size=100')
+            return {pet.pk for pet in response.context['pets']}
+
+        self.assertEqual(found(), shih_tzus)
+
+        before = Pet.objects.order_by('pk').values_list('updated_at', flat=True).first()
+        migration = importlib.import_module('pets.migrations.0011_backfill_breed_refs')
+        generation = result_cache.generation({})
+        migration.link_breeds(django_apps, connection.schema_editor())
+        self.assertNotEqual(result_cache.generation({}), generation)
+        shih_tzu = Breed.objects.get(name='Shih Tzu')
+        self.assertEqual(set(Pet.objects.filter(breed_ref=shih_tzu).values_list('breed', flat=True)), {'Shih Tzu'})
+        # Only breeds that don't exist for the pet's species stay unlinked
+        self.assertFalse(Pet.objects.filter(species='DOG', breed_ref__isnull=True).exists())
+        self.assertGreater(Pet.objects.order_by('pk').values_list('updated_at', flat=True).first(), before)
+        self.assertEqual(found(), shih_tzus)
+
+        Pet.objects.update(breed_ref=None)
+        generation = result_cache.generation({'species': 'DOG'})
+        call_command('backfill_breeds', stdout=io.StringIO())
+        self.assertNotEqual(result_cache.generation({'species': 'DOG'}), generation)
+        self.assertEqual(Pet.objects.filter(breed_ref=shih_tzu).count(),
+                         Pet.objects.filter(breed='Shih Tzu', species='DOG').count())
+
+
+@override_settings(SEARCH_COLUMNAR_INDEX=None)
+class FacetTests(TestCase):
+    """Each facet counts what its options would find with the other filters kept"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(owners=3, pets_per_owner=20)
+        call_command('backfill_breeds', stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self, filters):
+        pets = Pet.objects.filter(is_active=True, is_available_for_mating=True)
+
+        def count(without, **extra):
+            return apply_filters(pets, dict(filters, **{without: None}) if without else filters).filter(**extra).count()
+
+        species = {value: count('species', species=value) for value, _ in Pet.SPECIES_CHOICES}
+        gender = {value: count('gender', gender=value) for value, _ in Pet.GENDER_CHOICES}
+        breeds = {breed.name: count('breed', breed_ref=breed) for breed in Breed.objects.all()}
+        return {
+            'species': {value: n for value, n in species.items() if n},
+            'gender': {value: n for value, n in gender.items() if n},
+            'vaccinated': count('is_vaccinated', is_vaccinated=True),
+            'breeds': sorted(((name, n) for name, n in breeds.items() if n), key=lambda item: (-item[1], item[0])),
+            'total': count(None),
+        }
+
+    def test_counts_leave_out_their_own_filter(self):
+        for query in ('', 'species=DOG', 'species=DOG&gender=F&is_vaccinated=on',
+                      'breed=Shih+Tzu&gender=M', 'breed=tzu', 'min_age=3&species=CAT'):
+            response = self.client.get(reverse('search_pets') + '?' + query)
+            facets = response.context['facets']
+            expected = self.expected(getattr(response.context['form'], 'cleaned_data', {}))
+            self.assertEqual({name: facets[name] for name in expected}, expected, query)
+
+        response = self.client.get(reverse('search_pets') + '?species=DOG')
+        self.assertContains(response, f'Cat ({Pet.objects.filter(species="CAT", is_active=True, is_available_for_mating=True).count()})')
+        Pet.objects.create(owner=User.objects.first(), name='Goldie', breed='golden retriever', gender='F',
+                           weight=30, date_of_birth=date(2020, 1, 1))
+        breeds = dict(self.client.get(reverse('search_pets') + '?breed=Shih+Tzu').context['facets']['breeds'])
+        self.assertEqual(breeds['Golden Retriever'], 1)
+
+    def test_top_breeds_limited_in_sql(self):
+        with self.settings(SEARCH_FACET_TOP_BREEDS=1), CaptureQueriesContext(connection) as queries:
+            facets = self.client.get(reverse('search_pets')).context['facets']
+        self.assertEqual(facets['breeds'], self.expected({})['breeds'][:1])
+        breed_query = next(q['sql'] for q in queries if 'GROUP BY' in q['sql'] and '"breed_ref_id"' in q['sql'])
+        self.assertIn('LIMIT 1', breed_query)
+
+    def test_refreshed_by_other_species(self):
+        url = reverse('search_pets') + '?species=DOG'
+        cats = self.client.get(url).context['facets']['species']['CAT']
+        with self.captureOnCommitCallbacks(execute=True):
+            Pet.objects.create(owner=User.objects.first(), name='Tom', species='CAT', breed='Tabby', gender='M',
+                               weight=4, date_of_birth=date(2020, 1, 1))
+        self.assertEqual(self.client.get(url).context['facets']['species']['CAT'], cats + 1)
+
+    def test_radius_searches_keyed_by_place(self):
+        owner = User.objects.first()
+        for name, location in (('Fog', 'San Francisco, CA'), ('Sun', 'Los Angeles, CA')):
+            Pet.objects.create(owner=owner, name=name, species='BIRD', breed='Parrot', gender='F',
+                               weight=1, date_of_birth=date(2020, 1, 1), location=location)
+        totals = [
+            self.client.get(reverse('search_pets') + f'?species=BIRD&location={place}&radius_km=50')
+            .context['facets']['total']
+            for place in ('Los+Angeles,+CA', 'Boston,+MA')
+        ]
+        self.assertEqual(totals, [1, 0])
+
+
+class FullTextSearchTests(TestCase):
+    """Ranked text search on the database's own engine, kept in sync by signals"""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='searcher')
+
+    def add(self, name, description='', breed='Beagle', **fields):
+        return Pet.objects.create(owner=self.owner, name=name, breed=breed, description=description,
+                                  gender='M', weight=10, date_of_birth=date(2020, 1, 1), **fields)
+
+    def search(self, text, backend=None):
+        backend = backend or get_search_backend()
+        return list(backend.search(Pet.objects.all(), text).order_by(*RANKED_ORDERING)
+                    .values_list('name', flat=True))
+
+    def test_ranking(self):
+        self.add('Rex', 'Loves a biscuit after his walk in the park near the river every morning')
+        self.add('Biscuit')
+        self.add('Luna', 'Calm and gentle', breed='Golden Retriever')
+        self.assertEqual(self.search('biscuit'), ['Biscuit', 'Rex'])
+        self.assertEqual(self.search('golden'), ['Luna'])
+        self.assertEqual(self.search('"); DROP TABLE pets_pet; --'), [])
+        # Databases without a full-text engine still filter, unranked
+        self.assertEqual(sorted(self.search('biscuit', SearchBackend(connection))), ['Biscuit', 'Rex'])
+
+    def test_index_follows_saves_and_deletes(self):
+        pet = self.add('Pepper')
+        self.assertEqual(self.search('pepper'), ['Pepper'])
+        pet.name = 'Nutmeg'
+        pet.save()
+        self.assertEqual(self.search('pepper'), [])
+        self.assertEqual(self.search('nutmeg'), ['Nutmeg'])
+        pet.delete()
+        self.assertEqual(self.search('nutmeg'), [])
+
+    def test_ranked_pages(self):
+        for i in range(7):
+            self.add(f'Biscuit {i}')
+            self.add(f'Pet {i}', 'biscuit ' * (i + 1))
+        ranked = get_search_backend().search(Pet.objects.all(), 'biscuit')
+        expected = list(ranked.order_by(*RANKED_ORDERING).values_list('pk', flat=True))
+        self.assertEqual(len(expected), 14)
+
+        paginator = KeysetPaginator(ranked, RANKED_ORDERING, page_size=3)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen += [pet.pk for pet in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+        # The view follows the same order across its own page links
+        url, names = reverse('search_pets') + '?q=biscuit&page_size=5', []
+        while url:
+            response = self.client.get(url)
+            names += [pet.name for pet in response.context['pets']]
+            url = response.context['next_query'] and reverse('search_pets') + '?' + response.context['next_query']
+        self.assertEqual(names, list(Pet.objects.in_bulk(expected)[pk].name for pk in expected))
+
+
+@override_settings(SEARCH_COLUMNAR_INDEX=None)
+class GeoSearchTests(TestCase):
+    """Offline geocoding and radius search over geohash buckets"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='mapper')
+        OwnerProfile.objects.create(user=self.owner, city='Boston', state='MA')
+
+    def add(self, name, location):
+        return Pet.objects.create(owner=self.owner, name=name, breed='Beagle', gender='M', weight=10,
+                                  date_of_birth=date(2020, 1, 1), location=location)
+
+    def test_geocode(self):
+        self.assertEqual(geocode('San Francisco, CA'), (37.7749, -122.4194))
+        self.assertEqual(geocode('san  francisco, California'), (37.7749, -122.4194))
+        self.assertEqual(geocode('Somewhere, CA 94102-1234'), (37.7793, -122.4193))
+        # Unknown zip codes fall back to their 3-digit prefix
+        self.assertEqual(geocode(zipcode='90099'), (34.0522, -118.2437))
+        self.assertIsNone(geocode('Atlantis'))
+        self.assertEqual(geocode(city='Boston', state='Massachusetts'), (42.3601, -71.0589))
+
+    def test_covering_cells(self):
+        lat, lon = geocode('San Francisco, CA')
+        for radius in (1, 20, 300):
+            cells = covering_cells(lat, lon, radius)
+            self.assertLessEqual(len(cells), 32)
+            # Points on the edge of the circle all fall in one of the cells
+            for bearing in range(0, 360, 15):
+                dlat = math.degrees(radius / 6371.0) * math.cos(math.radians(bearing))
+                dlon = math.degrees(radius / 6371.0) * math.sin(math.radians(bearing)) / math.cos(math.radians(lat))
+                geohash = encode_geohash(lat + dlat * 0.999, lon + dlon * 0.999)
+                self.assertTrue(any(geohash.startswith(cell) for cell in cells), (radius, bearing))
+
+    def test_within_radius_and_nearest(self):
+        sf, oakland, la = self.add('Fog', 'San Francisco, CA'), self.add('Bay', 'Oakland, CA'), self.add('Sun', 'Los Angeles, CA')
+        center = geocode('San Francisco, CA')
+
+        found = list(within_radius(Pet.objects.all(), *center, 20).order_by(*DISTANCE_ORDERING))
+        self.assertEqual(found, [sf, oakland])
+        self.assertAlmostEqual(found[1].distance_km, 13, delta=1)
+        self.assertEqual(nearest(Pet.objects.all(), *center, n=3), [sf, oakland, la])
+
+        # A circle with nothing in it offers the closest pets instead
+        response = self.client.get(reverse('search_pets') + '?location=Los+Angeles,+CA&radius_km=1')
+        self.assertEqual(list(response.context['pets']), [la])
+        response = self.client.get(reverse('search_pets') + '?location=San+Diego,+CA&radius_km=5')
+        self.assertEqual(list(response.context['pets']), [])
+        self.assertEqual(response.context['nearby'][0], la)
+        self.assertContains(response, 'These are the closest matches')
+
+    def test_pets_inherit_owner_location(self):
+        pet = self.add('Homebody', 'Unknown place')
+        self.assertEqual((pet.latitude, pet.longitude), (42.3601, -71.0589))
+        pet = Pet.objects.get(pk=pet.pk)
+        with self.assertNumQueries(1):
+            locate_pet(pet)
+        pet = Pet.objects.select_related('owner__owner_profile').get(pk=pet.pk)
+        with self.assertNumQueries(0):
+            locate_pet(pet)
+        self.assertTrue(pet.geohash.startswith('drt'))
+
+    def test_backfill_invalidates_cached_searches(self):
+        pet = self.add('Stray', 'Oakland, CA')
+        Pet.objects.filter(pk=pet.pk).update(latitude=None, longitude=None, geohash='')
+        url = reverse('search_pets') + '?location=Oakland,+CA&radius_km=5'
+        self.assertEqual(list(self.client.get(url).context['pets']), [])
+
+        call_command('geocode_locations', stdout=io.StringIO())
+        self.assertEqual(list(self.client.get(url).context['pets']), [pet])
+
+
+@override_settings(SEARCH_COLUMNAR_INDEX=None)
+class SearchResultCacheTests(TestCase):
+    """Pet changes only evict cached searches whose results they can affect"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(owners=2, pets_per_owner=10)
+
+    def setUp(self):
+        cache.clear()
+        result_cache.reset_stats()
+
+    def search_queries(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('search_pets') + query)
+        return len(queries)
+
+    def test_species_generations(self):
+        cold = self.search_queries('?species=CAT')
+        self.search_queries('?species=DOG')
+        self.assertLess(self.search_queries('?species=CAT'), cold)
+        self.assertEqual(result_cache.stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 0.3333})
+
+        dog = Pet.objects.filter(species='DOG').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.save()
+        # The cat page stays cached, the dog page is rebuilt
+        self.search_queries('?species=CAT')
+        self.search_queries('?species=DOG')
+        self.assertEqual(result_cache.stats()['hits'], 2)
+        self.assertEqual(result_cache.stats()['misses'], 3)
+
+        # Moving a pet to another species invalidates both of them
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.species = 'CAT'
+            dog.save()
+        self.search_queries('?species=CAT')
+        self.assertEqual(result_cache.stats()['misses'], 4)
+
+    def test_warm_search_only_reads_the_cache(self):
+        self.search_queries('?species=DOG')
+        # Another request once this worker's L1 copies have expired
+        cache.clear_local()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('search_pets') + '?species=DOG')
+        cache_queries = [query['sql'] for query in queries if 'pawnder_cache' in query['sql']]
+        self.assertTrue(all(sql.startswith('SELECT "cache_key", "value"') for sql in cache_queries), cache_queries)
+        self.assertLessEqual(len(queries), 8)
+
+        # Within L1_TIMEOUT the shared cache is not asked at all
+        self.assertLessEqual(self.search_queries('?species=DOG'), 2)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'pets.tiered_cache.TieredCache', 'LOCATION': 'shared'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'generation-tests'},
+    })
+    def test_generations_shared_between_workers(self):
+        # Another worker: its own L1, the same shared L2
+        other = TieredCache('shared', {'OPTIONS': {'L1_TIMEOUT': 0}})
+        dogs, cats = result_cache.generation({'species': 'DOG'}), result_cache.generation({'species': 'CAT'})
+        self.assertEqual(other.get('search:gen:DOG'), dogs)
+
+        result_cache.invalidate('DOG')
+        self.assertNotEqual(result_cache.generation({'species': 'DOG'}), dogs)
+        self.assertEqual(other.get('search:gen:DOG'), result_cache.generation({'species': 'DOG'}))
+        self.assertEqual(other.get('search:gen:CAT'), cats)
+        self.assertIsNotNone(other.get(result_cache.CHANGED_KEY))
+
+
+class RecommendationTests(TestCase):
+    """Incremental runs must leave the same suggestions as a full rescore"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(owners=5, pets_per_owner=20)
+
+    def stored(self):
+        return set(Recommendation.objects.values_list('pet_id', 'candidate_id', 'rank'))
+
+    def test_incremental_matches_full(self):
+        update(full=True, k=5)
+        self.assertTrue(self.stored())
+
+        pets = eligible_pets().order_by('id')
+        edited, neutered = pets[0], pets[1]
+        edited.preferred_breed = 'Shih Tzu'
+        edited.save()
+        neutered.is_neutered = True
+        neutered.save()
+
+        run = update(k=5)
+        self.assertLess(run.pets_scored, pets.count())
+        incremental = self.stored()
+        self.assertFalse(Recommendation.objects.filter(candidate=neutered).exists())
+
+        update(full=True, k=5)
+        self.assertEqual(incremental, self.stored())
+
+    def test_chunked_candidates_match_one_block(self):
+        f = Features.load()
+        for sources, candidates in groups(f):
+            whole = list(top_candidates(f, sources, candidates, 5, chunk_size=len(candidates)))
+            chunked = list(top_candidates(f, sources, candidates, 5, chunk_size=7))
+            self.assertEqual(whole, chunked)
+
+    def test_backfills_are_seen_by_incremental_runs(self):
+        update(full=True, k=5)
+        self.assertEqual(update(k=5).pets_scored, 0)
+
+        Pet.objects.update(breed_ref=None, preferred_breed_ref=None)
+        call_command('backfill_breeds', stdout=io.StringIO())
+        self.assertGreater(update(k=5).pets_scored, 0)
+
+        Pet.objects.update(latitude=None, longitude=None)
+        call_command('geocode_locations', stdout=io.StringIO())
+        self.assertGreater(update(k=5).pets_scored, 0)
+
+
+class MatchCounterTests(TestCase):
+    """Signal-maintained counters must agree with a full recount"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(owners=3, pets_per_owner=30)
+
+    def counters(self):
+        return set(MatchCounter.objects.filter(count__gt=0).values_list('user_id', 'direction', 'status', 'count'))
+
+    def test_counters_follow_matches(self):
+        recount()
+        pets = list(Pet.objects.order_by('id'))
+        with self.captureOnCommitCallbacks(execute=True):
+            created = Match.objects.create(from_pet=pets[1], to_pet=pets[-2])
+            Match.objects.filter(status='PENDING').first().delete()
+            created.status = 'ACCEPTED'
+            created.save()
+        tracked = self.counters()
+
+        recount()
+        self.assertEqual(tracked, self.counters())
+
+        owner = pets[-2].owner
+        self.client.force_login(owner)
+        expected = get_match_counts(owner)['RECEIVED']['ACCEPTED']
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('my_matches') + '?status=ACCEPTED')
+        self.assertContains(response, f'Accepted ({expected})')
+
+    def test_bulk_respond(self):
+        recount()
+        owner = self.users[-1]
+        received = list(Match.objects.filter(to_pet__owner=owner, status='PENDING').values_list('pk', flat=True))
+        foreign = Match.objects.exclude(to_pet__owner=owner).first()
+        self.client.force_login(owner)
+
+        # The age cutoff is a separate form, so the selection buttons never send it
+        page = self.client.get(reverse('my_matches')).content.decode()
+        selection = page[page.index('id="bulk-form"'):]
+        self.assertNotIn('older_than_days', selection[:selection.index('</form>')])
+        self.assertIn('older_than_days', page)
+        response = self.client.post(reverse('bulk_respond_to_matches'), {'action': 'accept'})
+        self.assertEqual(response.status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bulk_respond_to_matches'), {
+                'action': 'accept', 'ids': received[:2] + [foreign.pk],
+            })
+        self.assertEqual([row['id'] for row in response.json()['changed']], received[:2])
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.status, 'PENDING')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bulk_respond_to_matches'), {
+                'action': 'reject', 'older_than_days': 0,
+            })
+        self.assertGreater(len(received), 2)
+        self.assertEqual(len(response.json()['changed']), len(received) - 2)
+
+        tracked = self.counters()
+        recount()
+        self.assertEqual(tracked, self.counters())
+
+    def test_bulk_cancel(self):
+        recount()
+        owner = self.users[0]
+        sent = list(Match.objects.filter(from_pet__owner=owner, status='PENDING').values_list('pk', flat=True))
+        received = Match.objects.filter(status='PENDING').exclude(from_pet__owner=owner).first()
+        self.client.force_login(owner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bulk_respond_to_matches'), {
+                'action': 'cancel', 'ids': sent + [received.pk],
+            })
+        self.assertTrue(sent)
+        self.assertEqual(sorted(row['id'] for row in response.json()['changed']), sorted(sent))
+        self.assertEqual(set(Match.objects.filter(pk__in=sent).values_list('status', flat=True)), {'CANCELLED'})
+        received.refresh_from_db()
+        self.assertEqual(received.status, 'PENDING')
+
+        tracked = self.counters()
+        recount()
+        self.assertEqual(tracked, self.counters())
+
+    def test_cancelled_tab(self):
+        recount()
+        match = Match.objects.filter(status='PENDING').select_related('from_pet__owner', 'to_pet__owner').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            match.status = 'CANCELLED'
+            match.save()
+
+        for user, box in ((match.from_pet.owner, 'sent'), (match.to_pet.owner, 'received')):
+            self.client.force_login(user)
+            response = self.client.get(reverse('my_matches') + f'?box={box}&status=CANCELLED')
+            expected = get_match_counts(user)[box.upper()]['CANCELLED']
+            self.assertContains(response, f'Cancelled ({expected})')
+            self.assertContains(response, f'id="match-{match.pk}"')
+
+    def test_mutual_matches(self):
+        recount()
+        a, b, c = (Pet.objects.filter(owner=user).order_by('id')[1] for user in self.users)
+        d = Pet.objects.filter(owner=self.users[0]).order_by('id')[2]
+        Match.objects.bulk_create([Match(from_pet=b, to_pet=a), Match(from_pet=c, to_pet=d), Match(from_pet=d, to_pet=c)])
+        recount()
+
+        # Requesting a pet that already asked for yours accepts both sides
+        self.client.force_login(self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('send_match_request', args=[b.pk]), {'from_pet': a.pk, 'message': ''})
+        self.assertEqual(set(Match.objects.filter(from_pet__in=[a, b], to_pet__in=[a, b]).values_list('status', flat=True)),
+                         {'ACCEPTED'})
+
+        # Pairs created behind the view's back are picked up by the batch command
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('accept_mutual_matches', stdout=io.StringIO())
+        self.assertEqual(set(Match.objects.filter(from_pet__in=[c, d], to_pet__in=[c, d]).values_list('status', flat=True)),
+                         {'ACCEPTED'})
+
+        tracked = self.counters()
+        recount()
+        self.assertEqual(tracked, self.counters())
+
+
+class EventStreamTests(TestCase):
+    """Events published from sync code reach the owner's open stream"""
+
+    async def test_stream_delivers_published_events(self):
+        user = User(pk=4242, username='listener')
+
+        async def auser():
+            return user
+
+        request = AsyncRequestFactory().get(reverse('event_stream'))
+        request.auser = auser
+        response = await event_stream(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'retry:', await anext(chunks))
+        self.assertEqual(get_broker().subscriber_count(), 1)
+
+        # Signal handlers publish from worker threads, not the event loop
+        await asyncio.to_thread(publish, user.pk, 'match_created', match=1, status='PENDING')
+        await asyncio.to_thread(publish, user.pk + 1, 'match_created', match=2, status='PENDING')
+        chunk = await asyncio.wait_for(anext(chunks), 1)
+        self.assertTrue(chunk.startswith(b'event: match_created\n'))
+        self.assertIn(b'"match": 1', chunk)
+
+        # A client disconnect cancels the task waiting for the next event
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    def test_in_process_broker_refuses_several_workers(self):
+        with unittest.mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '3'}):
+            with self.assertRaises(ImproperlyConfigured):
+                InProcessBroker()
+            PostgresBroker()
+        with unittest.mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '1'}):
+            InProcessBroker()
+
+    async def test_postgres_broker_delivers_notifications(self):
+        broker = PostgresBroker()
+        with unittest.mock.patch.object(PostgresBroker, '_start_listener'):
+            with broker.subscribe(7) as queue:
+                # What the listener thread does with each NOTIFY payload
+                payload = json.dumps({'user': 7, 'event': {'type': 'match_created', 'match': 1}})
+                await asyncio.to_thread(broker.receive, payload)
+                event = await asyncio.wait_for(queue.get(), 1)
+        self.assertEqual(event, {'type': 'match_created', 'match': 1})
+
+
+@override_settings(ASYNC_QUERY_THREADS=0)
+class PetDetailTests(TestCase):
+    """The async pet_detail must render the same page as the old sync view"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(owners=2, pets_per_owner=5)
+
+    def test_pet_detail(self):
+        match = Match.objects.select_related('from_pet__owner', 'to_pet').first()
+        url = reverse('pet_detail', args=[match.to_pet.pk])
+
+        self.assertContains(self.client.get(url), 'Login to Send Match Request')
+        self.assertEqual(self.client.get(reverse('pet_detail', args=[0])).status_code, 404)
+
+        self.client.force_login(match.from_pet.owner)
+        self.assertContains(self.client.get(url), 'Match Request Sent')
+
+        self.client.force_login(match.to_pet.owner)
+        self.assertContains(self.client.get(url), 'Edit Profile')
+
+
+@override_settings(ASYNC_QUERY_THREADS=2)
+class PetDetailThreadPoolTests(TransactionTestCase):
+    """pet_detail with its lookups on the query pool, each thread on its own connection"""
+
+    def setUp(self):
+        # Committed rows: pool threads can't see the data of a test transaction
+        seed_catalog(owners=2, pets_per_owner=3)
+
+    def test_pet_detail(self):
+        pet = Pet.objects.select_related('owner').first()
+        self.client.force_login(pet.owner)
+        self.assertContains(self.client.get(reverse('pet_detail', args=[pet.pk])), 'Edit Profile')
+        self.assertEqual(self.client.get(reverse('pet_detail', args=[0])).status_code, 404)
+
+    async def test_failed_lookup_leaves_no_task_behind(self):
+        unretrieved = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        user = await User.objects.afirst()
+
+        async def auser():
+            return user
+
+        request = AsyncRequestFactory().get('/')
+        request.auser = auser
+        # The 404 of the pet lookup must still be retrieved when gather fails first
+        with unittest.mock.patch('pets.views.get_recommendations', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await pet_detail.__wrapped__(request, 0)
+        await asyncio.sleep(0.1)
+        gc.collect()
+        self.assertEqual(unretrieved, [])
+
+
+class ImageVariantTests(TestCase):
+    """Uploads get auto-oriented, EXIF-free renditions used by the templates"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        cache.clear()
+
+    def test_variants_built_on_save(self):
+        # 2000x1000 landscape stored sideways, with the rotation in EXIF
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Secret Camera'
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG', exif=exif)
+
+        owner = User.objects.create(username='photographer')
+        with self.captureOnCommitCallbacks(execute=True):
+            pet = Pet.objects.create(
+                owner=owner, name='Rex', breed='Beagle', gender='M', weight=10,
+                date_of_birth=date(2020, 1, 1), location='Boston, MA',
+                photo1=SimpleUploadedFile('rex.jpg', buffer.getvalue(), 'image/jpeg'),
+            )
+
+        for variant, edge in VARIANTS.items():
+            for ext in ('jpg', 'webp'):
+                with default_storage.open(variant_name(pet.photo1.name, variant, ext)) as f, Image.open(f) as image:
+                    self.assertEqual(image.size, (edge // 2, edge))
+                    self.assertFalse(image.getexif())
+
+        html = Template('{% load pet_images %}{% picture pet.photo1 alt=pet.name %}').render(Context({'pet': pet}))
+        self.assertIn('<source type="image/webp"', html)
+        # Descriptors are the renditions' real widths, not the long-edge bound
+        root = f'/media/variants/{pet.photo1.name[:-4]}'
+        self.assertIn(f'{root}/card.webp 200w, {root}/detail.webp 400w, {root}/full.webp 800w', html)
+        self.assertIn(f'src="{root}/card.jpg"', html)
+
+    def test_small_original_lists_each_width_once(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), 'blue').save(buffer, 'PNG')
+        name = default_storage.save('pet_photos/tiny.png', ContentFile(buffer.getvalue()))
+        generate_variants(default_storage, name)
+        cache.clear()
+
+        photo = Pet(photo1=name).photo1
+        self.assertEqual(variant_widths(photo), {'card': 300, 'detail': 300, 'full': 300})
+        self.assertEqual(srcset(photo, 'jpg'), '/media/variants/pet_photos/tiny/card.jpg 300w')
+
+    def test_pool_workers_leave_the_cache_to_the_parent(self):
+        from pets.management.commands.build_image_variants import _build
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), 'green').save(buffer, 'JPEG')
+        name = default_storage.save('pet_photos/meadow.jpg', ContentFile(buffer.getvalue()))
+        # The default cache is backed by the cache table, so no queries means no cache writes
+        with self.assertNumQueries(0):
+            self.assertEqual(_build(name), (name, {'card': 400, 'detail': 600, 'full': 600}, None))
+
+
+class StubPhotoHandler(BaseHTTPRequestHandler):
+    """Slow photo host: /photo/<n>.jpg, a /flaky.jpg that fails once and a 404"""
+    lock = threading.Lock()
+    active = peak = 0
+    hits = {}
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+            first_hit = cls.hits[self.path] == 1
+        try:
+            time.sleep(0.05)
+            if self.path == '/missing.jpg' or (self.path == '/flaky.jpg' and first_hit):
+                self.send_response(404 if self.path == '/missing.jpg' else 503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = self.path.encode() * 1000
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class PhotoFetcherTests(TestCase):
+    """Photo downloads run in parallel, per host bounded, and retry transient errors"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPhotoHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        StubPhotoHandler.hits, StubPhotoHandler.peak = {}, 0
+
+    def test_concurrent_downloads(self):
+        with PhotoFetcher(concurrency=8, per_host=3, backoff=0) as fetcher:
+            results = list(fetcher.map(
+                lambda n: fetcher.save(f'{self.base}/photo/{n}.jpg', f'pet_photos/{n}.jpg'), range(12)
+            ))
+            # Overlap depends on thread timing; only the per-host cap is guaranteed
+            self.assertGreater(StubPhotoHandler.peak, 1)
+            self.assertLessEqual(StubPhotoHandler.peak, 3)
+            self.assertEqual(fetcher.save(f'{self.base}/flaky.jpg', 'pet_photos/flaky.jpg')[0],
+                             'pet_photos/flaky.jpg')
+            with self.assertRaises(FetchError):
+                fetcher.save(f'{self.base}/missing.jpg', 'pet_photos/missing.jpg')
+
+        self.assertEqual([error for _, _, error in results], [None] * 12)
+        with default_storage.open('pet_photos/7.jpg') as f:
+            self.assertEqual(f.read(), b'/photo/7.jpg' * 1000)
+        self.assertEqual(StubPhotoHandler.hits['/flaky.jpg'], 2)
+        self.assertEqual(StubPhotoHandler.hits['/missing.jpg'], 1)
+        self.assertFalse(default_storage.exists('pet_photos/missing.jpg'))
+
+    def test_rerun_reuses_stored_photos(self):
+        owner = User.objects.create(username='seeder')
+        pet = Pet.objects.create(owner=owner, name='Rex', breed='Beagle', gender='M', weight=10,
+                                 date_of_birth=date(2020, 1, 1), location='Boston, MA')
+        photos = {
+            'photo1': (f'{self.base}/photo/1.jpg', 'rex_1.jpg'),
+            'photo2': (f'{self.base}/missing.jpg', 'rex_2.jpg'),
+        }
+        with PhotoFetcher(backoff=0) as fetcher:
+            for _ in range(2):
+                saved, failed = download_photos(fetcher, pet, photos)
+                apply_photos(pet, saved)
+
+        pet.refresh_from_db()
+        self.assertTrue(pet.photo1.name.startswith('blobs/'))
+        self.assertFalse(pet.photo2)
+        self.assertEqual(list(failed), ['photo2'])
+        self.assertEqual(Blob.objects.get().refs, 1)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Identical uploads share one file, which goes once nothing references it"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_shared_blob_lifecycle(self):
+        owner = User.objects.create(username='twins')
+        pets = [
+            Pet.objects.create(
+                owner=owner, name=name, breed='Beagle', gender='M', weight=10,
+                date_of_birth=date(2020, 1, 1), location='Boston, MA',
+                photo1=SimpleUploadedFile(f'{name}.JPG', b'same bytes', 'image/jpeg'),
+            )
+            for name in ('Rex', 'Max')
+        ]
+        name = pets[0].photo1.name
+        self.assertEqual(pets[1].photo1.name, name)
+        self.assertTrue(name.startswith('blobs/') and name.endswith('.jpg'))
+        self.assertEqual(len(blob_storage.listdir(name.rsplit('/', 1)[0])[1]), 1)
+        self.assertEqual(Blob.objects.get(name=name).refs, 2)
+
+        pets[0].delete()
+        pets[1].photo1 = None
+        pets[1].save()
+        blob = Blob.objects.get(name=name)
+        self.assertEqual(blob.refs, 0)
+
+        # Within the grace period an unreferenced blob is kept
+        self.assertEqual(collect(), (0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect(timedelta(0)), (1, blob.size))
+        self.assertFalse(blob_storage.exists(name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_legacy_files_are_never_collected(self):
+        name = default_storage.save('pet_photos/old.jpg', ContentFile(b'old bytes'))
+        owner = User.objects.create(username='oldtimer')
+        pet = Pet.objects.create(owner=owner, name='Rex', breed='Beagle', gender='M', weight=10,
+                                 date_of_birth=date(2020, 1, 1), location='Boston, MA', photo1=name)
+        pet.delete()
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+        # Rows an earlier release registered for legacy names are left alone too
+        Blob.objects.create(name=name, refs=0, updated_at=timezone.now() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect(timedelta(0)), (0, 0))
+        self.assertTrue(blob_storage.exists(name))
+
+
+class BootstrapSampleDataTests(TestCase):
+    """The bundled snapshot loads offline in one pass and only once"""
+
+    def test_bootstrap(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('bootstrap_sample_data', stdout=io.StringIO())
+        self.assertLess(len(queries), 40)
+        call_command('bootstrap_sample_data', stdout=io.StringIO())
+
+        self.assertEqual(User.objects.count(), 4)
+        luna = Pet.objects.select_related('breed_ref').get(name='Luna')
+        self.assertEqual(luna.breed_ref.name, 'Golden Retriever')
+        self.assertIsNotNone(luna.latitude)
+        self.assertEqual(luna.vaccinations.count(), 3)
+        self.assertTrue(default_storage.exists(luna.photo1.name))
+        # The bundled photos predate content addressing, so collect_media leaves them alone
+        self.assertFalse(Blob.objects.filter(name=luna.photo1.name).exists())
+        self.assertTrue(self.client.login(username='luna_owner', password='password123'))
+
+
+def memory_status(key):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) * 1024
+
+
+def measure_upload(path, boundary, conn):
+    """Forked child: peak RSS growth while parsing and downscaling the body in ``path``"""
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # reset the peak (VmHWM) to the current RSS
+    baseline = memory_status('VmRSS')
+    with open(path, 'rb') as body:
+        meta = {
+            'CONTENT_TYPE': f'multipart/form-data; boundary={boundary}',
+            'CONTENT_LENGTH': str(os.path.getsize(path)),
+        }
+        _, files = MultiPartParser(meta, body, [BoundedUploadHandler()]).parse()
+        photo = BoundedImageField().clean(files['photo1'])
+    with Image.open(photo) as image:
+        conn.send((memory_status('VmHWM') - baseline, image.size))
+
+
+@override_settings(IMAGE_MAX_EDGE=1024)
+class UploadLimitTests(TestCase):
+    """Uploads are capped in bytes and pixels and downscaled in bounded memory"""
+
+    def post_photo(self, content, name='photo.jpg'):
+        owner = User.objects.create(username=f'uploader{User.objects.count()}')
+        self.client.force_login(owner)
+        return self.client.post(reverse('add_pet'), {
+            'name': 'Rex', 'species': 'DOG', 'breed': 'Beagle', 'gender': 'M',
+            'date_of_birth': '2020-01-01', 'weight': '10', 'is_available_for_mating': 'on',
+            'photo1': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    def test_byte_cap(self):
+        response = self.post_photo(b'\xff' * 4096)
+        self.assertContains(response, 'uploads are limited to 1.0')
+        self.assertFalse(Pet.objects.exists())
+
+    def test_pixel_cap_reads_header_only(self):
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        # Claims 9000x9000 pixels with a few bytes of compressed data behind it
+        png = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 9000, 9000, 8, 0, 0, 0, 0))
+               + chunk(b'IDAT', zlib.compress(b'\0' * 9001)) + chunk(b'IEND', b''))
+        self.assertLess(len(png), 100)
+        with override_settings(IMAGE_MAX_PIXELS=50_000_000):
+            response = self.post_photo(png, 'bomb.png')
+        self.assertContains(response, '9000×9000 pixels; images are limited to 50 megapixels')
+        self.assertFalse(Pet.objects.exists())
+
+    @unittest.skipUnless(os.access('/proc/self/clear_refs', os.W_OK), 'needs Linux /proc peak RSS reset')
+    def test_downscale_peak_memory(self):
+        width, height = 6000, 4000
+        boundary = 'pawnder-upload'
+        with tempfile.NamedTemporaryFile(suffix='.multipart') as body:
+            body.write(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="photo1"; filename="big.jpg"\r\n'
+                f'Content-Type: image/jpeg\r\n\r\n'.encode()
+            )
+            Image.linear_gradient('L').resize((width, height)).convert('RGB').save(body, 'JPEG')
+            body.write(f'\r\n--{boundary}--\r\n'.encode())
+            body.flush()
+
+            context = multiprocessing.get_context('fork')
+            receiver, sender = context.Pipe(duplex=False)
+            child = context.Process(target=measure_upload, args=(body.name, boundary, sender))
+            child.start()
+            peak, size = receiver.recv()
+            child.join()
+
+        self.assertEqual(size, (1024, 683))
+        # Decoding the full 24 megapixels alone would take 72 MB
+        self.assertLess(peak, 24 * 1024 * 1024)
+
+
+async def asgi_get(path, headers=()):
+    """Send one GET through the ASGI handler like a server would; returns the messages it sends back"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'headers': [(b'host', b'testserver'), *headers], 'server': ('testserver', 80),
+    }
+    received = asyncio.Queue()
+    await received.put({'type': 'http.request', 'body': b'', 'more_body': False})
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    # As in Django's test client: closing connections would end the test's transaction
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        await ASGIHandler()(scope, received.get, send)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+    return sent
+
+
+class MediaServingTests(TestCase):
+    """Media is served with validators, ranges and cache headers, or handed to the web server"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.blob = blob_storage.save('certificate.pdf', SimpleUploadedFile('certificate.pdf', b'0123456789' * 100))
+        default_storage.save('pet_photos/legacy.jpg', SimpleUploadedFile('legacy.jpg', b'legacy'))
+
+    def test_conditional_and_cache_headers(self):
+        response = self.client.get(f'/media/{self.blob}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 100)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        revalidated = self.client.get(f'/media/{self.blob}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertIn('immutable', revalidated['Cache-Control'])
+        self.assertEqual(self.client.get(f'/media/{self.blob}', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                         .status_code, 304)
+
+        legacy = self.client.get('/media/pet_photos/legacy.jpg')
+        self.assertEqual(legacy['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/pet_photos/').status_code, 404)
+
+    def test_byte_ranges(self):
+        url = f'/media/{self.blob}'
+        response = self.client.get(url, HTTP_RANGE='bytes=10-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-14/1000')
+        self.assertEqual(b''.join(response.streaming_content), b'01234')
+
+        self.assertEqual(b''.join(self.client.get(url, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=1000-').status_code, 416)
+        stale = self.client.get(url, HTTP_RANGE='bytes=10-14', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_offloaded_to_web_server(self):
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response = self.client.get(f'/media/{self.blob}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.blob}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get('/media/pet_photos/legacy.jpg')
+        self.assertEqual(response['X-Sendfile'], blob_storage.path('pet_photos/legacy.jpg'))
+
+    async def test_asgi_streams_chunks(self):
+        body = os.urandom(5 * CHUNK_SIZE + 10)
+        name = await sync_to_async(blob_storage.save)('scan.pdf', SimpleUploadedFile('scan.pdf', body))
+
+        # A sync iterator would be read into a list up front, with a warning
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            sent = await asgi_get(f'/media/{name}')
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'Content-Length', str(len(body)).encode()), sent[0]['headers'])
+        chunks = [message['body'] for message in sent[1:] if message.get('body')]
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(b''.join(chunks), body)
+
+        sent = await asgi_get(f'/media/{name}', [(b'range', b'bytes=10-14')])
+        self.assertEqual(sent[0]['status'], 206)
+        self.assertIn((b'Content-Range', f'bytes 10-14/{len(body)}'.encode()), sent[0]['headers'])
+        self.assertEqual(b''.join(message.get('body', b'') for message in sent[1:]), body[10:15])
+
+
+class PetCardCacheTests(TestCase):
+    """Grids read cached cards in one go and re-render a pet once it changes"""
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create(username='carder')
+        self.pets = [
+            Pet.objects.create(owner=owner, name=name, breed='Beagle', gender='F', weight=9,
+                               date_of_birth=date(2020, 1, 1), is_vaccinated=True)
+            for name in ('Daisy', 'Rosie')
+        ]
+
+    def test_cards_cached_until_saved(self):
+        daisy, rosie = self.pets
+        self.assertIn('Daisy', render_cards(self.pets)[0])
+
+        key = card_key(daisy, timezone.now().date())
+        cache.set(key, 'cached daisy')
+        with self.assertNumQueries(0):
+            self.assertEqual(render_cards(self.pets)[0], 'cached daisy')
+
+        daisy.name = 'Daisy Mae'
+        daisy.save()
+        self.assertNotEqual(card_key(daisy, timezone.now().date()), key)
+        self.assertIn('Daisy Mae', render_cards(self.pets)[0])
+
+    def test_listings_share_the_card(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Vaccinated', count=2)
+        self.assertContains(response, reverse('pet_detail', args=[self.pets[0].pk]))
+        self.assertContains(self.client.get(reverse('search_pets')), 'Rosie')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'pets.tiered_cache.TieredCache', 'LOCATION': 'shared'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-tests'},
+})
+class TieredCacheTests(TestCase):
+    """A per-process L1 over the shared L2, with single-flight recomputes"""
+
+    def setUp(self):
+        self.cache, self.shared = caches['default'], caches['shared']
+        self.cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', delay=0):
+        def recompute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return recompute
+
+    def test_l1_in_front_of_l2(self):
+        self.cache.set('card:1', 'html')
+        self.shared.delete('card:1')
+        self.assertEqual(self.cache.get('card:1'), 'html')
+        self.cache.delete('card:1')
+        self.assertIsNone(self.cache.get('card:1'))
+
+        self.shared.set('search:ids:1', [1, 2])
+        self.assertEqual(self.cache.get_many(['search:ids:1', 'search:ids:2']), {'search:ids:1': [1, 2]})
+        self.cache.get('search:ids:1')
+        stats = self.cache.stats()
+        self.assertEqual(stats['search:ids'], {'l1_hits': 1, 'l2_hits': 1, 'misses': 1, 'hit_ratio': 0.6667})
+        self.assertEqual(stats['card']['l1_hits'], 1)
+
+    def test_single_flight(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(self.cache.get_or_set('home:recent:1', self.compute(delay=0.2), 60))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_early_expiry_and_stale_while_refreshing(self):
+        now = time.time()
+        # Far from expiry and quick to compute: served as is
+        self.shared.set('home:recent:1', Entry('cached', now + 60, 0.01))
+        self.assertEqual(self.cache.get_or_set('home:recent:1', self.compute(), 60), 'cached')
+
+        # Took long to compute and expires soon: refreshed ahead of time
+        self.shared.set('home:recent:2', Entry('cached', now + 1, 1000))
+        self.assertEqual(self.cache.get_or_set('home:recent:2', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+        # Expired while another process holds the refresh lock: the old value
+        self.shared.set('home:recent:3', Entry('stale', now - 1, 0.01))
+        self.shared.add('home:recent:3:lock', 1)
+        self.assertEqual(self.cache.get_or_set('home:recent:3', self.compute(), 60), 'stale')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(self.cache.get('home:recent:3'))
+
+
+@override_settings(ASYNC_QUERY_THREADS=0)
+class ConditionalGetTests(TestCase):
+    """Unchanged pages answer 304 without rendering, per user and per change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(owners=2, pets_per_owner=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_listings(self):
+        for url in (reverse('home'), reverse('search_pets') + '?species=DOG'):
+            response = self.client.get(url)
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            not_modified = self.revalidate(url, response)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertTemplateNotUsed(not_modified, 'pets/base.html')
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                             .status_code, 304)
+
+        url = reverse('search_pets') + '?species=DOG'
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Pet.objects.filter(species='DOG').first().save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+        self.assertNotEqual(self.client.get(reverse('search_pets') + '?species=CAT')['ETag'], response['ETag'])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan')
+    def test_search_validator_uses_index(self):
+        # The search validator's Max(updated_at), with and without a species
+        for where, params, index in (('WHERE species = %s', ['DOG'], 'pet_species_updated_idx'),
+                                     ('', [], 'pet_updated_idx')):
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN SELECT MAX(updated_at) FROM pets_pet {where}', params)
+                plan = ' '.join(str(row) for row in cursor.fetchall())
+            self.assertIn(index, plan)
+
+    def test_pet_detail_per_user(self):
+        pet = Pet.objects.exclude(owner=self.users[0]).first()
+        url = reverse('pet_detail', args=[pet.pk])
+
+        anonymous = self.client.get(url)
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 304)
+        self.assertEqual(self.client.get(reverse('pet_detail', args=[0])).status_code, 404)
+
+        # A deleted vaccination makes no timestamp newer, so only the ETag can tell
+        self.assertNotIn('Last-Modified', anonymous)
+        Vaccination.objects.create(pet=pet, vaccine_type='RABIES', date_administered=date(2024, 1, 1))
+        vaccinated = self.client.get(url)
+        Vaccination.objects.filter(pet=pet).order_by('-id').first().delete()
+        self.assertEqual(self.revalidate(url, vaccinated).status_code, 200)
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # Favoriting changes the page, and the flash message must be shown
+        self.client.get(reverse('toggle_favorite', args=[pet.pk]))
+        self.assertContains(self.revalidate(url, response), 'added to favorites')
+        favorited = self.revalidate(url, response)
+        self.assertEqual(favorited.status_code, 200)
+        self.assertNotEqual(favorited['ETag'], response['ETag'])
+        self.assertEqual(self.revalidate(url, favorited).status_code, 304)
+
+        self.client.force_login(self.users[1])
+        self.assertEqual(self.revalidate(url, favorited).status_code, 200)
+
+
+# Queries each page may run, however many rows it shows, reads of the shared
+# cache table included
+QUERY_BUDGETS = {
+    'home': 8,
+    'search_pets': 10,
+    'pet_detail': 9,
+    'profile': 7,
+    'favorites': 5,
+    'my_matches': 4,
+    'my_matches?box=sent': 4,
+    'admin:pets_pet_changelist': 5,
+    'admin:pets_vaccination_changelist': 5,
+    'admin:pets_match_changelist': 4,
+    'admin:pets_favorite_changelist': 5,
+}
+
+
+@override_settings(ASYNC_QUERY_THREADS=0, SEARCH_COLUMNAR_INDEX=None)
+class QueryBudgetTests(TestCase):
+    """Every page runs a fixed number of queries, whatever the row count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = seed_catalog(owners=2, pets_per_owner=2)
+        cls.user.is_staff = cls.user.is_superuser = True
+        cls.user.save()
+        cls.pet = Pet.objects.filter(owner=cls.user).first()
+
+    def grow(self, n):
+        """Add ``n`` more of every row the pages list for the user and their pet"""
+        start = Pet.objects.count()
+        mine, theirs = [
+            Pet.objects.bulk_create([
+                Pet(owner=owner, name=f'Grown {start + i}', breed='Beagle', gender='F', weight=8,
+                    date_of_birth=date(2019, 1, 1), location='Boston, MA')
+                for i in range(n)
+            ])
+            for owner in (self.user, self.other)
+        ]
+        Favorite.objects.bulk_create([Favorite(user=self.user, pet=pet) for pet in theirs])
+        Match.objects.bulk_create(
+            [Match(from_pet=pet, to_pet=self.pet) for pet in theirs]
+            + [Match(from_pet=self.pet, to_pet=pet) for pet in theirs]
+        )
+        Vaccination.objects.bulk_create([
+            Vaccination(pet=pet, vaccine_type='RABIES', date_administered=date(2024, 1, 1))
+            for pet in [self.pet] * n + mine
+        ])
+        Recommendation.objects.bulk_create([
+            Recommendation(pet=pet, candidate=candidate, score=1, rank=rank)
+            for pet in [self.pet] + mine for rank, candidate in enumerate(theirs[:3])
+        ])
+        recount()
+
+    def queries_per_page(self):
+        counts = {}
+        for name in QUERY_BUDGETS:
+            name, _, query = name.partition('?')
+            url = reverse(name, args=[self.pet.pk] if name == 'pet_detail' else [])
+            cache.clear()
+            self.client.get(f'{url}?{query}')
+            # Steady state: the shared cache is warm, this worker's L1 copies
+            # have expired, so every cache read is a query and counts
+            cache.clear_local()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'{url}?{query}')
+            self.assertEqual(response.status_code, 200, url)
+            counts[f'{name}?{query}' if query else name] = len(queries)
+        return counts
+
+    def test_query_budgets(self):
+        self.client.force_login(self.user)
+        small = self.queries_per_page()
+        self.grow(15)
+        large = self.queries_per_page()
+
+        self.assertEqual(large, small)
+        for name, count in large.items():
+            self.assertLessEqual(count, QUERY_BUDGETS[name], name)
+
+
+class DuplicateQueryMiddlewareTests(TestCase):
+    """The development middleware points at the code running an N+1"""
+
+    def test_logs_repeated_queries(self):
+        seed_catalog(owners=2, pets_per_owner=3)
+
+        def view(request):
+            template = Template('{% for pet in pets %}{{ pet.owner.username }}{% endfor %}')
+            return HttpResponse(template.render(Context({'pets': Pet.objects.all()})))
+
+        with override_settings(DEBUG=True):
+            middleware = DuplicateQueryMiddleware(view)
+        with self.assertLogs('pets.middleware', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('ran the same query 6 times', logs.output[0])
+        self.assertIn('auth_user', logs.output[0])
+        self.assertIn('pets/tests.py', logs.output[0])
+        self.assertIn('(template <unknown source>:1)', logs.output[0])
+
+    async def test_async_view(self):
+        await sync_to_async(seed_catalog)(owners=2, pets_per_owner=3)
+
+        async def view(request):
+            # The ORM runs in another thread than the middleware
+            names = await sync_to_async(lambda: [pet.owner.username for pet in Pet.objects.all()])()
+            return HttpResponse(' '.join(names))
+
+        with override_settings(DEBUG=True):
+            middleware = DuplicateQueryMiddleware(view)
+        with self.assertLogs('pets.middleware', 'WARNING') as logs:
+            await middleware(AsyncRequestFactory().get('/'))
+        self.assertIn('ran the same query 6 times', logs.output[0])
+        self.assertIn('pets/tests.py', logs.output[0])
+
+
+class ServerTimingTests(TestCase):
+    """Sampled requests report their database, template and cache time"""
+
+    def test_reports_timings(self):
+        seed_catalog(owners=1, pets_per_owner=2)
+        cache.clear()
+        with self.assertLogs('pets.timing', 'INFO') as logs:
+            response = self.client.get(reverse('home'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="[1-9]\d* quer')
+        self.assertRegex(header, r'tpl;dur=[\d.]+')
+        self.assertRegex(header, r'cache;desc="\d+ hits, [1-9]\d* misses"')
+        self.assertRegex(header, r'total;dur=[\d.]+')
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['url_name'], 'home')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertGreater(line['template_ms'], 0)
+
+    @override_settings(INTERNAL_IPS=[])
+    def test_header_only_for_staff(self):
+        user = User.objects.create(username='visitor')
+        with self.assertLogs('pets.timing', 'INFO') as logs:
+            self.assertFalse(self.client.get(reverse('home')).has_header('Server-Timing'))
+            self.client.force_login(user)
+            self.assertFalse(self.client.get(reverse('home')).has_header('Server-Timing'))
+        # Everyone's requests are still logged
+        self.assertEqual(len(logs.records), 2)
+
+        user.is_staff = True
+        user.save()
+        self.assertTrue(self.client.get(reverse('home')).has_header('Server-Timing'))
+
+    @override_settings(INTERNAL_IPS=[])
+    async def test_header_only_for_staff_async(self):
+        user = await User.objects.acreate(username='async-visitor')
+        await self.async_client.aforce_login(user)
+        self.assertFalse((await self.async_client.get(reverse('home'))).has_header('Server-Timing'))
+        user.is_staff = True
+        await user.asave()
+        self.assertTrue((await self.async_client.get(reverse('home'))).has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,323 @@
+"""
+Two-level cache backend: a per-process LRU in front of a shared cache.
+
+``TieredCache`` answers reads from a small in-process LRU (L1) when it can
+and falls back to the cache named by ``LOCATION`` (L2, the database cache
+table all workers share). Writes go to both. Another worker's write is
+seen once the local copy expires, so ``L1_TIMEOUT`` bounds how stale a
+read can be. L1 keeps pickles, like the local-memory backend, so callers
+never share mutable objects.
+
+``get_or_set`` with a callable protects hot keys from stampedes:
+
+* Probabilistic early expiry (XFetch): each read close to the expiry
+  recomputes early with a probability that rises as the expiry nears,
+  scaled by how long the value took to compute, so one request usually
+  refreshes a hot key before it actually expires.
+* Single flight: the refresh runs under a per-key lock, a thread lock
+  within the process and an ``add()``-based lock in L2 across processes.
+  Everyone else keeps returning the previous value, or, when there is
+  none, waits for the winner's instead of computing it too.
+
+Hits and misses are counted per key prefix (``search:ids``, ``card``,
+...) in each process; ``stats()`` reports them. They are also added to
+the current request's ``pets.timing`` measurement, if any.
+"""
+import math
+import pickle
+import random
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .timing import record_cache
+
+
+DEFAULT_L1_MAX_ENTRIES = 1000
+DEFAULT_L1_TIMEOUT = 5
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_BETA = 1.0
+# Stale values stay in L2 this much longer than their timeout, to be served
+# while one worker recomputes them
+STALE_FACTOR = 0.5
+POLL_INTERVAL = 0.05
+LOCK_STRIPES = 64
+
+_missing = object()
+
+
+class Entry:
+    """A ``get_or_set`` value with its soft expiry and recompute time"""
+
+    __slots__ = ('value', 'expires', 'delta')
+
+    def __init__(self, value, expires, delta):
+        self.value = value
+        self.expires = expires
+        self.delta = delta
+
+    def __getstate__(self):
+        return self.value, self.expires, self.delta
+
+    def __setstate__(self, state):
+        self.value, self.expires, self.delta = state
+
+    def expired(self, now):
+        return now >= self.expires
+
+    def due(self, now, beta):
+        """XFetch: expired, or picked to refresh ahead of the expiry"""
+        return now - self.delta * beta * math.log(1.0 - random.random()) >= self.expires
+
+
+def key_prefix(key):
+    """``search:ids:...`` -> ``search:ids``, ``card:12:...`` -> ``card``"""
+    parts = key.split(':', 2)
+    if len(parts) > 2 and parts[1].isalpha():
+        return f'{parts[0]}:{parts[1]}'
+    return parts[0]
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', DEFAULT_L1_MAX_ENTRIES)
+        self._l1_timeout = options.get('L1_TIMEOUT', DEFAULT_L1_TIMEOUT)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+        self._beta = options.get('EARLY_EXPIRY_BETA', DEFAULT_BETA)
+
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._flights = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._location]
+
+    # L1
+
+    def _l1_key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _l1_get(self, l1_key):
+        with self._l1_lock:
+            item = self._l1.get(l1_key)
+            if item is None:
+                return _missing
+            expires, data = item
+            if time.monotonic() >= expires:
+                del self._l1[l1_key]
+                return _missing
+            self._l1.move_to_end(l1_key)
+        return pickle.loads(data)
+
+    def _l1_set(self, l1_key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._l1_delete(l1_key)
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._l1_lock:
+            self._l1[l1_key] = (time.monotonic() + ttl, data)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, l1_key):
+        with self._l1_lock:
+            self._l1.pop(l1_key, None)
+
+    # Stats
+
+    def _count(self, key, outcome, n=1):
+        with self._stats_lock:
+            self._stats[key_prefix(key), outcome] += n
+        record_cache(outcome != 'misses', n)
+
+    def stats(self):
+        """Hits in L1 and L2 and misses per key prefix, for this process"""
+        with self._stats_lock:
+            counts = dict(self._stats)
+        report = {}
+        for (prefix, outcome), n in sorted(counts.items()):
+            report.setdefault(prefix, {'l1_hits': 0, 'l2_hits': 0, 'misses': 0})[outcome] = n
+        for row in report.values():
+            total = row['l1_hits'] + row['l2_hits'] + row['misses']
+            row['hit_ratio'] = round((row['l1_hits'] + row['l2_hits']) / total, 4)
+        return report
+
+    # Cache API
+
+    def _unwrap(self, value, default):
+        if isinstance(value, Entry):
+            return default if value.expired(time.time()) else value.value
+        return value
+
+    def _get_entry(self, key, version=None, count=True):
+        """The stored value, ``Entry`` wrapper included, or ``_missing``"""
+        l1_key = self._l1_key(key, version)
+        value = self._l1_get(l1_key)
+        if value is not _missing:
+            if count:
+                self._count(key, 'l1_hits')
+            return value
+        value = self.shared.get(key, _missing, version=version)
+        if value is _missing:
+            if count:
+                self._count(key, 'misses')
+            return _missing
+        if count:
+            self._count(key, 'l2_hits')
+        self._l1_set(l1_key, value)
+        return value
+
+    def get(self, key, default=None, version=None):
+        value = self._get_entry(key, version)
+        return default if value is _missing else self._unwrap(value, default)
+
+    def get_many(self, keys, version=None):
+        found, remote = {}, []
+        for key in keys:
+            value = self._l1_get(self._l1_key(key, version))
+            if value is _missing:
+                remote.append(key)
+            else:
+                self._count(key, 'l1_hits')
+                found[key] = value
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key in remote:
+                if key in fetched:
+                    self._count(key, 'l2_hits')
+                    self._l1_set(self._l1_key(key, version), fetched[key])
+                    found[key] = fetched[key]
+                else:
+                    self._count(key, 'misses')
+        return {
+            key: value for key, value in
+            ((key, self._unwrap(value, _missing)) for key, value in found.items())
+            if value is not _missing
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._l1_set(self._l1_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(self._l1_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._l1_set(self._l1_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self._l1_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(self._l1_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._l1_set(self._l1_key(key, version), value)
+        return value
+
+    def clear_local(self):
+        """Drop this process' L1 copies, as if they had all expired"""
+        with self._l1_lock:
+            self._l1.clear()
+
+    def clear(self):
+        self.clear_local()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # Stampede protection
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Cached value of ``key``, computing it with ``default()`` if needed;
+        see the module docstring for how concurrent recomputes are avoided.
+        """
+        if not callable(default):
+            return super().get_or_set(key, default, timeout, version)
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        if timeout is not None and timeout <= 0:
+            return default()
+
+        stale = self._get_entry(key, version)
+        if stale is not _missing and not isinstance(stale, Entry):
+            return stale  # Plain value written with set()
+        if stale is not _missing and not stale.due(time.time(), self._beta):
+            return stale.value
+
+        flight = self._flights[zlib.crc32(self._l1_key(key, version).encode()) % LOCK_STRIPES]
+        if not flight.acquire(blocking=stale is _missing):
+            return stale.value  # Another thread here is refreshing it
+        try:
+            current = self._get_entry(key, version, count=False)
+            if (isinstance(current, Entry) and not current.expired(time.time())
+                    and (stale is _missing or current.expires != stale.expires)):
+                return current.value  # Refreshed while we waited for the lock
+
+            lock_key = f'{key}:lock'
+            if self.shared.add(lock_key, 1, self._lock_timeout, version=version):
+                try:
+                    return self._refresh(key, default, timeout, version)
+                finally:
+                    self.shared.delete(lock_key, version=version)
+            if stale is not _missing:
+                return stale.value  # Another process is refreshing it
+            return self._wait(key, default, timeout, version)
+        finally:
+            flight.release()
+
+    def _refresh(self, key, default, timeout, version):
+        started = time.time()
+        value = default()
+        now = time.time()
+        if timeout is None:
+            entry, stored_timeout = Entry(value, math.inf, 0), None
+        else:
+            entry = Entry(value, now + timeout, now - started)
+            stored_timeout = timeout + max(1, int(timeout * STALE_FACTOR))
+        self.shared.set(key, entry, stored_timeout, version=version)
+        self._l1_set(self._l1_key(key, version), entry, timeout)
+        return value
+
+    def _wait(self, key, default, timeout, version):
+        """Wait for the process holding the lock, computing it ourselves if it takes too long"""
+        deadline = time.monotonic() + self._lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = self.shared.get(key, _missing, version=version)
+            if isinstance(entry, Entry) and not entry.expired(time.time()):
+                self._l1_set(self._l1_key(key, version), entry, timeout)
+                return entry.value
+        return self._refresh(key, default, timeout, version)
@@ -0,0 +1,115 @@
+"""
+Where a request's time goes, collected for ``ServerTimingMiddleware``.
+
+A ``RequestTiming`` lives in a context variable for the duration of a
+sampled request. The instrumentation hooks below add to it from wherever
+they run: ``sync_to_async`` copies the context into worker threads, so
+queries an async view sends to the query pool are counted too. When no
+request is being measured every hook is a single context variable lookup.
+
+``instrument()``, called from ``PetsConfig.ready``, installs the hooks:
+
+* Database: a wrapper installed on every connection when it is created
+  counts statements and their time.
+* Templates: ``Template.render`` is wrapped to time the outermost render.
+  Lazy querysets evaluated while rendering count towards both the
+  template and the database time.
+* Cache: ``TieredCache`` reports its hits and misses.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+
+
+current = contextvars.ContextVar('pets_request_timing', default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add_query(self, duration):
+        with self._lock:
+            self.queries += 1
+            self.db += duration
+
+    def add_cache(self, hit, n=1):
+        with self._lock:
+            if hit:
+                self.cache_hits += n
+            else:
+                self.cache_misses += n
+
+
+@contextmanager
+def measure():
+    """Collect timings for the code inside the block; yields the ``RequestTiming``"""
+    timing = RequestTiming()
+    token = current.set(timing)
+    try:
+        yield timing
+    finally:
+        timing.total = time.perf_counter() - timing.started
+        current.reset(token)
+
+
+def record_cache(hit, n=1):
+    timing = current.get()
+    if timing is not None:
+        timing.add_cache(hit, n)
+
+
+def record_query(execute, sql, params, many, context):
+    timing = current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(time.perf_counter() - started)
+
+
+def _wrap_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def timed(self, context):
+        timing = current.get()
+        if timing is None or timing.rendering:
+            return render(self, context)
+        timing.rendering = True
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timing.template += time.perf_counter() - started
+            timing.rendering = False
+    timed.timed = True
+    return timed
+
+
+def instrument():
+    """Install the database and template hooks; safe to call more than once"""
+    connection_created.connect(_wrap_connection, dispatch_uid='pets.timing')
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(connection)
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed_render(Template.render)
@@ -0,0 +1,143 @@
+"""
+Memory-bounded handling of uploaded photos and certificates.
+
+``BoundedUploadHandler`` streams every uploaded file to a temporary file on
+disk, never to memory, and stops writing once a file passes
+``UPLOAD_MAX_BYTES``. The form fields below then check the image header for
+its pixel dimensions before anything is decoded (so a small file that
+inflates to gigapixels is rejected up front), and downscale photos larger
+than ``IMAGE_MAX_EDGE`` straight from the temporary file, using Pillow's
+reduced-size JPEG decoding, into a new temporary file.
+"""
+import posixpath
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_PIXELS = 40_000_000
+DEFAULT_MAX_EDGE = 2048
+
+# Formats kept as uploaded when downscaling; anything else becomes JPEG
+KEEP_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def max_bytes():
+    return getattr(settings, 'UPLOAD_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Write uploads to disk as they arrive, discarding whatever exceeds ``UPLOAD_MAX_BYTES``"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.limit = max_bytes()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            # Keep reading the request body, but stop storing this file
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        if self.received > self.limit:
+            upload.file.truncate(0)
+            upload.upload_error = (
+                f'{upload.name} is {filesizeformat(self.received)}; '
+                f'uploads are limited to {filesizeformat(self.limit)}.'
+            )
+        return upload
+
+
+def check_upload(upload):
+    """Raise the error the upload handler recorded for ``upload``, if any"""
+    error = getattr(upload, 'upload_error', None)
+    if error:
+        raise forms.ValidationError(error, code='file_too_large')
+
+
+def check_dimensions(upload, max_pixels):
+    """Reject images over ``max_pixels`` from their header alone"""
+    upload.seek(0)
+    try:
+        # Image.open only parses the header; pixels are decoded lazily
+        with Image.open(upload) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = None  # Pillow's own, higher, limit: too big to say
+    except Exception:
+        return  # Not an image: left for ImageField's own validation
+    finally:
+        upload.seek(0)
+    if width is None:
+        raise forms.ValidationError(
+            f'{upload.name} is too large; images are limited to {max_pixels / 1_000_000:g} megapixels.',
+            code='too_many_pixels',
+        )
+    if width * height > max_pixels:
+        raise forms.ValidationError(
+            f'{upload.name} is {width}×{height} pixels; images are limited to '
+            f'{max_pixels / 1_000_000:g} megapixels.',
+            code='too_many_pixels',
+        )
+
+
+def downscale(upload, max_edge):
+    """
+    Return ``upload`` shrunk to fit ``max_edge`` as a new temporary file,
+    or ``upload`` itself when it already fits.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if max(image.size) <= max_edge:
+            upload.seek(0)
+            return upload
+        fmt = image.format if image.format in KEEP_FORMATS else 'JPEG'
+        scale = max_edge / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # JPEGs decode straight at the smallest 1/2, 1/4 or 1/8 scale that
+        # still covers the target size, so the full resolution is never in memory
+        image.draft('RGB', size)
+        image.thumbnail(size, Image.LANCZOS, reducing_gap=None)
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        root = posixpath.splitext(upload.name)[0]
+        resized = TemporaryUploadedFile(
+            f'{root}.{KEEP_FORMATS[fmt]}', Image.MIME.get(fmt, upload.content_type), 0, None,
+        )
+        image.save(resized, fmt, quality=90)
+    resized.size = resized.tell()
+    resized.seek(0)
+    upload.close()
+    return resized
+
+
+class BoundedFileField(forms.FileField):
+    """``FileField`` that reports uploads cut off by ``BoundedUploadHandler``"""
+
+    def to_python(self, data):
+        check_upload(data)
+        return super().to_python(data)
+
+
+class BoundedImageField(forms.ImageField):
+    """``ImageField`` with byte and pixel caps that downscales oversized photos"""
+
+    def to_python(self, data):
+        check_upload(data)
+        if isinstance(data, UploadedFile):
+            check_dimensions(data, getattr(settings, 'IMAGE_MAX_PIXELS', DEFAULT_MAX_PIXELS))
+        upload = super().to_python(data)
+        if upload is None:
+            return None
+        return downscale(upload, getattr(settings, 'IMAGE_MAX_EDGE', DEFAULT_MAX_EDGE))
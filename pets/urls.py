@@ -1,6 +1,6 @@
 from django.urls import path
 from . import views
-from .views_admin import setup_initial_data
+from .views_admin import cache_stats, setup_initial_data
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -19,12 +19,17 @@ urlpatterns = [
     # Matches
     path('pet/<int:pet_pk>/match/', views.send_match_request, name='send_match_request'),
     path('matches/', views.my_matches, name='my_matches'),
+    path('matches/bulk/', views.bulk_respond_to_matches, name='bulk_respond_to_matches'),
     path('match/<int:match_pk>/<str:action>/', views.respond_to_match, name='respond_to_match'),
 
     # Favorites
     path('pet/<int:pet_pk>/favorite/', views.toggle_favorite, name='toggle_favorite'),
     path('favorites/', views.favorites, name='favorites'),
 
+    # Server-sent notifications (ASGI only)
+    path('events/', views.event_stream, name='event_stream'),
+
     # Admin utility - one-time setup
     path('setup-data/', setup_initial_data, name='setup_data'),
+    path('stats/cache/', cache_stats, name='cache_stats'),
 ]
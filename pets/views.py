@@ -1,20 +1,55 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from django.utils import timezone
 from datetime import timedelta
+import asyncio
+from asgiref.sync import sync_to_async
 from .models import Pet, Vaccination, Match, Favorite, OwnerProfile
+from .pagination import KeysetPaginator, InvalidCursor
+from . import result_cache
+from .columnar import get_columnar_index
+from .concurrency import in_thread
+from .conditional import conditional_page, latest
+from .counters import get_match_counts, track_many
+from .events import format_event, get_broker, notify_bulk
+from .facets import FACET_FILTERS, get_facets, label_choices
+from .geo import geocode, nearest, within_radius, DISTANCE_ORDERING
+from .recommendations import get_recommendations
+from .search import apply_filters, get_search_backend, RANKED_ORDERING
 from .forms import (
     UserRegistrationForm, OwnerProfileForm, PetRegistrationForm,
     VaccinationForm, PetSearchForm, MatchRequestForm
 )
 
 
+def recent_pets():
+    return Pet.objects.filter(is_active=True, is_available_for_mating=True)[:8]
+
+
+def recent_pets_list():
+    return list(recent_pets())
+
+
+def home_validator(request):
+    rows = list(recent_pets().values_list('pk', 'updated_at'))
+    return rows, latest(*[updated_at for _, updated_at in rows], result_cache.changed_at())
+
+
+@conditional_page(home_validator)
 def home(request):
     """Homepage showing featured pets"""
-    recent_pets = Pet.objects.filter(is_active=True, is_available_for_mating=True)[:8]
+    # Keyed on the search generation, so adding or editing a pet shows up at
+    # once; only one worker rebuilds the list when it expires
+    key = f'home:recent:{result_cache.generation({})}'
+    recent_pets = cache.get_or_set(key, recent_pets_list, getattr(settings, 'HOME_CACHE_TIMEOUT', 300))
     context = {
         'recent_pets': recent_pets,
     }
@@ -52,10 +87,15 @@ def profile(request):
     else:
         form = OwnerProfileForm(instance=owner_profile)
 
+    # Precomputed by `manage.py compute_recommendations`, never scored per request
+    suggestions = get_recommendations(my_pets, limit=3)
+    recommended = [(pet, suggestions[pet.pk]) for pet in my_pets if suggestions.get(pet.pk)]
+
     context = {
         'form': form,
         'my_pets': my_pets,
         'owner_profile': owner_profile,
+        'recommended': recommended,
     }
     return render(request, 'pets/profile.html', context)
 
@@ -93,68 +133,176 @@ def edit_pet(request, pk):
     return render(request, 'pets/edit_pet.html', {'form': form, 'pet': pet})
 
 
-def pet_detail(request, pk):
-    """Pet detail view"""
-    pet = get_object_or_404(Pet, pk=pk)
-    vaccinations = pet.vaccinations.all()
-    is_owner = request.user.is_authenticated and pet.owner == request.user
-    is_favorited = False
-    has_pending_match = False
-
-    if request.user.is_authenticated:
-        is_favorited = Favorite.objects.filter(user=request.user, pet=pet).exists()
-        if not is_owner and request.user.pets.exists():
-            # Check if user has already sent a match request
-            has_pending_match = Match.objects.filter(
-                from_pet__owner=request.user,
-                to_pet=pet
-            ).exists()
+def pet_detail_validator(request, pk):
+    """Everything the detail page shows that can change, from one aggregate query"""
+    user = request.user
+    fields = {
+        'vaccinations_changed': Max('vaccinations__created_at'),
+        'vaccination_count': Count('vaccinations', distinct=True),
+    }
+    if user.is_authenticated:
+        fields.update(
+            is_favorited=Exists(Favorite.objects.filter(user=user, pet=OuterRef('pk'))),
+            has_match=Exists(Match.objects.filter(from_pet__owner=user, to_pet=OuterRef('pk'))),
+            recommendations_changed=Max('recommendations__computed_at'),
+            candidates_changed=Max('recommendations__candidate__updated_at'),
+            recommendation_count=Count('recommendations', distinct=True),
+        )
+    row = Pet.objects.filter(pk=pk).order_by().annotate(**fields).values(
+        'updated_at', 'owner__username', 'owner__first_name', 'owner__last_name',
+        'owner__owner_profile__updated_at', *fields,
+    ).first()
+    if row is None:
+        return None  # The view answers 404
+    # No Last-Modified: deleting a vaccination changes the page (the count in
+    # the ETag) without making any of these timestamps newer
+    return sorted(row.items()), None
+
+
+@conditional_page(pet_detail_validator)
+async def pet_detail(request, pk):
+    """Pet detail view; the independent lookups run concurrently"""
+    # Lookups that only need the pk start before the session is even read
+    pet_lookup = asyncio.ensure_future(in_thread(
+        get_object_or_404, Pet.objects.select_related('owner__owner_profile'), pk=pk,
+    ))
+    vaccinations = asyncio.ensure_future(in_thread(list, Vaccination.objects.filter(pet_id=pk)))
+    tasks = [pet_lookup, vaccinations]
+    try:
+        user = await request.auser()
+
+        is_favorited = has_pending_match = False
+        recommendations = {}
+        if user.is_authenticated:
+            # A match from one of the user's pets implies they have pets, so the
+            # old request.user.pets.exists() guard is not needed
+            checks = [asyncio.ensure_future(lookup) for lookup in (
+                in_thread(Favorite.objects.filter(user=user, pet_id=pk).exists),
+                in_thread(Match.objects.filter(from_pet__owner=user, to_pet_id=pk).exists),
+                in_thread(get_recommendations, Pet.objects.filter(pk=pk, owner=user)),
+            )]
+            tasks += checks
+            is_favorited, has_pending_match, recommendations = await asyncio.gather(*checks)
+
+        pet = await pet_lookup
+        vaccinations = await vaccinations
+    finally:
+        # Whatever raised first, no lookup is left running unobserved
+        # ("Task exception was never retrieved")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    is_owner = user.is_authenticated and pet.owner_id == user.pk
 
     context = {
         'pet': pet,
         'vaccinations': vaccinations,
         'is_owner': is_owner,
         'is_favorited': is_favorited,
-        'has_pending_match': has_pending_match,
+        'has_pending_match': has_pending_match and not is_owner,
+        'recommendations': recommendations.get(pet.pk, []),
     }
-    return render(request, 'pets/pet_detail.html', context)
+    # Rendering runs context processors that may still touch the database
+    return await sync_to_async(render)(request, 'pets/pet_detail.html', context)
 
 
+def search_validator(request):
+    form = PetSearchForm(request.GET or None)
+    filters = dict(form.cleaned_data) if form.is_valid() else {}
+    # Any change to a pet of the searched species, in or out of the results
+    pets = Pet.objects.order_by()
+    if filters.get('species'):
+        pets = pets.filter(species=filters['species'])
+    last_modified = pets.aggregate(changed=Max('updated_at'))['changed']
+    return (
+        (result_cache.generation(filters), request.GET.urlencode()),
+        latest(last_modified, result_cache.changed_at()),
+    )
+
+
+@conditional_page(search_validator)
 def search_pets(request):
     """Search pets with filters"""
     form = PetSearchForm(request.GET or None)
     pets = Pet.objects.filter(is_active=True, is_available_for_mating=True)
 
-    if form.is_valid():
-        if form.cleaned_data.get('species'):
-            pets = pets.filter(species=form.cleaned_data['species'])
-
-        if form.cleaned_data.get('breed'):
-            pets = pets.filter(breed__icontains=form.cleaned_data['breed'])
-
-        if form.cleaned_data.get('gender'):
-            pets = pets.filter(gender=form.cleaned_data['gender'])
+    ordering = ('-created_at', '-id')
+    filters = {}
+    center = None
+    # Facets count each option as if its own filter were not set
+    facet_pets = pets
 
-        if form.cleaned_data.get('location'):
-            pets = pets.filter(location__icontains=form.cleaned_data['location'])
-
-        if form.cleaned_data.get('is_vaccinated'):
-            pets = pets.filter(is_vaccinated=True)
-
-        # Age filtering
-        if form.cleaned_data.get('min_age') is not None or form.cleaned_data.get('max_age') is not None:
-            today = timezone.now().date()
-            if form.cleaned_data.get('min_age') is not None:
-                min_date = today - timedelta(days=form.cleaned_data['min_age'] * 365)
-                pets = pets.filter(date_of_birth__lte=min_date)
-
-            if form.cleaned_data.get('max_age') is not None:
-                max_date = today - timedelta(days=form.cleaned_data['max_age'] * 365)
-                pets = pets.filter(date_of_birth__gte=max_date)
+    if form.is_valid():
+        filters = dict(form.cleaned_data)
+        query_filters = filters
+        if filters.get('radius_km') and filters.get('location'):
+            center = geocode(filters['location'])
+            if center:
+                # The radius search replaces the substring match on location
+                query_filters = dict(filters, location='')
+
+        facet_pets = apply_filters(pets, query_filters, skip=FACET_FILTERS)
+        pets = apply_filters(pets, query_filters)
+
+        if filters.get('q'):
+            backend = get_search_backend()
+            pets, facet_pets = backend.search(pets, filters['q']), backend.search(facet_pets, filters['q'])
+            ordering = RANKED_ORDERING
+
+        if center:
+            unbounded = pets
+            pets = within_radius(pets, *center, filters['radius_km'])
+            facet_pets = within_radius(facet_pets, *center, filters['radius_km'])
+            ordering = DISTANCE_ORDERING
+
+    facets = get_facets(facet_pets, filters)
+    form.fields['species'].choices = label_choices(form.fields['species'].choices, facets['species'])
+    form.fields['gender'].choices = label_choices(form.fields['gender'].choices, facets['gender'])
+    breed_links = []
+    for breed, count in facets['breeds']:
+        query = request.GET.copy()
+        query.pop('after', None)
+        query['breed'] = breed
+        breed_links.append((breed, count, query.urlencode()))
+
+    # Plain attribute filters are answered from the shared columnar snapshot
+    index = get_columnar_index()
+    use_columnar = index is not None and index.path.exists() and index.supports(filters)
+
+    # Keyset pagination keeps deep pages as cheap as the first one
+    paginator = KeysetPaginator(pets, ordering, page_size=request.GET.get('page_size'))
+    cursor = request.GET.get('after')
+    page = result_cache.lookup(filters, cursor, paginator.page_size)
+    if page is None:
+        try:
+            if use_columnar:
+                page = index.page(paginator, filters, cursor)
+            else:
+                page = paginator.page(cursor)
+            result_cache.store(filters, cursor, paginator, page)
+        except InvalidCursor:
+            page = paginator.page()
+
+    next_query = None
+    if page.has_next:
+        query = request.GET.copy()
+        query['after'] = page.next_cursor
+        next_query = query.urlencode()
+
+    nearby = []
+    if center and not page.items and not cursor:
+        # Nothing inside the circle: show the closest pets beyond it instead
+        nearby = nearest(unbounded, *center, n=paginator.page_size, start_km=filters['radius_km'] * 2)
 
     context = {
         'form': form,
-        'pets': pets,
+        'pets': page,
+        'next_query': next_query,
+        'center': center,
+        'nearby': nearby,
+        'facets': facets,
+        'breed_links': breed_links,
     }
     return render(request, 'pets/search.html', context)
 
@@ -210,9 +358,21 @@ def send_match_request(request, pet_pk):
             match = form.save(commit=False)
             match.from_pet = from_pet
             match.to_pet = to_pet
-            match.save()
 
-            messages.success(request, f'Match request sent from {from_pet.name} to {to_pet.name}!')
+            with transaction.atomic():
+                # Uses the (from_pet, to_pet) unique index with the pets swapped
+                reciprocal = Match.objects.select_for_update().filter(
+                    from_pet=to_pet, to_pet=from_pet, status='PENDING',
+                ).first()
+                if reciprocal:
+                    match.status = reciprocal.status = 'ACCEPTED'
+                    reciprocal.save(update_fields=['status', 'updated_at'])
+                match.save()
+
+            if reciprocal:
+                messages.success(request, f"It's a match! {to_pet.name} had already asked to match with {from_pet.name}.")
+            else:
+                messages.success(request, f'Match request sent from {from_pet.name} to {to_pet.name}!')
             return redirect('pet_detail', pk=to_pet.pk)
     else:
         form = MatchRequestForm()
@@ -225,18 +385,53 @@ def send_match_request(request, pet_pk):
     return render(request, 'pets/send_match_request.html', context)
 
 
+INBOX_BOXES = {'received': 'to_pet__owner', 'sent': 'from_pet__owner'}
+# Cancelled requests stay visible to both sides, so a withdrawn request
+# doesn't just vanish from the receiver's inbox
+INBOX_STATUSES = ('PENDING', 'ACCEPTED', 'REJECTED', 'CANCELLED')
+
+
 @login_required
 def my_matches(request):
-    """View all match requests sent and received"""
-    # Matches received by user's pets
-    received_matches = Match.objects.filter(to_pet__owner=request.user).select_related('from_pet', 'to_pet')
-
-    # Matches sent by user's pets
-    sent_matches = Match.objects.filter(from_pet__owner=request.user).select_related('from_pet', 'to_pet')
+    """Paginated match inbox: received or sent requests, one status per tab"""
+    box = request.GET.get('box') if request.GET.get('box') in INBOX_BOXES else 'received'
+    status = request.GET.get('status') if request.GET.get('status') in INBOX_STATUSES else 'PENDING'
+
+    matches = Match.objects.filter(**{INBOX_BOXES[box]: request.user}, status=status).select_related(
+        'from_pet__owner__owner_profile', 'to_pet__owner__owner_profile',
+    )
+
+    paginator = KeysetPaginator(matches, page_size=request.GET.get('page_size'))
+    try:
+        page = paginator.page(request.GET.get('after'))
+    except InvalidCursor:
+        page = paginator.page()
+
+    next_query = None
+    if page.has_next:
+        query = request.GET.copy()
+        query['after'] = page.next_cursor
+        next_query = query.urlencode()
+
+    # Tab counts come from the counter table, not COUNT(*) over pets_match
+    counts = get_match_counts(request.user)
+    tabs = [
+        (value, label, counts[box.upper()][value])
+        for value, label in Match.STATUS_CHOICES if value in INBOX_STATUSES
+    ]
+
+    boxes = [
+        ('received', 'Received Requests', counts['RECEIVED']['PENDING']),
+        ('sent', 'Sent Requests', counts['SENT']['PENDING']),
+    ]
 
     context = {
-        'received_matches': received_matches,
-        'sent_matches': sent_matches,
+        'matches': page,
+        'box': box,
+        'status': status,
+        'boxes': boxes,
+        'tabs': tabs,
+        'next_query': next_query,
     }
     return render(request, 'pets/my_matches.html', context)
 
@@ -258,6 +453,87 @@ def respond_to_match(request, match_pk, action):
     return redirect('my_matches')
 
 
+# action -> (new status, whose pending matches it may touch)
+BULK_ACTIONS = {
+    'accept': ('ACCEPTED', 'to_pet__owner'),
+    'reject': ('REJECTED', 'to_pet__owner'),
+    'cancel': ('CANCELLED', 'from_pet__owner'),
+}
+
+
+@login_required
+@require_POST
+def bulk_respond_to_matches(request):
+    """
+    Apply accept/reject/cancel to many pending matches in one transaction.
+
+    Takes either ``ids`` (repeated) or ``older_than_days`` and returns the
+    rows that actually changed as JSON.
+    """
+    action = request.POST.get('action')
+    if action not in BULK_ACTIONS:
+        return JsonResponse({'error': 'Unknown action.'}, status=400)
+    new_status, owner = BULK_ACTIONS[action]
+
+    # Ownership is part of the filter, so foreign ids are silently skipped
+    matches = Match.objects.filter(**{owner: request.user}, status='PENDING')
+    try:
+        ids = [int(pk) for pk in request.POST.getlist('ids')]
+        days = int(request.POST['older_than_days']) if request.POST.get('older_than_days') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid match ids or day count.'}, status=400)
+    if ids:
+        matches = matches.filter(pk__in=ids)
+    elif days is not None:
+        matches = matches.filter(created_at__lt=timezone.now() - timedelta(days=days))
+    else:
+        return JsonResponse({'error': 'Pass ids or older_than_days.'}, status=400)
+
+    with transaction.atomic():
+        # A model queryset, not values_list(): OF needs the model's klass_info,
+        # without it PostgreSQL would also lock the joined pets and users
+        locked = (matches.select_for_update(of=('self',)).select_related('from_pet', 'to_pet')
+                  .only('from_pet__owner', 'to_pet__owner'))
+        rows = [(match.pk, match.from_pet.owner_id, match.to_pet.owner_id) for match in locked]
+        changed = [pk for pk, _, _ in rows]
+        Match.objects.filter(pk__in=changed).update(status=new_status, updated_at=timezone.now())
+        # update() skips the Match signals, so move the counters here
+        track_many([(sender, receiver) for _, sender, receiver in rows], 'PENDING', new_status)
+        notify_bulk(rows, 'PENDING', new_status)
+
+    return JsonResponse({'changed': [{'id': pk, 'status': new_status} for pk in changed]})
+
+
+async def event_stream(request):
+    """Server-sent events for the signed-in owner; needs the ASGI entry point"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    if 'wsgi.version' in request.META:
+        # A WSGI worker would be pinned for the life of the stream; 204 tells
+        # EventSource to stop reconnecting and the page keeps working without it
+        return HttpResponse(status=204)
+
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+
+    async def stream():
+        with get_broker().subscribe(user.pk) as queue:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def toggle_favorite(request, pet_pk):
     """Add or remove pet from favorites"""
@@ -280,5 +556,6 @@ def favorites(request):
 
     context = {
         'favorites': favorite_pets,
+        'favorite_pets': [favorite.pet for favorite in favorite_pets],
     }
     return render(request, 'pets/favorites.html', context)
@@ -1,11 +1,15 @@
 """
 Admin utility views for initial setup
 """
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.core.management import call_command
+from django.core.cache import cache
+from pets import result_cache
 from pets.models import Pet, User
 import io
+import os
 import sys
 
 
@@ -92,3 +96,14 @@ def setup_initial_data(request):
         output.write(f"\n\n❌ ERROR: {str(e)}\n")
         output.write("\n</pre></body></html>")
         return HttpResponse(output.getvalue(), status=500)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def cache_stats(request):
+    """This worker's hit/miss counters: search result pages, and the cache per key prefix"""
+    report = getattr(cache, 'stats', None)
+    return JsonResponse({
+        'search_results': result_cache.stats(),
+        'worker': {'pid': os.getpid(), 'prefixes': report() if report else None},
+    })